@@ -7,8 +7,12 @@ import requests
 from PIL import Image
 from io import BytesIO
 import re
+import time
 
-# Try to import OpenCC for traditional->simplified conversion if available
+import llm_client
+import zh_convert
+
+# Optional OpenCC for traditional->simplified conversion (ZH_CONVERTER=opencc); zh_convert is the default
 try:
     from opencc import OpenCC
     _opencc = OpenCC('t2s')
@@ -46,6 +50,42 @@ def clean_think_tags(text):
     
     return text.strip()
 
+def strip_think_partial(text):
+    """流式输出过程中去掉思考内容，返回目前可以展示的部分
+
+    与 clean_think_tags 不同，这里的输入可能停在任意位置：尚未闭合的 <think> 之后的内容、
+    以及末尾可能是标签开头的残片（如 "<thi"）都先不展示。单独出现的 </think> 说明之前的
+    全部是思考过程（部分模型的模板把 <think> 放在提示词里）。
+    """
+    text = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL | re.IGNORECASE)
+    end = text.lower().rfind('</think>')
+    if end != -1:
+        text = text[end + len('</think>'):]
+    start = re.search(r'<think', text, flags=re.IGNORECASE)
+    if start:
+        text = text[:start.start()]
+    lower = text.lower()
+    partial = max((size for tag in ('<think>', '</think>') for size in range(1, len(tag))
+                   if lower.endswith(tag[:size])), default=0)
+    return text[:len(text) - partial].lstrip()
+
+
+class ThinkTagStripper:
+    """逐段喂入流式输出，可见文本变化时返回新的可见全文，否则返回 None"""
+
+    def __init__(self):
+        self.raw = ''
+        self.visible = ''
+
+    def feed(self, delta):
+        self.raw += delta
+        visible = strip_think_partial(self.raw)
+        if visible == self.visible:
+            return None
+        self.visible = visible
+        return visible
+
+
 def check_story_similarity(title, content, category, limit=10):
     """
     检查新生成的故事是否与最近的故事太相似（避免重复和金鱼街过多）
@@ -337,50 +377,140 @@ def motifs_for(category_key):
     return mapping.get(category_key, [])
 
 
+# Target languages the translate prompts support: code -> (name used in Chinese prompts, English name)
+TRANSLATION_TARGETS = {
+    'en': ('英文', 'English'),
+    'ja': ('日文', 'Japanese'),
+    'ko': ('韩文', 'Korean'),
+    'fr': ('法文', 'French'),
+    'de': ('德文', 'German'),
+    'es': ('西班牙文', 'Spanish'),
+}
+
+# 翻译模型的上下文窗口（token）。批量打包的字数上限和 max_tokens 都由它推出，
+# 保证「提示 + 原文 + 译文」放得进窗口；托管 API 另有单次输出上限 TRANSLATION_MAX_OUTPUT_TOKENS
+TRANSLATION_CONTEXT_TOKENS = int(os.getenv('TRANSLATION_CONTEXT_TOKENS', 8192))
+TRANSLATION_MAX_OUTPUT_TOKENS = int(os.getenv('TRANSLATION_MAX_OUTPUT_TOKENS', 4096))
+# 系统提示、批量说明和对话模板的估计开销
+TRANSLATION_PROMPT_TOKENS = 300
+# 中文原文约 1 token/字；译文按 1.5 token/原文字估计（含余量）
+TRANSLATION_INPUT_TOKENS_PER_CHAR = 1.0
+TRANSLATION_OUTPUT_TOKENS_PER_CHAR = 1.5
+
+
+def translation_max_chars():
+    """Longest source (in characters, batch markers included) whose prompt and translation fit
+    both the context window and the output cap."""
+    by_context = (TRANSLATION_CONTEXT_TOKENS - TRANSLATION_PROMPT_TOKENS) / (
+        TRANSLATION_INPUT_TOKENS_PER_CHAR + TRANSLATION_OUTPUT_TOKENS_PER_CHAR)
+    by_output = TRANSLATION_MAX_OUTPUT_TOKENS / TRANSLATION_OUTPUT_TOKENS_PER_CHAR
+    return max(1, int(min(by_context, by_output)))
+
+
+def translation_max_tokens(chars):
+    """max_tokens for translating `chars` source characters: the expected translation plus headroom,
+    capped by what the prompt leaves of the context window and by the output cap."""
+    wanted = int(chars * TRANSLATION_OUTPUT_TOKENS_PER_CHAR) + 200
+    left = TRANSLATION_CONTEXT_TOKENS - TRANSLATION_PROMPT_TOKENS - int(chars * TRANSLATION_INPUT_TOKENS_PER_CHAR)
+    return max(1, min(wanted, left, TRANSLATION_MAX_OUTPUT_TOKENS))
+
+
+# 未设置 LM_STUDIO_MODEL 时从 /v1/models 解析的模型 id，按 URL 缓存：{url: (模型 id 或 None, 过期时刻)}
+LM_STUDIO_MODEL_CACHE_SECONDS = float(os.getenv('LM_STUDIO_MODEL_CACHE_SECONDS', 300))
+_resolved_lm_studio_models = {}
+
+
+def resolve_lm_studio_model(url=None):
+    """Model id to send with LM Studio translations: LM_STUDIO_MODEL, else the first model listed by /v1/models.
+
+    The resolved id is cached per URL (a failed lookup for at most 30 seconds) because translation_models()
+    runs on every translate request. Returns None when LM_STUDIO_URL is unset or no model can be resolved.
+    """
+    url = (url or os.getenv('LM_STUDIO_URL', '')).rstrip('/')
+    if not url:
+        return None
+    configured = os.getenv('LM_STUDIO_MODEL')
+    if configured:
+        return configured
+
+    now = time.monotonic()
+    cached = _resolved_lm_studio_models.get(url)
+    if cached and cached[1] > now:
+        return cached[0]
+    try:
+        models = llm_client.list_models(url)
+    except llm_client.LLMError as e:
+        print(f"[translate_text] LM_STUDIO_MODEL is not set and {url}/models failed: {e}")
+        models = []
+    model = models[0] if models else None
+    if model:
+        print(f"[translate_text] LM_STUDIO_MODEL is not set; translating with {model} (first of {url}/models)")
+    else:
+        print(f"[translate_text] LM_STUDIO_MODEL is not set and no model could be resolved; "
+              f"LM Studio translation is disabled until LM_STUDIO_MODEL is set")
+    ttl = LM_STUDIO_MODEL_CACHE_SECONDS if model else min(LM_STUDIO_MODEL_CACHE_SECONDS, 30)
+    _resolved_lm_studio_models[url] = (model, now + ttl)
+    return model
+
+
+def translation_models():
+    """Model ids translate_text would try, in order (used as part of the translation cache key)."""
+    models = []
+    lm_studio_model = resolve_lm_studio_model()
+    if lm_studio_model:
+        models.append(f"lm-studio:{lm_studio_model}")
+    if openai_client:
+        models.append(f"openai:{os.getenv('AI_MODEL', 'gpt-3.5-turbo')}")
+    if anthropic_client:
+        models.append(f"anthropic:{os.getenv('AI_MODEL', 'claude-2')}")
+    return models
+
+
 def translate_text(text, target='en'):
     """Translate text to target language using available AI client (OpenAI/Anthropic).
 
     Returns translated string or None if no translation service is available.
     """
+    return translate_text_with_model(text, target)[0]
+
+
+def translate_text_with_model(text, target='en', instructions='', max_tokens=None):
+    """Like translate_text, but returns (translated, model_id); model_id is None when nothing answered.
+
+    instructions is appended to the prompt (used by translate_batch_with_model).
+    max_tokens defaults to translation_max_tokens(len(text)); texts longer than
+    translation_max_chars() should be split by the caller (translation_cache does).
+    target must be a key of TRANSLATION_TARGETS; anything else returns (None, None).
+    """
     if not text:
-        return ''
-    # Try LM Studio local server first (useful when using qwen2.5-7b-instruct-1m)
+        return '', None
+    if target not in TRANSLATION_TARGETS:
+        print(f"[translate_text] unsupported target language: {target!r}")
+        return None, None
+    language, language_en = TRANSLATION_TARGETS[target]
+    if max_tokens is None:
+        max_tokens = translation_max_tokens(len(text))
+    # Try LM Studio local server first (useful when using qwen2.5-7b-instruct-1m).
+    # The model is sent explicitly so the cache key names the model that actually translated;
+    # without LM_STUDIO_MODEL it is resolved from /v1/models (see resolve_lm_studio_model).
     lm_studio_url = os.getenv('LM_STUDIO_URL', '').rstrip('/')
-    use_lm_studio = bool(lm_studio_url)
+    lm_studio_model = resolve_lm_studio_model(lm_studio_url) if lm_studio_url else None
 
-    if use_lm_studio:
+    if lm_studio_model:
         try:
-            import subprocess, json
-            chat_url = f"{lm_studio_url}/v1/chat/completions"
-            system = """你是翻译助手。将下面的中文贴文翻译成英文，保持原文的口吻与长度（若为第一人称求助贴，请保留求助语气）。只返回翻译内容，不要额外说明。"""
+            system = f"""你是翻译助手。将下面的中文贴文翻译成{language}，保持原文的口吻与长度（若为第一人称求助贴，请保留求助语气）。只返回翻译内容，不要额外说明。""" + instructions
             user_prompt = f"{text}"
 
-            request_data = {
-                "messages": [
+            translated = llm_client.chat(
+                [
                     {"role": "system", "content": system},
                     {"role": "user", "content": user_prompt}
                 ],
-                "temperature": 0.1,
-                "max_tokens": 800
-            }
-
-            curl_cmd = [
-                'curl', '-s', '-X', 'POST', chat_url,
-                '-H', 'Content-Type: application/json',
-                '-d', json.dumps(request_data, ensure_ascii=False),
-                '--max-time', '60'
-            ]
-
-            proc = subprocess.run(curl_cmd, capture_output=True, text=True, timeout=65)
-            if proc.returncode == 0 and proc.stdout:
-                try:
-                    resp = json.loads(proc.stdout)
-                    translated = resp['choices'][0]['message']['content']
-                    return translated.strip()
-                except Exception as e:
-                    print(f"[translate_text] LM Studio parse failed: {e}")
-            else:
-                print(f"[translate_text] LM Studio request failed: {proc.stderr}")
+                temperature=0.1, max_tokens=max_tokens, timeout=60, url=lm_studio_url, model=lm_studio_model
+            )
+            return translated.strip(), f"lm-studio:{lm_studio_model}"
+        except llm_client.LLMError as e:
+            print(f"[translate_text] LM Studio request failed: {e}")
         except Exception as e:
             print(f"[translate_text] LM Studio translation error: {e}")
 
@@ -388,37 +518,72 @@ def translate_text(text, target='en'):
     try:
         if openai_client:
             model = os.getenv('AI_MODEL', 'gpt-3.5-turbo')
-            prompt = f"请将以下中文文本翻译成{ '英语' if target.startswith('en') else target }，保持语气和长度，返回纯翻译，不要多余说明：\n\n{text}"
+            prompt = f"请将以下中文文本翻译成{language}，保持语气和长度，返回纯翻译，不要多余说明{instructions}：\n\n{text}"
             resp = openai_client.chat.completions.create(
                 model=model,
                 messages=[
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.2,
-                max_tokens=800
+                max_tokens=max_tokens
             )
             result = resp.choices[0].message.content
-            return result.strip()
+            return result.strip(), f"openai:{model}"
 
         if anthropic_client:
             model = os.getenv('AI_MODEL', 'claude-2')
-            prompt = f"Translate the following Chinese text to English, preserve tone and brevity:\n\n{text}"
+            prompt = f"Translate the following Chinese text to {language_en}, preserve tone and brevity{instructions}:\n\n{text}"
             resp = anthropic_client.messages.create(
                 model=model,
                 messages=[{"role": "user", "content": prompt}],
-                max_tokens=800
+                max_tokens=max_tokens
             )
             if hasattr(resp, 'content'):
                 try:
-                    return resp.content[0].text.strip()
+                    return resp.content[0].text.strip(), f"anthropic:{model}"
                 except Exception:
-                    return None
+                    return None, None
     except Exception as e:
         print(f"[translate_text] translation failed: {e}")
 
-    return None
+    return None, None
+
+
+BATCH_SEGMENT_RE = re.compile(r'(?:<<<|《《《)\s*(\d+)\s*(?:>>>|》》》)')
 
 
+def split_translation_batch(reply, count):
+    """Split a batched reply on its <<<n>>> markers; returns the segments in order, or None unless
+    markers 1..count each appear exactly once (text before the first marker is ignored)."""
+    if not reply:
+        return None
+    pieces = BATCH_SEGMENT_RE.split(reply)
+    segments = {}
+    for number, body in zip(pieces[1::2], pieces[2::2]):
+        index = int(number)
+        if index in segments or not 1 <= index <= count:
+            return None
+        segments[index] = body.strip()
+    if len(segments) != count:
+        return None
+    return [segments[i] for i in range(1, count + 1)]
+
+
+def translate_batch_with_model(texts, target='en'):
+    """Translate several texts in one model call; returns (translations in input order, model_id).
+
+    Each text is sent as a segment headed by a <<<n>>> marker line. Returns (None, model_id) when
+    the reply cannot be split back into len(texts) segments, (None, None) when nothing answered.
+    """
+    payload = '\n'.join(f'<<<{i}>>>\n{text}' for i, text in enumerate(texts, 1))
+    instructions = (f"\n下面共有 {len(texts)} 段，每段以 <<<编号>>> 单独一行开头；"
+                    f"按同样格式逐段翻译，保留每个 <<<编号>>> 标记，不要合并或省略任何一段")
+    translated, model = translate_text_with_model(payload, target, instructions=instructions,
+                                                  max_tokens=translation_max_tokens(len(payload)))
+    if translated is None:
+        return None, None
+    return split_translation_batch(translated, len(texts)), model
+
 def add_title_tag(title, story_age_days=0):
     """Add appropriate tag to story title based on story age
     
@@ -446,54 +611,22 @@ def add_title_tag(title, story_age_days=0):
     return f"{tag}{title}"
 
 def convert_to_simplified(text):
-    """Convert text to Simplified Chinese if possible.
+    """Convert text to Simplified Chinese.
 
-    Tries OpenCC first; if not available and LM Studio is configured,
-    falls back to a lightweight LM Studio call to convert to 简体中文.
-    If neither available, returns original text.
+    Uses the built-in table converter (zh_convert) by default: a pure string
+    pass, no model round-trip. Set ZH_CONVERTER=opencc to use OpenCC instead
+    when it is installed.
     """
     if not text:
         return text
 
-    # Use OpenCC if available
-    if _opencc:
+    if _opencc and os.getenv('ZH_CONVERTER', 'builtin').lower() == 'opencc':
         try:
             return _opencc.convert(text)
         except Exception:
             pass
 
-    # Fallback: use LM Studio to convert to 简体中文 if configured
-    lm_studio_url = os.getenv('LM_STUDIO_URL', '').rstrip('/')
-    if lm_studio_url:
-        try:
-            import subprocess, json
-            system = """你是一个简体中文转换助手。请将下面的文本转换为简体中文，保持原文口吻与句意，不要添加说明，只返回转换后的文本。"""
-            request_data = {
-                "messages": [
-                    {"role": "system", "content": system},
-                    {"role": "user", "content": text}
-                ],
-                "temperature": 0.0,
-                "max_tokens": 1200
-            }
-            chat_url = f"{lm_studio_url}/v1/chat/completions"
-            curl_cmd = [
-                'curl', '-s', '-X', 'POST', chat_url,
-                '-H', 'Content-Type: application/json',
-                '-d', json.dumps(request_data, ensure_ascii=False),
-                '--max-time', '30'
-            ]
-            proc = subprocess.run(curl_cmd, capture_output=True, text=True, timeout=35)
-            if proc.returncode == 0 and proc.stdout:
-                try:
-                    resp = json.loads(proc.stdout)
-                    return resp['choices'][0]['message']['content'].strip()
-                except Exception:
-                    pass
-        except Exception:
-            pass
-
-    return text
+    return zh_convert.to_simplified(text)
 
 
 def filter_dialogue_and_horror(text):
@@ -684,40 +817,22 @@ def expand_story_for_category(text, category, min_chars=350):
 
     if use_lm:
         try:
-            import subprocess, json
-            chat_url = f"{lm_studio_url}/v1/chat/completions"
-            request_data = {
-                "messages": [
+            expanded = llm_client.chat(
+                [
                     {"role": "system", "content": prompt_system},
                     {"role": "user", "content": prompt_user}
                 ],
-                "temperature": 0.85,
-                "max_tokens": 600
-            }
-
-            curl_cmd = [
-                'curl', '-s', '-X', 'POST', chat_url,
-                '-H', 'Content-Type: application/json',
-                '-d', json.dumps(request_data, ensure_ascii=False),
-                '--max-time', '90'
-            ]
-
-            proc = subprocess.run(curl_cmd, capture_output=True, text=True, timeout=95)
-            if proc.returncode == 0 and proc.stdout:
-                try:
-                    resp = json.loads(proc.stdout)
-                    expanded = resp['choices'][0]['message']['content'].strip()
-                    # Clean up any think-tags or unwanted markers
-                    expanded = clean_think_tags(expanded)
-                    # Ensure no quoted dialogue remains
-                    expanded = post_process_story_text(expanded)
-                    if len(expanded) >= min_chars:
-                        return expanded
-                    else:
-                        # If LM returned shorter text, fall through to deterministic expansion
-                        text = expanded
-                except Exception:
-                    pass
+                temperature=0.85, max_tokens=600, timeout=90, url=lm_studio_url
+            ).strip()
+            # Clean up any think-tags or unwanted markers
+            expanded = clean_think_tags(expanded)
+            # Ensure no quoted dialogue remains
+            expanded = post_process_story_text(expanded)
+            if len(expanded) >= min_chars:
+                return expanded
+            else:
+                # If LM returned shorter text, fall through to deterministic expansion
+                text = expanded
         except Exception:
             pass
 
@@ -786,41 +901,14 @@ def generate_ai_story(category=None, location=None, persona=None):
         if use_lm_studio:
             try:
                 print(f"[generate_ai_story] 使用 LM Studio 生成故事...")
-                import subprocess
-                import json
-                
-                # 使用 curl 调用 LM Studio（Python HTTP 库与 LM Studio 有兼容性问题）
-                chat_url = f"{lm_studio_url.rstrip('/v1')}/v1/chat/completions"
-                
-                request_data = {
-                    "messages": [
+                content_raw = llm_client.chat(
+                    [
                         {"role": "system", "content": prompt_data['system']},
                         {"role": "user", "content": prompt_data['prompt']}
                     ],
-                    "temperature": 0.9,
-                    "max_tokens": 800
-                }
-                
-                curl_command = [
-                    'curl', '-s', '-X', 'POST', chat_url,
-                    '-H', 'Content-Type: application/json',
-                    '-d', json.dumps(request_data, ensure_ascii=False),
-                    '--max-time', '120'
-                ]
-                
-                result = subprocess.run(
-                    curl_command,
-                    capture_output=True,
-                    text=True,
-                    timeout=120
+                    temperature=0.9, max_tokens=800, timeout=120, url=lm_studio_url
                 )
                 
-                if result.returncode != 0:
-                    raise Exception(f"curl 命令失败: {result.stderr}")
-                
-                response_data = json.loads(result.stdout)
-                content_raw = response_data['choices'][0]['message']['content']
-                
                 print(f"[generate_ai_story] 原始内容长度: {len(content_raw)} 字符")
                 
                 # 过滤 qwen 模型的 <think> 标签
@@ -845,34 +933,13 @@ def generate_ai_story(category=None, location=None, persona=None):
                 # 生成标题（使用更直接的提示词避免思考过程）
                 title_prompt = f"故事：{content[:150]}\n\n请为上面的故事起一个5-10字的标题："
                 
-                title_request = {
-                    "messages": [
+                title_raw = llm_client.chat(
+                    [
                         {"role": "system", "content": "你是标题生成器。用户给你故事，你只需要输出一个简短的标题，不要有任何其他内容。"},
                         {"role": "user", "content": title_prompt}
                     ],
-                    "temperature": 0.5,
-                    "max_tokens": 20
-                }
-                
-                title_curl_command = [
-                    'curl', '-s', '-X', 'POST', chat_url,
-                    '-H', 'Content-Type: application/json',
-                    '-d', json.dumps(title_request, ensure_ascii=False),
-                    '--max-time', '60'
-                ]
-                
-                title_result = subprocess.run(
-                    title_curl_command,
-                    capture_output=True,
-                    text=True,
-                    timeout=60
-                )
-                
-                if title_result.returncode != 0:
-                    raise Exception(f"标题生成失败: {title_result.stderr}")
-                
-                title_response_data = json.loads(title_result.stdout)
-                title_raw = title_response_data['choices'][0]['message']['content'].strip()
+                    temperature=0.5, max_tokens=20, timeout=60, url=lm_studio_url
+                ).strip()
                 
                 # 使用统一的清理函数
                 title = clean_think_tags(title_raw)
@@ -906,7 +973,10 @@ def generate_ai_story(category=None, location=None, persona=None):
                 print(f"[generate_ai_story] ❌ LM Studio 失败: {type(e).__name__}: {e}")
                 
                 # 特殊处理 503 错误
-                if "503" in error_message or "InternalServerError" in str(type(e).__name__):
+                if isinstance(e, llm_client.LLMBusy):
+                    # 排队已满/超时：请求没有发给模型，直接走回退
+                    pass
+                elif "503" in error_message or "InternalServerError" in str(type(e).__name__):
                     print("[generate_ai_story] ⚠️ 检测到 503 错误 - 可能的原因:")
                     print("   1. LM Studio 模型未完全加载")
                     print("   2. 服务器负载过高")
@@ -1554,9 +1624,6 @@ def generate_evidence_image(story_id, story_title, story_content, comment_contex
 def generate_audio_description_with_lm_studio(title, content, comment_context=""):
     """使用 LM Studio 生成丰富的音频场景描述，增加多样性"""
     try:
-        import subprocess
-        import json
-        
         lm_studio_url = os.getenv('LM_STUDIO_URL', 'http://localhost:1234/v1')
         
         # 构造 prompt，让 AI 根据故事生成音频场景描述
@@ -1582,36 +1649,20 @@ def generate_audio_description_with_lm_studio(title, content, comment_context=""
 
 请生成这个故事对应的音频场景描述。"""
 
-        # 使用 curl 调用 LM Studio
-        curl_command = [
-            'curl', '-s', f'{lm_studio_url}/chat/completions',
-            '-H', 'Content-Type: application/json',
-            '-d', json.dumps({
-                'model': 'qwen2.5-7b-instruct-1m',
-                'messages': [
+        try:
+            audio_description = llm_client.chat(
+                [
                     {'role': 'system', 'content': system_prompt},
                     {'role': 'user', 'content': user_prompt}
                 ],
-                'temperature': 0.7,
-                'max_tokens': 150,
-                'top_p': 0.9
-            })
-        ]
-        
-        result = subprocess.run(curl_command, capture_output=True, text=True, timeout=10)
-        
-        if result.returncode == 0:
-            try:
-                response_data = json.loads(result.stdout)
-                audio_description = response_data['choices'][0]['message']['content'].strip()
-                print(f"[generate_audio_description] ✅ AI 生成音频描述: {audio_description[:60]}...")
-                return audio_description
-            except (json.JSONDecodeError, KeyError, IndexError) as e:
-                print(f"[generate_audio_description] JSON 解析失败: {e}")
-                return None
-        else:
-            print(f"[generate_audio_description] curl 调用失败: {result.stderr}")
+                temperature=0.7, max_tokens=150, timeout=10, url=lm_studio_url,
+                model='qwen2.5-7b-instruct-1m', top_p=0.9
+            ).strip()
+        except llm_client.LLMError as e:
+            print(f"[generate_audio_description] LM Studio 调用失败: {e}")
             return None
+        print(f"[generate_audio_description] ✅ AI 生成音频描述: {audio_description[:60]}...")
+        return audio_description
             
     except Exception as e:
         print(f"[generate_audio_description] 错误: {e}")
@@ -1941,8 +1992,12 @@ def generate_evidence_audio(text_content, story_context=""):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         return f"/generated/audio_placeholder_{timestamp}.mp3"
 
-def generate_ai_response(story, user_comment, previous_ai_responses=None):
-    """Generate AI chatbot response to user comment"""
+def generate_ai_response(story, user_comment, previous_ai_responses=None, on_partial=None):
+    """Generate AI chatbot response to user comment
+
+    on_partial: 传入时以流式方式调用 LM Studio，每收到一段输出就以「去掉 <think> 后目前可见的全文」回调；
+    返回值仍是经过完整清理的最终回复。
+    """
     
     # Check if LM Studio local server is configured
     lm_studio_url = os.getenv('LM_STUDIO_URL', 'http://localhost:1234/v1')
@@ -1951,10 +2006,6 @@ def generate_ai_response(story, user_comment, previous_ai_responses=None):
     if use_lm_studio:
         print(f"[generate_ai_response] 使用 LM Studio 本地服务器: {lm_studio_url}")
         try:
-            # 使用 subprocess 调用 curl（因为 Python HTTP 库与 LM Studio 有兼容性问题）
-            import subprocess
-            import json
-            
             # 构建历史对话上下文
             history_context = ""
             if previous_ai_responses:
@@ -2014,41 +2065,25 @@ def generate_ai_response(story, user_comment, previous_ai_responses=None):
 
 请以楼主身份回复这条评论。直接给出回复内容，不要包含任何思考过程或分析。"""
 
-            # 使用 curl 调用 LM Studio（Python HTTP 库与 LM Studio 有兼容性问题）
-            # 构建请求数据
-            request_data = {
-                "messages": [
+            on_delta = None
+            if on_partial:
+                stripper = ThinkTagStripper()
+
+                def on_delta(delta):
+                    visible = stripper.feed(delta)
+                    if visible is not None:
+                        on_partial(visible)
+
+            # 流式调用时 timeout 是两段输出之间的最长等待
+            ai_reply = llm_client.chat(
+                [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
-                "temperature": 0.6,  # 降低温度以提高一致性（原0.8）
-                "max_tokens": 200
-            }
-            
-            # 使用 curl 发送请求
-            chat_url = f"{lm_studio_url.rstrip('/v1')}/v1/chat/completions"
-            print(f"[generate_ai_response] 使用 curl 调用: {chat_url}")
-            
-            curl_command = [
-                'curl', '-s', '-X', 'POST', chat_url,
-                '-H', 'Content-Type: application/json',
-                '-d', json.dumps(request_data, ensure_ascii=False),
-                '--max-time', '120'
-            ]
-            
-            result = subprocess.run(
-                curl_command,
-                capture_output=True,
-                text=True,
-                timeout=120
-            )
-            
-            if result.returncode != 0:
-                raise Exception(f"curl 命令失败: {result.stderr}")
-            
-            # 解析响应
-            response_data = json.loads(result.stdout)
-            ai_reply = response_data['choices'][0]['message']['content'].strip()
+                temperature=0.6,  # 降低温度以提高一致性（原0.8）
+                max_tokens=200, timeout=120 if on_delta is None else 30, url=lm_studio_url,
+                on_delta=on_delta
+            ).strip()
             
             print(f"[generate_ai_response] LM Studio 原始回复 (前100字): {ai_reply[:100]}...")
             
@@ -2144,7 +2179,10 @@ def generate_ai_response(story, user_comment, previous_ai_responses=None):
             print(f"[generate_ai_response] ❌ LM Studio 调用失败: {type(e).__name__}: {e}")
             
             # 特殊处理 503 错误
-            if "503" in error_message or "InternalServerError" in str(type(e).__name__):
+            if isinstance(e, llm_client.LLMBusy):
+                # 排队已满/超时：请求没有发给模型，直接走回退
+                pass
+            elif "503" in error_message or "InternalServerError" in str(type(e).__name__):
                 print("[generate_ai_response] ⚠️ 检测到 503 错误 - 可能的原因:")
                 print("   1. LM Studio 模型未完全加载")
                 print("   2. 服务器负载过高")
@@ -2255,10 +2293,11 @@ def generate_ai_response(story, user_comment, previous_ai_responses=None):
 def should_generate_new_story():
     """Determine if it's time to generate a new story"""
     from app import Story, db
+    from story_engine import active_state_filter
     
     # Check active stories count
     active_stories = Story.query.filter(
-        Story.current_state != 'ended'
+        active_state_filter(Story.current_state)
     ).count()
     
     max_active = int(os.getenv('MAX_ACTIVE_STORIES', 5))
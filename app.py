@@ -1,6 +1,7 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, jsonify, request, send_from_directory, Response
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -10,7 +11,21 @@ import json
 import threading
 import time
 import random
+import math
 from dotenv import load_dotenv
+import search_index
+import migrations
+import sqlite_profile
+import archive
+import llm_client
+import translation_cache
+from write_behind import CounterBuffer
+from data_version import DataVersion
+from response_cache import ResponseCache
+from event_bus import EventBus, format_sse
+from reply_stream import ReplyStreamRegistry, DONE, FAILED
+from jobs import JobQueue
+from concurrent.futures import ThreadPoolExecutor
 
 load_dotenv()
 
@@ -18,6 +33,9 @@ app = Flask(__name__, static_folder='static', static_url_path='')
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-horror')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///ai_urban_legends.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# SQLite 并发配置（WAL、busy_timeout、连接池），见 sqlite_profile.py
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_profile.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+sqlite_profile.install()
 
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 db = SQLAlchemy(app)
@@ -41,12 +59,33 @@ class Story(db.Model):
     is_ai_generated = db.Column(db.Boolean, default=False)
     ai_persona = db.Column(db.String(100))
     current_state = db.Column(db.String(50), default='init')
-    state_data = db.Column(db.Text)
+    state_data = db.Column(db.Text)  # 旧版状态机 JSON；状态机热字段已拆到下面的列
+    # 状态机（story_engine.py）：定时任务按 next_transition_time / user_interaction_count 直接筛选
+    next_transition_time = db.Column(db.DateTime)
+    user_interaction_count = db.Column(db.Integer, default=0)
+    evidence_generated = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     views = db.Column(db.Integer, default=0)
+    # 冗余计数列：由写入评论/证据的同一事务维护，列表页无需再加载整个关系
+    comments_count = db.Column(db.Integer, default=0)
+    user_comments_count = db.Column(db.Integer, default=0)  # 非AI回复的评论数（证据生成阈值使用）
+    evidence_count = db.Column(db.Integer, default=0)
     comments = db.relationship('Comment', backref='story', lazy=True, cascade='all, delete-orphan')
     evidence = db.relationship('Evidence', backref='story', lazy=True, cascade='all, delete-orphan')
+    state_events = db.relationship('StoryStateEvent', backref='story', lazy=True, cascade='all, delete-orphan',
+                                   order_by='StoryStateEvent.id')
+    # 索引由 migrations/ 中的版本化迁移为已有数据库补建，新增索引时两边同步修改
+    __table_args__ = (
+        # 故事列表按 (created_at, id) 倒序分页，游标分页直接走该索引
+        db.Index('ix_story_created_at_id', 'created_at', 'id'),
+        db.Index('ix_story_current_state', 'current_state'),
+        # 状态推进任务：next_transition_time <= now OR user_interaction_count >= 阈值（两段索引查找）
+        db.Index('ix_story_next_transition_time', 'next_transition_time'),
+        db.Index('ix_story_user_interaction_count', 'user_interaction_count'),
+        # 归档按原 id 复制行：id 不能在删除后复用（迁移 0008 重建已有表）
+        {'sqlite_autoincrement': True},
+    )
     
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -59,6 +98,17 @@ class Comment(db.Model):
     
     # 关系
     parent = db.relationship('Comment', remote_side=[id], backref='replies')
+    __table_args__ = (
+        # 按故事取评论（索引隐含 rowid，顶级评论按 id 翻页无需排序）
+        db.Index('ix_comment_story_id', 'story_id'),
+        # 用户评论/AI回复分开统计和查询
+        db.Index('ix_comment_story_ai', 'story_id', 'is_ai_response'),
+        # 评论分页时用递归查询展开回复树，按 parent_id 查子回复
+        db.Index('ix_comment_parent_id', 'parent_id'),
+        # 个人资料统计重算时按作者计数
+        db.Index('ix_comment_author_id', 'author_id'),
+        {'sqlite_autoincrement': True},
+    )
     
 class Evidence(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -68,12 +118,28 @@ class Evidence(db.Model):
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (db.Index('ix_evidence_story_type', 'story_id', 'evidence_type'), {'sqlite_autoincrement': True})
+
+class StoryStateEvent(db.Model):
+    """故事状态历史（只追加），取代 state_data 里的 state_history 列表"""
+    id = db.Column(db.Integer, primary_key=True)
+    story_id = db.Column(db.Integer, db.ForeignKey('story.id'), nullable=False)
+    state = db.Column(db.String(50), nullable=False)
+    trigger = db.Column(db.String(50))  # 'story_created', 'time_based', 'interaction_based'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_story_state_event_story_id', 'story_id', 'id'), {'sqlite_autoincrement': True})
+
 class Follow(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     story_id = db.Column(db.Integer, db.ForeignKey('story.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    __table_args__ = (db.UniqueConstraint('user_id', 'story_id', name='_user_story_uc'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'story_id', name='_user_story_uc'),
+        # 通知扇出按故事查关注者，唯一约束以 user_id 开头用不上
+        db.Index('ix_follow_story_id', 'story_id'),
+    )
 
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -86,6 +152,13 @@ class Notification(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # 未读筛选/未读计数走 (user_id, is_read, created_at)；全部通知按时间翻页走 (user_id, created_at)
+    __table_args__ = (
+        db.Index('ix_notification_user_read_created', 'user_id', 'is_read', 'created_at'),
+        db.Index('ix_notification_user_created', 'user_id', 'created_at'),
+        {'sqlite_autoincrement': True},
+    )
+
 class CategoryClick(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -94,6 +167,337 @@ class CategoryClick(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     __table_args__ = (db.UniqueConstraint('user_id', 'category', name='_user_category_uc'),)
 
+class UserStats(db.Model):
+    """个人资料统计（物化）：由评论和分类点击的写入路径增量维护，/api/user-top-categories 按主键读取"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    total_clicks = db.Column(db.Integer, default=0)
+    total_comments = db.Column(db.Integer, default=0)
+    top_categories = db.Column(db.Text)  # JSON: [{"category": ..., "click_count": ...}]，最多 TOP_CATEGORY_LIMIT 个
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class TranslationCache(db.Model):
+    """翻译缓存：以 (原文 sha256, 目标语言, 模型) 为键，按总字节数淘汰最久未使用的条目（见 translation_cache.py）"""
+    __tablename__ = 'translation_cache'
+    text_hash = db.Column(db.String(64), primary_key=True)
+    target = db.Column(db.String(16), primary_key=True)
+    model = db.Column(db.String(100), primary_key=True)
+    translated = db.Column(db.Text, nullable=False)
+    size_bytes = db.Column(db.Integer, default=0)
+    hits = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_translation_cache_last_used_at', 'last_used_at'),)
+
+class DataVersionRow(db.Model):
+    """共享的数据版本号（ETag 和列表缓存用，见 data_version.py），每个名字一行"""
+    __tablename__ = 'data_version'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+
+# 冷数据归档表 archived_*（见 archive.py）
+archive_tables = {
+    table.name: archive.define_archive_table(table, db.metadata)
+    for table in (Story.__table__, Comment.__table__, Evidence.__table__, StoryStateEvent.__table__,
+                  Notification.__table__)
+}
+
+# ============================================
+# 故事计数器维护
+# ============================================
+
+def bump_story_counters(story_id, comments=0, user_comments=0, evidence=0, interactions=0):
+    """在当前事务中原子地累加故事的评论/证据/状态机互动计数
+
+    只发出一条 UPDATE ... RETURNING，随调用方写入评论/证据的 commit 一起提交。
+    返回累加后的计数 {列名: 新值}（故事不存在时为 None）。
+    """
+    values = {}
+    if comments:
+        values['comments_count'] = db.func.coalesce(Story.comments_count, 0) + comments
+    if user_comments:
+        values['user_comments_count'] = db.func.coalesce(Story.user_comments_count, 0) + user_comments
+    if evidence:
+        values['evidence_count'] = db.func.coalesce(Story.evidence_count, 0) + evidence
+    if interactions:
+        values['user_interaction_count'] = db.func.coalesce(Story.user_interaction_count, 0) + interactions
+    if not values:
+        return None
+
+    row = db.session.execute(
+        db.update(Story)
+        .where(Story.id == story_id)
+        .values(**values)
+        .returning(*(getattr(Story, name) for name in values))
+        .execution_options(synchronize_session=False)
+    ).one_or_none()
+    return dict(row._mapping) if row is not None else None
+
+def recount_story_counters(story_ids=None):
+    """按实际行数重算故事计数（一次性修复，或批量删除评论后调用）
+
+    story_ids 为 None 时重算全部故事。调用方负责 commit。
+    """
+    comments_total = db.select(db.func.count(Comment.id))\
+        .where(Comment.story_id == Story.id).scalar_subquery()
+    user_comments_total = db.select(db.func.count(Comment.id))\
+        .where(Comment.story_id == Story.id, Comment.is_ai_response == False).scalar_subquery()
+    evidence_total = db.select(db.func.count(Evidence.id))\
+        .where(Evidence.story_id == Story.id).scalar_subquery()
+
+    stmt = db.update(Story).values(
+        comments_count=comments_total,
+        user_comments_count=user_comments_total,
+        evidence_count=evidence_total
+    )
+    if story_ids is not None:
+        stmt = stmt.where(Story.id.in_(story_ids))
+
+    db.session.execute(stmt.execution_options(synchronize_session=False))
+
+# ============================================
+# 个人资料统计维护
+# ============================================
+
+TOP_CATEGORY_LIMIT = 2
+
+def bump_user_stats(user_id, comments=0):
+    """在当前事务中累加用户的评论数（upsert，随调用方的 commit 一起提交）"""
+    if not user_id or not comments:
+        return
+    stmt = sqlite_insert(UserStats).values(
+        user_id=user_id, total_clicks=0, total_comments=comments, updated_at=datetime.utcnow()
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_={
+            'total_comments': db.func.coalesce(UserStats.total_comments, 0) + stmt.excluded.total_comments,
+            'updated_at': stmt.excluded.updated_at,
+        }
+    )
+    db.session.execute(stmt)
+
+def refresh_user_click_stats(user_ids):
+    """按 category_click 重算这些用户的总点击数和最常点击的分类（调用方负责 commit）
+
+    每个用户只有十来个分类，一次查询取回后在内存里排序即可。
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    rows = db.session.execute(
+        db.select(CategoryClick.user_id, CategoryClick.category, CategoryClick.click_count)
+        .where(CategoryClick.user_id.in_(user_ids))
+    ).all()
+    clicks = {user_id: [] for user_id in user_ids}
+    for user_id, category, click_count in rows:
+        clicks[user_id].append((click_count or 0, category))
+
+    now = datetime.utcnow()
+    values = []
+    for user_id, entries in clicks.items():
+        entries.sort(key=lambda entry: (-entry[0], entry[1]))
+        top = [{'category': category, 'click_count': count} for count, category in entries[:TOP_CATEGORY_LIMIT]]
+        values.append({
+            'user_id': user_id,
+            'total_clicks': sum(count for count, _ in entries),
+            'total_comments': 0,
+            'top_categories': json.dumps(top, ensure_ascii=False),
+            'updated_at': now,
+        })
+
+    stmt = sqlite_insert(UserStats)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_={
+            'total_clicks': stmt.excluded.total_clicks,
+            'top_categories': stmt.excluded.top_categories,
+            'updated_at': stmt.excluded.updated_at,
+        }
+    )
+    db.session.execute(stmt, values)
+
+# 按用户列表重算时每批的用户数，避免 IN 列表和 CASE 分支超出 SQLite 的参数和表达式深度上限
+USER_STATS_CHUNK_SIZE = 500
+
+def recount_user_stats(user_ids=None):
+    """按实际数据重算个人资料统计（批量删除评论后调用）；user_ids 为 None 时重算全部用户。调用方负责 commit
+
+    指定用户时按 USER_STATS_CHUNK_SIZE 分批，评论数用 UPDATE ... CASE 写回；
+    重算全部用户时点击统计按用户 id 分批，评论数用一条关联子查询的 UPDATE 完成。
+    """
+    if user_ids is None:
+        _recount_all_user_stats()
+        return
+    user_ids = list(dict.fromkeys(user_ids))
+    for start in range(0, len(user_ids), USER_STATS_CHUNK_SIZE):
+        chunk = user_ids[start:start + USER_STATS_CHUNK_SIZE]
+        refresh_user_click_stats(chunk)
+        comment_counts = dict(db.session.execute(
+            db.select(Comment.author_id, db.func.count(Comment.id))
+            .where(Comment.author_id.in_(chunk))
+            .group_by(Comment.author_id)
+        ).all())
+        db.session.execute(
+            db.update(UserStats)
+            .where(UserStats.user_id.in_(chunk))
+            .values(total_comments=db.case(comment_counts, value=UserStats.user_id, else_=0) if comment_counts else 0)
+            .execution_options(synchronize_session=False)
+        )
+
+def _recount_all_user_stats():
+    last_id = 0
+    while True:
+        chunk = db.session.execute(
+            db.select(User.id).where(User.id > last_id).order_by(User.id).limit(USER_STATS_CHUNK_SIZE)
+        ).scalars().all()
+        if not chunk:
+            break
+        refresh_user_click_stats(chunk)
+        last_id = chunk[-1]
+    comment_count = db.select(db.func.count(Comment.id))\
+        .where(Comment.author_id == UserStats.user_id)\
+        .correlate(UserStats).scalar_subquery()
+    db.session.execute(
+        db.update(UserStats).values(total_comments=comment_count).execution_options(synchronize_session=False)
+    )
+
+# ============================================
+# 批量删除故事
+# ============================================
+
+def delete_stories_where(*criteria):
+    """删除满足条件的故事及其评论、证据、状态历史、关注和相关通知，返回删除的故事数
+
+    全部是集合操作（DELETE ... WHERE story_id IN (SELECT ...)），不把故事逐条加载进会话；
+    Query.delete 不走 ORM 级联，所以子表要显式删除。调用方负责 commit。
+    """
+    story_ids = db.select(Story.id).where(*criteria)
+    comment_ids = db.select(Comment.id).where(Comment.story_id.in_(story_ids))
+    affected_authors = db.session.execute(
+        db.select(Comment.author_id).distinct()
+        .where(Comment.story_id.in_(story_ids), Comment.author_id.isnot(None))
+    ).scalars().all()
+
+    for stmt in (
+        db.delete(Notification).where(db.or_(Notification.story_id.in_(story_ids),
+                                             Notification.comment_id.in_(comment_ids))),
+        db.delete(Follow).where(Follow.story_id.in_(story_ids)),
+        db.delete(Comment).where(Comment.story_id.in_(story_ids)),
+        db.delete(Evidence).where(Evidence.story_id.in_(story_ids)),
+        db.delete(StoryStateEvent).where(StoryStateEvent.story_id.in_(story_ids)),
+    ):
+        db.session.execute(stmt.execution_options(synchronize_session=False))
+    deleted = db.session.execute(
+        db.delete(Story).where(*criteria).execution_options(synchronize_session=False)
+    ).rowcount
+    recount_user_stats(affected_authors)
+    return deleted
+
+# ============================================
+# 浏览量写后缓冲
+# ============================================
+
+VIEW_FLUSH_INTERVAL_SECONDS = float(os.getenv('VIEW_FLUSH_INTERVAL_SECONDS', 5))
+
+def flush_story_views(deltas, commit):
+    """把缓冲的浏览量用一条 UPDATE ... CASE 批量写回
+
+    浏览不算内容更新，显式保持 updated_at 不变。
+    """
+    story_table = Story.__table__
+    stmt = story_table.update()\
+        .where(story_table.c.id.in_(list(deltas)))\
+        .values(
+            views=db.func.coalesce(story_table.c.views, 0) + db.case(deltas, value=story_table.c.id, else_=0),
+            updated_at=story_table.c.updated_at
+        )
+    with app.app_context():
+        # 浏览量不计入 ETag 版本号，否则每次回写都会让所有客户端缓存失效
+        db.session.execute(stmt, execution_options={'skip_data_version': True})
+        commit(db.session.commit)
+
+story_view_buffer = CounterBuffer(flush_story_views, interval=VIEW_FLUSH_INTERVAL_SECONDS, name='story_views')
+
+# ============================================
+# 分类点击写后缓冲
+# ============================================
+
+CATEGORY_CLICK_FLUSH_INTERVAL_SECONDS = float(os.getenv('CATEGORY_CLICK_FLUSH_INTERVAL_SECONDS', 5))
+CATEGORY_CLICK_MAX_PENDING = int(os.getenv('CATEGORY_CLICK_MAX_PENDING', 1000))
+
+def flush_category_clicks(deltas, commit):
+    """把缓冲的 {(user_id, category): delta} 用一条 INSERT ... ON CONFLICT DO UPDATE 批量写回"""
+    now = datetime.utcnow()
+    stmt = sqlite_insert(CategoryClick)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'category'],
+        set_={
+            'click_count': db.func.coalesce(CategoryClick.click_count, 0) + stmt.excluded.click_count,
+            'updated_at': stmt.excluded.updated_at,
+        }
+    )
+    rows = [
+        {'user_id': user_id, 'category': category, 'click_count': delta, 'updated_at': now}
+        for (user_id, category), delta in deltas.items()
+    ]
+    with app.app_context():
+        db.session.execute(stmt, rows)
+        refresh_user_click_stats({user_id for user_id, _ in deltas})
+        commit(db.session.commit)
+
+category_click_buffer = CounterBuffer(
+    flush_category_clicks,
+    interval=CATEGORY_CLICK_FLUSH_INTERVAL_SECONDS,
+    name='category_clicks',
+    max_pending=CATEGORY_CLICK_MAX_PENDING
+)
+
+# ============================================
+# 实时事件推送（SSE）
+# ============================================
+
+SSE_HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+SSE_QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', 100))
+
+event_bus = EventBus(queue_size=SSE_QUEUE_SIZE)
+
+def publish_event(event_type, data, user_ids=None):
+    """在写入提交之后调用；推送失败不影响业务流程"""
+    try:
+        return event_bus.publish(event_type, data, user_ids=user_ids)
+    except Exception as e:
+        print(f"[publish_event] 推送 {event_type} 失败: {e}")
+        return 0
+
+# AI 楼主回复：发表评论后等待多少秒开始生成（0 表示立即），生成中的部分回复逐字推送
+AI_REPLY_DELAY_SECONDS = float(os.getenv('AI_REPLY_DELAY_SECONDS', 60))
+AI_REPLY_STREAM_RETENTION_SECONDS = float(os.getenv('AI_REPLY_STREAM_RETENTION_SECONDS', 60))
+
+reply_streams = ReplyStreamRegistry(retention=AI_REPLY_STREAM_RETENTION_SECONDS)
+
+# ============================================
+# ETag 协商缓存
+# ============================================
+
+# 故事、评论、证据任何一处提交变更，版本号 +1（保存在 data_version 表，其他进程的写入也会推进）
+content_version = DataVersion(tables=('story', 'comment', 'evidence'))
+
+def not_modified(etag):
+    """客户端的 If-None-Match 命中当前 ETag 时返回 304 响应，否则返回 None"""
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return None
+
+def with_etag(response, etag):
+    """弱 ETag：浏览量不参与版本号，只保证内容（故事/评论/证据）一致"""
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 # ============================================
 # 真实用户名生成函数
 # ============================================
@@ -292,6 +696,7 @@ def maybe_add_fake_comment(story_id):
         return
     
     existing_comments = Comment.query.filter_by(story_id=story_id).all()
+    added_comments = []
     
     # 添加评论
     for _ in range(num_comments):
@@ -332,7 +737,10 @@ def maybe_add_fake_comment(story_id):
         )
         
         db.session.add(fake_comment)
+        bump_story_counters(story_id, comments=1, user_comments=1)
+        bump_user_stats(fake_user.id, comments=1)
         existing_comments.append(fake_comment)  # 更新列表避免后续重复
+        added_comments.append(fake_comment)
         
         if parent_comment:
             print(f"[fake_comment] 虚拟用户 {fake_user.username} 回复了楼主: {comment_content}")
@@ -340,6 +748,9 @@ def maybe_add_fake_comment(story_id):
             print(f"[fake_comment] 为故事 {story_id} ({story.title[:20]}) 添加了虚假评论: {comment_content}")
     
     db.session.commit()
+    
+    for c in added_comments:
+        publish_event('comment_created', {'story_id': story_id, 'comment_id': c.id, 'parent_id': c.parent_id})
 
 def maybe_add_fake_reply(story_id, parent_comment):
     """虚拟用户有40%概率回复其他评论"""
@@ -381,7 +792,10 @@ def maybe_add_fake_reply(story_id, parent_comment):
     )
     
     db.session.add(fake_reply)
+    bump_story_counters(story_id, comments=1, user_comments=1)
+    bump_user_stats(fake_user.id, comments=1)
     db.session.commit()
+    publish_event('comment_created', {'story_id': story_id, 'comment_id': fake_reply.id, 'parent_id': fake_reply.parent_id})
     
     print(f"[fake_reply] 虚拟用户 {fake_user.username} 回复了评论 #{parent_comment.id}: {reply_content}")
 
@@ -466,7 +880,11 @@ def init_default_stories():
         print("✅ 默认故事创建完成")
 
 with app.app_context():
+    # 新数据库由 create_all 建出完整结构；已有数据库的加列/索引由版本化迁移补齐
     db.create_all()
+    migrations.upgrade(db.engine)
+    search_index.init_search_index(db.engine)
+    content_version.bind(db.engine)
     os.makedirs('static/uploads', exist_ok=True)
     os.makedirs('static/generated', exist_ok=True)
     init_default_stories()
@@ -536,58 +954,375 @@ def login():
         'user': {'id': user.id, 'username': user.username, 'avatar': user.avatar}
     })
 
+# ============================================
+# 故事列表分页
+# ============================================
+
+STORY_COUNT_TTL_SECONDS = int(os.getenv('STORY_COUNT_TTL_SECONDS', 30))
+MAX_STORIES_PER_PAGE = 50
+
+_story_total_cache = {}  # category(None 表示全部) -> (value, expires_at)
+_story_total_lock = threading.Lock()
+
+def get_story_total(fresh=False, category=None):
+    """返回故事总数（可按分类）；默认使用短时缓存，避免每次轮询都执行 COUNT(*)"""
+    now = time.monotonic()
+    with _story_total_lock:
+        cached = _story_total_cache.get(category)
+        if not fresh and cached is not None and now < cached[1]:
+            return cached[0]
+
+    query = db.session.query(db.func.count(Story.id))
+    if category:
+        query = query.filter(Story.category == category)
+    total = query.scalar() or 0
+
+    with _story_total_lock:
+        _story_total_cache[category] = (total, now + STORY_COUNT_TTL_SECONDS)
+    return total
+
+def encode_cursor(created_at, row_id):
+    """游标格式: <created_at ISO 时间>,<id>"""
+    return f"{created_at.isoformat()},{row_id}"
+
+def decode_cursor(cursor):
+    """解析游标，格式错误时返回 None"""
+    try:
+        created_at, row_id = cursor.rsplit(',', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, AttributeError):
+        return None
+
+def serialize_story_summary(s):
+    """故事列表项（只用 story 表自身的列，不触发任何关系加载）"""
+    return {
+        'id': s.id,
+        'title': s.title,
+        'content': s.content[:200] + '...' if len(s.content) > 200 else s.content,
+        'category': s.category,
+        'location': s.location,
+        'is_ai_generated': s.is_ai_generated,
+        'ai_persona': s.ai_persona,
+        'current_state': s.current_state,
+        'created_at': s.created_at.isoformat(),
+        'views': (s.views or 0) + story_view_buffer.pending(s.id),
+        'comments_count': s.comments_count or 0,
+        'evidence_count': s.evidence_count or 0
+    }
+
+FEED_CACHE_TTL_SECONDS = float(os.getenv('FEED_CACHE_TTL_SECONDS', 10))
+FEED_CACHE_MAX_ENTRIES = int(os.getenv('FEED_CACHE_MAX_ENTRIES', 128))
+
+# 匿名读者拿到的列表页完全相同，缓存序列化后的响应体；
+# 键里带上内容版本号，任何故事/评论/证据提交后旧条目不会再被命中，并整体清空
+feed_cache = ResponseCache(maxsize=FEED_CACHE_MAX_ENTRIES, ttl=FEED_CACHE_TTL_SECONDS, name='story_feed')
+content_version.on_change(lambda version: feed_cache.clear())
+
+def build_story_feed(per_page, category=None, after=None, page=1, include_total=False):
+    """查询并组装故事列表；after 不为 None 时使用游标模式。游标非法时返回 None"""
+    query = Story.query.order_by(Story.created_at.desc(), Story.id.desc())
+    if category:
+        query = query.filter(Story.category == category)
+
+    # 游标（keyset）模式
+    if after is not None:
+        if after:
+            cursor = decode_cursor(after)
+            if not cursor:
+                return None
+            query = query.filter(db.tuple_(Story.created_at, Story.id) < cursor)
+
+        rows = query.limit(per_page + 1).all()
+        has_next = len(rows) > per_page
+        stories = rows[:per_page]
+
+        result = {
+            'per_page': per_page,
+            'has_next': has_next,
+            'next_cursor': encode_cursor(stories[-1].created_at, stories[-1].id) if has_next else None
+        }
+        if include_total:
+            result['total'] = get_story_total(fresh=True, category=category)
+
+        return {
+            'stories': [serialize_story_summary(s) for s in stories],
+            'pagination': result
+        }
+
+    # 页码模式：多取一条判断是否有下一页，总数走缓存
+    rows = query.offset((page - 1) * per_page).limit(per_page + 1).all()
+    has_next = len(rows) > per_page
+    stories = rows[:per_page]
+
+    total = get_story_total(fresh=include_total, category=category)
+    pages = math.ceil(total / per_page) if total else 0
+    # 缓存的总数可能略微滞后，页数至少要覆盖当前实际能翻到的页
+    if has_next:
+        pages = max(pages, page + 1)
+    elif stories:
+        pages = max(pages, page)
+
+    return {
+        'stories': [serialize_story_summary(s) for s in stories],
+        'pagination': {
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'pages': pages,
+            'has_prev': page > 1,
+            'has_next': has_next,
+            'prev_page': page - 1 if page > 1 else None,
+            'next_page': page + 1 if has_next else None
+        }
+    }
+
 @app.route('/api/stories', methods=['GET'])
 def get_stories():
-    # 获取分页参数
-    page = request.args.get('page', 1, type=int)
+    """故事列表
+
+    - 页码模式（旧客户端）: ?page=N&per_page=M，返回结构不变，total 来自短时缓存
+    - 游标模式: ?after=<created_at>,<id>（首页传空 after=），按索引 seek，不做 OFFSET
+    - category=<分类> 只返回该分类的故事
+    - include_total=1 时强制实时统计总数（不走响应缓存）
+    """
     per_page = request.args.get('per_page', 10, type=int)  # 每页10个故事
-    
-    # 查询总数
-    total = Story.query.count()
-    
-    # 分页查询
-    pagination = Story.query.order_by(Story.created_at.desc()).paginate(
-        page=page,
-        per_page=per_page,
-        error_out=False
-    )
-    
-    stories = pagination.items
-    
+    if per_page < 1:
+        per_page = 10
+    per_page = min(per_page, MAX_STORIES_PER_PAGE)
+    include_total = request.args.get('include_total', '0') in ('1', 'true')
+    category = request.args.get('category') or None
+    if category == 'all':
+        category = None
+    after = request.args.get('after', '') if 'after' in request.args else None
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    # 先取版本号再查数据：即使期间有新提交，下次请求版本号也会不同
+    version = content_version.value
+    etag = content_version.etag('list')
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    cache_key = (version, page if after is None else None, per_page, category, after)
+    body = None if include_total else feed_cache.get(cache_key)
+    if body is not None:
+        response = app.response_class(body, mimetype='application/json')
+        response.headers['X-Cache'] = 'HIT'
+        return with_etag(response, etag)
+
+    feed = build_story_feed(per_page, category=category, after=after, page=page, include_total=include_total)
+    if feed is None:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    response = jsonify(feed)
+    if not include_total:
+        feed_cache.set(cache_key, response.get_data())
+    response.headers['X-Cache'] = 'BYPASS' if include_total else 'MISS'
+    return with_etag(response, etag)
+
+@app.route('/api/admin/cache_stats', methods=['GET'])
+def admin_cache_stats():
+    """Admin endpoint: hit/miss counters of the in-process feed cache (header 'X-ADMIN-KEY')."""
+    key = request.headers.get('X-ADMIN-KEY')
+    if not key or key != app.config.get('SECRET_KEY'):
+        return jsonify({'error': 'Forbidden'}), 403
     return jsonify({
-        'stories': [{
-            'id': s.id,
-            'title': s.title,
-            'content': s.content[:200] + '...' if len(s.content) > 200 else s.content,
-            'category': s.category,
-            'location': s.location,
-            'is_ai_generated': s.is_ai_generated,
-            'ai_persona': s.ai_persona,
-            'current_state': s.current_state,
-            'created_at': s.created_at.isoformat(),
-            'views': s.views,
-            'comments_count': len(s.comments),
-            'evidence_count': len(s.evidence)
-        } for s in stories],
+        'feed': feed_cache.stats(),
+        'content_version': content_version.value,
+        'translation': translation_cache.stats()
+    })
+
+@app.route('/api/admin/llm_stats', methods=['GET'])
+def admin_llm_stats():
+    """Admin endpoint: LM Studio request queue depth, rejections and queue wait times (header 'X-ADMIN-KEY')."""
+    key = request.headers.get('X-ADMIN-KEY')
+    if not key or key != app.config.get('SECRET_KEY'):
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify({'llm': llm_client.dispatcher.stats(), 'active_reply_streams': reply_streams.active_count()})
+
+@app.route('/api/events', methods=['GET'])
+def event_stream():
+    """SSE 推送：新故事/新评论/AI回复/证据完成（广播）与个人通知（需 ?token=）
+
+    EventSource 不能带自定义请求头，所以登录态通过查询参数传递。
+    """
+    token = request.args.get('token')
+    user_id = None
+    if token:
+        user_id = verify_token(token)
+        if not user_id:
+            return jsonify({'error': 'Unauthorized'}), 401
+
+    sub = event_bus.subscribe(user_id)
+
+    def generate():
+        try:
+            yield f"retry: 5000\n: connected\n\n"
+            while True:
+                if sub.overflowed:
+                    # 客户端跟不上，丢弃积压事件，让它整体刷新一次
+                    while sub.get(timeout=0) is not None:
+                        pass
+                    sub.overflowed = False
+                    yield format_sse({'id': 0, 'type': 'resync', 'data': {}})
+                    continue
+                event = sub.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            event_bus.unsubscribe(sub)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/search', methods=['GET'])
+def search_stories():
+    """全文检索故事标题、正文和评论（FTS5 trigram），按相关度分页返回"""
+    q = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = request.args.get('per_page', 10, type=int)
+    if per_page < 1:
+        per_page = 10
+    per_page = min(per_page, MAX_STORIES_PER_PAGE)
+
+    total, hits = search_index.search(db.session, q, limit=per_page, offset=(page - 1) * per_page)
+
+    stories = {s.id: s for s in Story.query.filter(Story.id.in_([h['story_id'] for h in hits])).all()} if hits else {}
+    results = []
+    for hit in hits:
+        story = stories.get(hit['story_id'])
+        if not story:
+            continue
+        item = serialize_story_summary(story)
+        item['snippet'] = hit['snippet']
+        item['matched_comment_id'] = hit['comment_id']
+        results.append(item)
+
+    pages = math.ceil(total / per_page) if total else 0
+    return jsonify({
+        'query': q,
+        'results': results,
         'pagination': {
             'page': page,
             'per_page': per_page,
             'total': total,
-            'pages': pagination.pages,
-            'has_prev': pagination.has_prev,
-            'has_next': pagination.has_next,
-            'prev_page': pagination.prev_num if pagination.has_prev else None,
-            'next_page': pagination.next_num if pagination.has_next else None
+            'pages': pages,
+            'has_prev': page > 1,
+            'has_next': page < pages,
+            'prev_page': page - 1 if page > 1 else None,
+            'next_page': page + 1 if page < pages else None
         }
     })
 
+# ============================================
+# 评论分页与回复树
+# ============================================
+
+COMMENTS_PER_PAGE = 20
+MAX_COMMENTS_PER_PAGE = 100
+
+def serialize_comment(c, story):
+    """单条评论（author 需已预加载，避免逐条懒加载）"""
+    return {
+        'id': c.id,
+        'content': c.content,
+        'is_ai_response': c.is_ai_response,
+        'parent_id': c.parent_id,
+        'author': {
+            'id': c.author.id if c.author else None,
+            'username': c.author.username if c.author else (story.ai_persona if c.is_ai_response else 'AI'),
+            'avatar': c.author.avatar if c.author else ''
+        },
+        'created_at': c.created_at.isoformat(),
+        'replies': []
+    }
+
+def load_comment_page(story, cursor=None, limit=COMMENTS_PER_PAGE):
+    """按顶级评论分页，并带上这些顶级评论下的全部回复，在服务端组装成树
+
+    cursor 为上一页最后一条顶级评论的 id。父评论已不存在的回复也视为顶级评论。
+    固定 3 条查询：顶级评论、递归展开的回复、作者（selectinload）。
+    """
+    parent = db.aliased(Comment)
+    roots_query = Comment.query\
+        .options(db.selectinload(Comment.author))\
+        .filter(
+            Comment.story_id == story.id,
+            db.or_(
+                Comment.parent_id.is_(None),
+                ~db.exists().where(parent.id == Comment.parent_id)
+            )
+        )\
+        .order_by(Comment.id)
+    if cursor:
+        roots_query = roots_query.filter(Comment.id > cursor)
+
+    rows = roots_query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    roots = rows[:limit]
+
+    replies = []
+    if roots:
+        tree = db.select(Comment.id)\
+            .where(Comment.parent_id.in_([c.id for c in roots]), Comment.story_id == story.id)\
+            .cte('reply_tree', recursive=True)
+        tree = tree.union_all(
+            db.select(Comment.id).where(Comment.parent_id == tree.c.id, Comment.story_id == story.id)
+        )
+        replies = Comment.query\
+            .options(db.selectinload(Comment.author))\
+            .filter(Comment.id.in_(db.select(tree.c.id)))\
+            .order_by(Comment.id)\
+            .all()
+
+    nodes = {}
+    result = []
+    for c in roots:
+        nodes[c.id] = serialize_comment(c, story)
+        result.append(nodes[c.id])
+    # 按 id 顺序挂载，父评论总是先于子回复出现
+    for c in replies:
+        nodes[c.id] = serialize_comment(c, story)
+        if c.parent_id in nodes:
+            nodes[c.parent_id]['replies'].append(nodes[c.id])
+
+    return {
+        'comments': result,
+        'pagination': {
+            'limit': limit,
+            'has_more': has_more,
+            'next_cursor': roots[-1].id if has_more else None,
+            'total': story.comments_count or 0
+        }
+    }
+
 @app.route('/api/stories/<int:story_id>', methods=['GET'])
 def get_story(story_id):
-    story = Story.query.get_or_404(story_id)
-    story.views += 1
-    db.session.commit()
-    
-    return jsonify({
+    etag = content_version.etag('story', story_id)
+    cached = not_modified(etag)
+    if cached:
+        # 内容未变也算一次浏览；版本号未变说明故事仍存在
+        story_view_buffer.add(story_id)
+        return cached
+
+    story = db.session.get(Story, story_id)
+    if story is None:
+        # 已归档的故事只读返回，不计浏览量
+        archived = archive.load_archived_story(story_id)
+        if archived is None:
+            return jsonify({'error': '故事不存在'}), 404
+        return jsonify(archived)
+    # 浏览量先进内存缓冲，由后台线程批量写回，读接口不再产生写事务
+    pending_views = story_view_buffer.add(story_id)
+    
+    # 只内嵌第一页评论，其余通过 /api/stories/<id>/comments?cursor= 加载
+    comment_page = load_comment_page(story)
+    
+    return with_etag(jsonify({
         'id': story.id,
         'title': story.title,
         'content': story.content,
@@ -597,7 +1332,7 @@ def get_story(story_id):
         'ai_persona': story.ai_persona,
         'current_state': story.current_state,
         'created_at': story.created_at.isoformat(),
-        'views': story.views,
+        'views': (story.views or 0) + pending_views,
         'evidence': [{
             'id': e.id,
             'type': e.evidence_type,
@@ -605,19 +1340,31 @@ def get_story(story_id):
             'description': e.description,
             'created_at': e.created_at.isoformat()
         } for e in story.evidence],
-        'comments': [{
-            'id': c.id,
-            'content': c.content,
-            'is_ai_response': c.is_ai_response,
-            'parent_id': c.parent_id,
-            'author': {
-                'id': c.author.id if c.author else None,
-                'username': c.author.username if c.author else (story.ai_persona if c.is_ai_response else 'AI'),
-                'avatar': c.author.avatar if c.author else ''
-            },
-            'created_at': c.created_at.isoformat()
-        } for c in story.comments]
-    })
+        'comments': comment_page['comments'],
+        'comments_pagination': comment_page['pagination']
+    }), etag)
+
+@app.route('/api/stories/<int:story_id>/comments', methods=['GET'])
+def get_comments(story_id):
+    """评论分页：?cursor=<上一页最后一条顶级评论id>&limit=N，返回带 replies 的评论树"""
+    etag = content_version.etag('comments', story_id)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    story = db.session.get(Story, story_id)
+    if story is None:
+        archived = archive.load_archived_story(story_id)
+        if archived is None:
+            return jsonify({'error': '故事不存在'}), 404
+        return jsonify({'comments': archived['comments'], 'pagination': archived['comments_pagination']})
+    cursor = request.args.get('cursor', type=int)
+    limit = request.args.get('limit', COMMENTS_PER_PAGE, type=int)
+    if limit < 1:
+        limit = COMMENTS_PER_PAGE
+    limit = min(limit, MAX_COMMENTS_PER_PAGE)
+
+    return with_etag(jsonify(load_comment_page(story, cursor=cursor, limit=limit)), etag)
 
 @app.route('/api/stories/<int:story_id>/comments', methods=['POST'])
 def add_comment(story_id):
@@ -644,21 +1391,27 @@ def add_comment(story_id):
     )
     
     db.session.add(comment)
+    bump_story_counters(story_id, comments=1, user_comments=1)
+    bump_user_stats(user_id, comments=1)
     
     # Record user interaction for state machine
     from story_engine import record_user_interaction
     record_user_interaction(story)
     
+    # 评论、计数和关注者通知在同一个事务里提交
+    db.session.flush()
+    notified_user_ids = create_notifications_for_followers(story, comment)
     db.session.commit()
-    
-    # Create notification for user's own comment (for AI response)
-    create_notifications_for_followers(story, comment)
+    publish_event('comment_created', {'story_id': story_id, 'comment_id': comment.id, 'parent_id': parent_id})
+    if notified_user_ids:
+        publish_event('notification', {'story_id': story_id, 'comment_id': comment.id}, user_ids=notified_user_ids)
 
-    # 启动后台线程，5秒后生成AI回复（测试用）
-    print(f"[add_comment] 启动后台线程，5秒后生成AI回复...")
+    # 启动后台线程生成AI回复，部分回复通过 ai_reply_stream_url 逐字推送
+    print(f"[add_comment] 启动后台线程，{AI_REPLY_DELAY_SECONDS:g}秒后生成AI回复...")
+    reply_streams.open(comment.id)
     threading.Thread(
         target=delayed_ai_response,
-        args=(story_id, comment.id, 5),  # 5秒延迟（测试）
+        args=(story_id, comment.id, AI_REPLY_DELAY_SECONDS),
         daemon=True
     ).start()
     
@@ -672,7 +1425,7 @@ def add_comment(story_id):
             maybe_add_fake_reply(story_id, parent_comment)
     
     # 检查是否达到证据生成阈值（只统计用户评论，不包括AI回复）
-    user_comment_count = Comment.query.filter_by(story_id=story_id, is_ai_response=False).count()
+    user_comment_count = db.session.query(Story.user_comments_count).filter_by(id=story_id).scalar() or 0
     evidence_threshold = int(os.getenv('EVIDENCE_COMMENT_THRESHOLD', 3))  # 改为3
     
     print(f"[add_comment] 当前用户评论数: {user_comment_count}, 证据阈值: {evidence_threshold}")
@@ -700,9 +1453,49 @@ def add_comment(story_id):
             'created_at': comment.created_at.isoformat()
         },
         'ai_response_pending': True,
+        'ai_reply_stream_url': f'/api/comments/{comment.id}/ai-reply/stream',
         'message': 'AI楼主正在思考回复，请稍候...'
     }), 201
 
+@app.route('/api/comments/<int:comment_id>/ai-reply/stream', methods=['GET'])
+def ai_reply_stream(comment_id):
+    """SSE：逐字推送楼主对这条评论的回复
+
+    partial 事件携带目前可见的全文（已去掉思考内容），done 事件携带保存后的回复评论，
+    failed 表示生成失败；done/failed 之后服务端结束连接。
+    """
+    stream = reply_streams.get(comment_id)
+    if stream is None:
+        # 已生成完且超过保留期（或服务重启过）：直接返回已保存的回复
+        reply = Comment.query.filter_by(parent_id=comment_id, is_ai_response=True).order_by(Comment.id).first()
+        if reply is None:
+            return jsonify({'error': '没有进行中的AI回复'}), 404
+        payload = serialize_comment(reply, reply.story)
+        return Response(format_sse({'id': 1, 'type': 'done', 'data': payload}), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache'})
+
+    def generate():
+        yield ": connected\n\n"
+        version = 0
+        while True:
+            current, status, text, result = stream.wait(version, timeout=SSE_HEARTBEAT_SECONDS)
+            if current == version:
+                yield ": ping\n\n"
+                continue
+            version = current
+            if status == DONE:
+                yield format_sse({'id': version, 'type': 'done', 'data': result})
+                return
+            if status == FAILED:
+                yield format_sse({'id': version, 'type': 'failed', 'data': result})
+                return
+            yield format_sse({'id': version, 'type': 'partial', 'data': {'comment_id': comment_id, 'text': text}})
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/stories/<int:story_id>/follow', methods=['POST', 'GET'])
 def follow_story(story_id):
     token = request.headers.get('Authorization')
@@ -726,16 +1519,11 @@ def follow_story(story_id):
         db.session.commit()
         return jsonify({'status': 'followed'})
 
-@app.route('/api/notifications', methods=['GET'])
-def get_notifications():
-    token = request.headers.get('Authorization')
-    user_id = verify_token(token)
-    if not user_id:
-        return jsonify({'error': 'Unauthorized'}), 401
+NOTIFICATIONS_PER_PAGE = 20
+MAX_NOTIFICATIONS_PER_PAGE = 100
 
-    notifications = Notification.query.filter_by(user_id=user_id).order_by(Notification.created_at.desc()).all()
-    
-    return jsonify([{
+def serialize_notification(n):
+    return {
         'id': n.id,
         'content': n.content,
         'story_id': n.story_id,
@@ -744,28 +1532,118 @@ def get_notifications():
         'notification_type': n.notification_type,
         'notification_category': n.notification_category or 'comment',  # 返回分类，默认为 'comment'
         'created_at': n.created_at.isoformat()
-    } for n in notifications])
+    }
+
+@app.route('/api/me', methods=['GET'])
+def get_me():
+    """校验 token 并返回当前用户（主键查询，替代拉取通知来验证登录态）"""
+    token = request.headers.get('Authorization')
+    user_id = verify_token(token) if token else None
+    user = db.session.get(User, user_id) if user_id else None
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    return jsonify({'id': user.id, 'username': user.username, 'avatar': user.avatar})
+
+@app.route('/api/notifications', methods=['GET'])
+def get_notifications():
+    """通知列表（按时间倒序游标分页）
+
+    ?cursor=<created_at>,<id>&limit=N&unread=1
+    """
+    token = request.headers.get('Authorization')
+    user_id = verify_token(token)
+    if not user_id:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    limit = request.args.get('limit', NOTIFICATIONS_PER_PAGE, type=int)
+    if limit < 1:
+        limit = NOTIFICATIONS_PER_PAGE
+    limit = min(limit, MAX_NOTIFICATIONS_PER_PAGE)
+
+    query = Notification.query.filter(Notification.user_id == user_id)
+    if request.args.get('unread', '0') in ('1', 'true'):
+        query = query.filter(Notification.is_read == False)
+
+    cursor_arg = request.args.get('cursor')
+    if cursor_arg:
+        cursor = decode_cursor(cursor_arg)
+        if not cursor:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(db.tuple_(Notification.created_at, Notification.id) < cursor)
+
+    rows = query.order_by(Notification.created_at.desc(), Notification.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    notifications = rows[:limit]
+
+    return jsonify({
+        'notifications': [serialize_notification(n) for n in notifications],
+        'pagination': {
+            'limit': limit,
+            'has_more': has_more,
+            'next_cursor': encode_cursor(notifications[-1].created_at, notifications[-1].id) if has_more else None
+        }
+    })
+
+@app.route('/api/notifications/unread_count', methods=['GET'])
+def get_unread_notification_count():
+    """未读通知数（只扫描索引，用于菜单红点）"""
+    token = request.headers.get('Authorization')
+    user_id = verify_token(token)
+    if not user_id:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    count = db.session.query(db.func.count(Notification.id))\
+        .filter(Notification.user_id == user_id, Notification.is_read == False)\
+        .scalar()
+    return jsonify({'unread_count': count or 0})
 
 
 @app.route('/api/translate', methods=['POST'])
 def translate_api():
+    """翻译文本；相同原文命中 translation_cache 时不调用模型（cached=true）"""
     data = request.json or {}
     text = data.get('text', '')
     target = data.get('target', 'en')
 
+    if not translation_cache.is_supported_target(target):
+        return jsonify({'error': 'Unsupported target language'}), 400
     if not text:
         return jsonify({'translated': ''})
 
     try:
-        from ai_engine import translate_text
-        translated = translate_text(text, target=target)
+        translated, source = translation_cache.translate(text, target=target)
         if translated is None:
             return jsonify({'translated': None, 'error': 'No translation service available'}), 200
-        return jsonify({'translated': translated})
+        return jsonify({'translated': translated, 'cached': source != 'model'})
     except Exception as e:
         print(f"[translate_api] error: {e}")
         return jsonify({'translated': None, 'error': str(e)}), 500
 
+# 单次批量翻译请求最多包含的文本数
+TRANSLATE_BATCH_MAX_TEXTS = int(os.getenv('TRANSLATE_BATCH_MAX_TEXTS', 200))
+
+@app.route('/api/translate/batch', methods=['POST'])
+def translate_batch_api():
+    """批量翻译（故事 + 评论串）：去重后查缓存，未命中的打包成尽量少的模型调用，结果按输入顺序返回"""
+    data = request.json or {}
+    texts = data.get('texts')
+    target = data.get('target', 'en')
+
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        return jsonify({'error': 'texts must be a list of strings'}), 400
+    if len(texts) > TRANSLATE_BATCH_MAX_TEXTS:
+        return jsonify({'error': f'At most {TRANSLATE_BATCH_MAX_TEXTS} texts per request'}), 400
+    if not translation_cache.is_supported_target(target):
+        return jsonify({'error': 'Unsupported target language'}), 400
+
+    try:
+        translated, cached, model_calls = translation_cache.translate_many(texts, target=target)
+        return jsonify({'translated': translated, 'cached': cached, 'model_calls': model_calls})
+    except Exception as e:
+        print(f"[translate_batch_api] error: {e}")
+        return jsonify({'translated': None, 'error': str(e)}), 500
+
 @app.route('/api/notifications/read', methods=['POST'])
 def read_notifications():
     token = request.headers.get('Authorization')
@@ -776,10 +1654,17 @@ def read_notifications():
     data = request.json
     notification_ids = data.get('ids', [])
 
-    Notification.query.filter(
-        Notification.user_id == user_id,
-        Notification.id.in_(notification_ids)
-    ).update({'is_read': True}, synchronize_session=False)
+    # all=true 时标记全部未读（通知分页后前端不再持有完整 id 列表）
+    if data.get('all'):
+        Notification.query.filter(
+            Notification.user_id == user_id,
+            Notification.is_read == False
+        ).update({'is_read': True}, synchronize_session=False)
+    else:
+        Notification.query.filter(
+            Notification.user_id == user_id,
+            Notification.id.in_(notification_ids)
+        ).update({'is_read': True}, synchronize_session=False)
     
     db.session.commit()
     return jsonify({'status': 'success'})
@@ -799,18 +1684,9 @@ def track_category_click():
     if not category:
         return jsonify({'error': 'Category is required'}), 400
     
-    # 查找或创建点击记录
-    click_record = CategoryClick.query.filter_by(user_id=user_id, category=category).first()
-    
-    if click_record:
-        click_record.click_count += 1
-        click_record.updated_at = datetime.utcnow()
-    else:
-        click_record = CategoryClick(user_id=user_id, category=category, click_count=1)
-        db.session.add(click_record)
-    
-    db.session.commit()
-    return jsonify({'status': 'success', 'click_count': click_record.click_count})
+    # 只在内存中累加，由 category_click_buffer 定时批量 upsert
+    pending = category_click_buffer.add((user_id, category))
+    return jsonify({'status': 'success', 'pending_clicks': pending}), 202
 
 
 @app.route('/api/user-top-categories', methods=['GET'])
@@ -821,62 +1697,86 @@ def get_user_top_categories():
     if not user_id:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    # 查询用户点击最多的前两个分类
-    top_categories = CategoryClick.query.filter_by(user_id=user_id)\
-        .order_by(CategoryClick.click_count.desc())\
-        .limit(2)\
-        .all()
-    
-    # 计算总点击数 (Eyes)
-    total_clicks = db.session.query(db.func.sum(CategoryClick.click_count)).filter_by(user_id=user_id).scalar() or 0
-    
-    # 计算总评论数 (Mouths)
-    total_comments = Comment.query.filter_by(author_id=user_id).count()
-    
-    result = [{'category': cat.category, 'click_count': cat.click_count} for cat in top_categories]
+    # 物化统计：一次主键查询（点击在写后缓冲中，最多滞后一个写回间隔）
+    stats = db.session.get(UserStats, user_id)
+    if stats is None:
+        return jsonify({'categories': [], 'stats': {'total_clicks': 0, 'total_comments': 0}})
     
     return jsonify({
-        'categories': result,
+        'categories': json.loads(stats.top_categories) if stats.top_categories else [],
         'stats': {
-            'total_clicks': total_clicks,
-            'total_comments': total_comments
+            'total_clicks': stats.total_clicks or 0,  # Eyes
+            'total_comments': stats.total_comments or 0  # Mouths
         }
     })
 
 
+# 管理后台任务（串行执行，避免两次重置交错）
+admin_jobs = JobQueue(max_workers=1, name='admin_jobs')
+
 @app.route('/api/admin/reset_ai_stories', methods=['POST'])
 def admin_reset_ai_stories():
-    """Admin endpoint: delete previous AI-generated stories and seed three starter posts.
+    """Admin endpoint: enqueue reset_ai_stories() and return 202 with a job id.
 
-    Protect using SECRET key sent in header 'X-ADMIN-KEY'."""
+    Protect using SECRET key sent in header 'X-ADMIN-KEY'. Poll /api/admin/jobs/<job_id> for the result."""
     key = request.headers.get('X-ADMIN-KEY')
     if not key or key != app.config.get('SECRET_KEY'):
         return jsonify({'error': 'Forbidden'}), 403
 
-    # Delete AI-generated stories
-    try:
-        deleted = Story.query.filter_by(is_ai_generated=True).delete(synchronize_session=False)
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': '删除旧故事失败', 'detail': str(e)}), 500
+    job = admin_jobs.submit('reset_ai_stories', reset_ai_stories, unique=True)
+    return jsonify({'job_id': job['id'], 'status': job['status'], 'status_url': f"/api/admin/jobs/{job['id']}"}), 202
+
+@app.route('/api/admin/jobs/<job_id>', methods=['GET'])
+def admin_job_status(job_id):
+    """Admin endpoint: status/result of a background job (header 'X-ADMIN-KEY')."""
+    key = request.headers.get('X-ADMIN-KEY')
+    if not key or key != app.config.get('SECRET_KEY'):
+        return jsonify({'error': 'Forbidden'}), 403
+    job = admin_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job)
+
+# 三个预置帖的生成参数：金鱼街、港铁灵异、坟帖
+SEED_STORY_SPECS = (
+    {'category': 'cursed_object', 'location': '旺角金鱼街'},
+    {'category': 'subway_ghost', 'location': '港鐵旺角站'},
+    {'category': 'missing_person', 'location': '某屋邨'},
+)
+
+def generate_seed_stories():
+    """并发调用模型生成三个预置帖（互不依赖，不访问数据库）；失败的位置为 None"""
+    from ai_engine import generate_ai_story
 
-    # Also remove any stories categorized as time anomaly (时空异常), and their comments/evidence
+    def generate(spec):
+        try:
+            return generate_ai_story(**spec)
+        except Exception as e:
+            print(f"[admin_reset] 生成预置帖失败 {spec}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=len(SEED_STORY_SPECS)) as pool:
+        return list(pool.map(generate, SEED_STORY_SPECS))
+
+def reset_ai_stories():
+    """Delete previous AI-generated and time-anomaly stories, then seed three starter posts.
+
+    在后台任务或定时任务中执行；失败时抛出异常。返回 {'deleted', 'seeded', 'seeded_ids'}。
+    """
+    with app.app_context():
+        return _reset_ai_stories()
+
+def _reset_ai_stories():
+    # Delete AI-generated stories and any stories categorized as time anomaly (时空异常), with all dependent rows
     try:
-        time_deleted = Story.query.filter(Story.category == 'time_anomaly').all()
-        if time_deleted:
-            for t in time_deleted:
-                # cascade should remove comments/evidence but be explicit
-                Comment.query.filter_by(story_id=t.id).delete(synchronize_session=False)
-                Evidence.query.filter_by(story_id=t.id).delete(synchronize_session=False)
-                db.session.delete(t)
-            db.session.commit()
-    except Exception as e:
+        deleted = delete_stories_where(db.or_(Story.is_ai_generated.is_(True), Story.category == 'time_anomaly'))
+        db.session.commit()
+    except Exception:
         db.session.rollback()
-        print(f"[admin_reset] 清理时空异常分类失败: {e}")
+        raise
 
-    # Seed three starter stories using ai_engine.generate_ai_story
-    from ai_engine import generate_ai_story
+    # Seed three starter stories using ai_engine.generate_ai_story (generated concurrently)
+    s1, s2, s3 = generate_seed_stories()
 
     # helper to create story record safely
     def create_story_from_generated(sdict, fallback):
@@ -894,10 +1794,6 @@ def admin_reset_ai_stories():
         return st
 
     # 1) 金鱼街
-    try:
-        s1 = generate_ai_story(category='cursed_object', location='旺角金鱼街')
-    except Exception:
-        s1 = None
     # Use a deliberate, first-person help-seeking post for the Mong Kok goldfish street seed
     forced_title = '旺角金鱼街买的金鱼一直不对劲，求助'
     forced_content = (
@@ -936,10 +1832,6 @@ def admin_reset_ai_stories():
         maybe_add_fake_comment(st1.id)
 
     # 2) 港铁灵异
-    try:
-        s2 = generate_ai_story(category='subway_ghost', location='港鐵旺角站')
-    except Exception:
-        s2 = None
     fallback2 = {
         'title': '深夜地铁里的第13节车厢',
         'content': (
@@ -960,10 +1852,6 @@ def admin_reset_ai_stories():
     maybe_add_fake_comment(st2.id)
 
     # 3) 坟帖（>2 年，评论封锁）
-    try:
-        s3 = generate_ai_story(category='missing_person', location='某屋邨')
-    except Exception:
-        s3 = None
     fallback3 = {
         'title': '【已封】关于那起旧失踪案的最后讨论',
         'content': (
@@ -1018,52 +1906,82 @@ def admin_reset_ai_stories():
             created_at=datetime.utcnow() - timedelta(days=comment_days_ago)
         )
         db.session.add(old_comment)
+        bump_user_stats(fake_user.id, comments=1)
+    bump_story_counters(st3.id, comments=num_old_comments, user_comments=num_old_comments)
 
     try:
         db.session.commit()
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        return jsonify({'error': '创建新故事失败', 'detail': str(e)}), 500
+        raise
 
     # 清理：确保金鱼贴没有历史用户评论（给人一种全新发帖的感觉）
     try:
-        all_stories = Story.query.all()
-        for s in all_stories:
-            title = (s.title or '')
-            loc = (s.location or '')
-            if '金鱼' in title or '金魚' in title or '金鱼' in loc or '金魚' in loc:
-                # 删除该帖的所有用户评论（保留 AI 回复可选，当前删除全部评论以重置）
-                Comment.query.filter_by(story_id=s.id).delete(synchronize_session=False)
+        goldfish = db.or_(*[column.contains(word) for column in (Story.title, Story.location)
+                            for word in ('金鱼', '金魚')])
+        reset_story_ids = db.session.execute(db.select(Story.id).where(goldfish)).scalars().all()
+        if reset_story_ids:
+            # 删除该帖的所有用户评论（保留 AI 回复可选，当前删除全部评论以重置）
+            affected_authors = db.session.execute(
+                db.select(Comment.author_id).distinct()
+                .where(Comment.story_id.in_(reset_story_ids), Comment.author_id.isnot(None))
+            ).scalars().all()
+            Comment.query.filter(Comment.story_id.in_(reset_story_ids)).delete(synchronize_session=False)
+            recount_story_counters(reset_story_ids)
+            recount_user_stats(affected_authors)
         db.session.commit()
     except Exception as e:
         db.session.rollback()
         print(f"[admin_reset] 清理金鱼帖评论失败: {e}")
 
-    return jsonify({'deleted': deleted, 'seeded': [st1.title, st2.title, st3.title]})
+    publish_event('feed_reset', {'deleted': deleted, 'seeded': [st1.id, st2.id, st3.id]})
+    return {'deleted': deleted, 'seeded': [st1.title, st2.title, st3.title], 'seeded_ids': [st1.id, st2.id, st3.id]}
+
+def insert_notifications(user_ids, **fields):
+    """为一组用户批量插入同样内容的通知（一条 executemany，不提交）"""
+    if not user_ids:
+        return
+    now = datetime.utcnow()
+    db.session.execute(db.insert(Notification), [
+        dict(fields, user_id=user_id, is_read=False, created_at=now)
+        for user_id in user_ids
+    ])
 
 def create_notifications_for_followers(story, comment, ai_response=False):
+    """给故事关注者发通知：一条查询取接收人，一条批量 INSERT 写入
+
+    不提交事务，由调用方和评论一起提交；返回接收通知的用户 id，供提交后推送。
+    """
     # Remove nested context manager - assume already in app context
-    followers = Follow.query.filter_by(story_id=story.id).all()
-    for follow in followers:
-        # Don't notify the user who made the comment
-        if not ai_response and follow.user_id == comment.author_id:
-            continue
+    query = db.select(Follow.user_id).where(Follow.story_id == story.id)
+    # Don't notify the user who made the comment
+    if not ai_response and comment.author_id:
+        query = query.where(Follow.user_id != comment.author_id)
+    user_ids = db.session.execute(query).scalars().all()
+
+    insert_notifications(
+        user_ids,
+        story_id=story.id,
+        comment_id=comment.id,
+        notification_type='new_reply' if not ai_response else 'story_update',
+        notification_category='comment',  # 评论通知分类为 'comment'
+        content=f'你关注的故事 "{story.title}" 有了新回复。' if not ai_response else f'你关注的故事 "{story.title}" 有了新进展。'
+    )
+    return user_ids
 
-        notification = Notification(
-            user_id=follow.user_id,
-            story_id=story.id,
-            comment_id=comment.id,
-            notification_type='new_reply' if not ai_response else 'story_update',
-            notification_category='comment',  # 评论通知分类为 'comment'
-            content=f'你关注的故事 "{story.title}" 有了新回复。' if not ai_response else f'你关注的故事 "{story.title}" 有了新进展。'
-        )
-        db.session.add(notification)
-    db.session.commit()
+def delayed_ai_response(story_id, comment_id, delay_seconds=AI_REPLY_DELAY_SECONDS):
+    """延迟生成AI回复；生成过程通过 reply_streams 中该评论的 ReplyStream 逐字推送"""
+    stream = reply_streams.get(comment_id) or reply_streams.open(comment_id)
+    try:
+        _delayed_ai_response(story_id, comment_id, delay_seconds, stream)
+    finally:
+        if not stream.finished:
+            stream.fail('AI回复生成失败')
 
-def delayed_ai_response(story_id, comment_id, delay_seconds=60):
-    """延迟生成AI回复"""
-    print(f"[delayed_ai_response] 开始等待 {delay_seconds} 秒... story_id={story_id}, comment_id={comment_id}")
-    time.sleep(delay_seconds)
+def _delayed_ai_response(story_id, comment_id, delay_seconds, stream):
+    if delay_seconds:
+        print(f"[delayed_ai_response] 开始等待 {delay_seconds} 秒... story_id={story_id}, comment_id={comment_id}")
+        time.sleep(delay_seconds)
     
     print(f"[delayed_ai_response] 开始生成AI回复...")
     with app.app_context():
@@ -1083,7 +2001,7 @@ def delayed_ai_response(story_id, comment_id, delay_seconds=60):
             is_ai_response=True
         ).order_by(Comment.created_at.desc()).limit(3).all()
         
-        ai_response = generate_ai_response(story, comment, previous_ai_responses)
+        ai_response = generate_ai_response(story, comment, previous_ai_responses, on_partial=stream.update)
         print(f"[delayed_ai_response] AI回复生成完成: {ai_response[:50]}..." if ai_response else "[delayed_ai_response] AI回复为空!")
         
         if ai_response:
@@ -1101,22 +2019,30 @@ def delayed_ai_response(story_id, comment_id, delay_seconds=60):
                 is_ai_response=True
             )
             db.session.add(ai_comment)
-            db.session.commit()
+            bump_story_counters(story_id, comments=1)
+            db.session.flush()
             
             # 创建通知给评论者
-            notification = Notification(
-                user_id=comment.author_id,
-                story_id=story_id,
-                comment_id=ai_comment.id,
-                notification_type='ai_reply',
-                content=f'楼主(@{story.ai_persona})回复了你在 "{story.title}" 中的评论。'
-            )
-            db.session.add(notification)
+            notified_user_ids = []
+            if comment.author_id:
+                insert_notifications(
+                    [comment.author_id],
+                    story_id=story_id,
+                    comment_id=ai_comment.id,
+                    notification_type='ai_reply',
+                    notification_category='comment',
+                    content=f'楼主(@{story.ai_persona})回复了你在 "{story.title}" 中的评论。'
+                )
+                notified_user_ids.append(comment.author_id)
             
-            # 通知所有关注者
-            create_notifications_for_followers(story, ai_comment, ai_response=True)
+            # 通知所有关注者（与回复同一个事务提交）
+            notified_user_ids += create_notifications_for_followers(story, ai_comment, ai_response=True)
             
             db.session.commit()
+            stream.finish(serialize_comment(ai_comment, story))
+            publish_event('ai_reply', {'story_id': story_id, 'comment_id': ai_comment.id, 'parent_id': comment.id})
+            if notified_user_ids:
+                publish_event('notification', {'story_id': story_id, 'comment_id': ai_comment.id}, user_ids=set(notified_user_ids))
 
 def generate_evidence_for_story(story_id, trigger_comment_id=None):
     """为故事生成证据（图片）- 每当用户评论数达到2的倍数就生成1张图片
@@ -1135,9 +2061,9 @@ def generate_evidence_for_story(story_id, trigger_comment_id=None):
         from ai_engine import generate_evidence_image
         
         # 获取当前证据统计
-        total_evidence_count = Evidence.query.filter_by(story_id=story_id).count()
+        total_evidence_count = story.evidence_count or 0
         image_evidence_count = Evidence.query.filter_by(story_id=story_id, evidence_type='image').count()
-        user_comment_count = Comment.query.filter_by(story_id=story_id, is_ai_response=False).count()
+        user_comment_count = story.user_comments_count or 0
         
         print(f"[generate_evidence_for_story] 当前证据: 总计{total_evidence_count}个 (图片{image_evidence_count}个)")
         print(f"[generate_evidence_for_story] 当前用户评论数: {user_comment_count}")
@@ -1175,43 +2101,39 @@ def generate_evidence_for_story(story_id, trigger_comment_id=None):
                 description=f"现场拍摄证据 - {template_type} 视角"
             )
             db.session.add(evidence)
-            db.session.commit()
+            bump_story_counters(story_id, evidence=1)
             print(f"[generate_evidence_for_story] ✅ 图片证据已生成 [{template_type}]: {image_path}")
             
             # 更新故事内容（楼主补充证据的真实口吻）
             story.content += f"\n\n【证据更新】\n根据大家的反馈，我又去现场仔细看了看，拍了这张照片。你们看看有没有发现什么异常..."
             story.updated_at = datetime.utcnow()
-            db.session.commit()
             
-            # 收集需要通知的用户：关注者 + 评论过的用户
-            notified_users = set()
-            
-            # 1. 通知所有关注者
-            followers = Follow.query.filter_by(story_id=story_id).all()
-            for follow in followers:
-                notified_users.add(follow.user_id)
-            
-            # 2. 通知所有评论过该故事的用户（非AI回复）
-            commenters = db.session.query(Comment.author_id).filter(
-                Comment.story_id == story_id,
-                Comment.is_ai_response == False,
-                Comment.author_id.isnot(None)
-            ).distinct().all()
-            for (commenter_id,) in commenters:
-                notified_users.add(commenter_id)
+            # 需要通知的用户：关注者 ∪ 评论过的用户（非AI回复），一条查询去重
+            recipients = db.union(
+                db.select(Follow.user_id).where(Follow.story_id == story_id),
+                db.select(Comment.author_id).where(
+                    Comment.story_id == story_id,
+                    Comment.is_ai_response == False,
+                    Comment.author_id.isnot(None)
+                )
+            )
+            notified_users = db.session.execute(recipients).scalars().all()
             
             # 创建通知
-            for user_id in notified_users:
-                notification = Notification(
-                    user_id=user_id,
-                    story_id=story_id,
-                    notification_type='evidence_update',
-                    notification_category='evidence',  # 证据通知分类为 'evidence'
-                    content=f'故事 "{story.title}" 更新了新的图片/声音证据！'
-                )
-                db.session.add(notification)
+            insert_notifications(
+                notified_users,
+                story_id=story_id,
+                comment_id=None,
+                notification_type='evidence_update',
+                notification_category='evidence',  # 证据通知分类为 'evidence'
+                content=f'故事 "{story.title}" 更新了新的图片/声音证据！'
+            )
             
+            # 证据、正文更新和通知一次提交
             db.session.commit()
+            publish_event('evidence_ready', {'story_id': story_id, 'evidence_id': evidence.id, 'type': 'image'})
+            if notified_users:
+                publish_event('notification', {'story_id': story_id}, user_ids=notified_users)
             print(f"[generate_evidence_for_story] ✅ 证据生成完成！已通知 {len(notified_users)} 个用户")
 
 if __name__ == '__main__':
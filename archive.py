@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+冷数据归档
+
+完结（ended）超过 N 天的故事连同评论、证据、状态历史和指向它们的通知，以及已读超过 M 天的通知，
+从热表移到同库的 archived_* 表：列表、评论分页和通知查询只扫描仍然活跃的数据。
+「完结时间」取 story_state_event 中进入 ended 的时间，而不是 updated_at（编辑、计数累加都会刷新它）。
+每批在一个事务里"复制到归档表 + 从热表删除"，单次写锁时间短。
+
+归档表与源表列相同（不带外键和默认值），另加 archived_at，行按原 id 复制。源表都是
+INTEGER PRIMARY KEY AUTOINCREMENT（迁移 0008），删除后 id 不会复用，归档表主键不会冲突。
+源表新增列时，要在新的迁移修订里给对应的归档表加同样的列。
+
+已归档的故事仍可通过 /api/stories/<id> 按 id 读取（只读，见 load_archived_story）。
+
+由定时任务每天执行一次，也可以手动执行：
+    python archive.py                       # 使用环境变量中的天数
+    python archive.py --story-days 7 --notification-days 14
+"""
+import argparse
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Index, Table
+
+ARCHIVE_STORY_DAYS = int(os.getenv('ARCHIVE_STORY_DAYS', 30))
+ARCHIVE_NOTIFICATION_DAYS = int(os.getenv('ARCHIVE_NOTIFICATION_DAYS', 30))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 200))
+
+# 随故事一起归档的子表及其外键列
+STORY_CHILDREN = (('comment', 'story_id'), ('evidence', 'story_id'), ('story_state_event', 'story_id'))
+
+
+def define_archive_table(source, metadata):
+    """按源表列定义 archived_<name> 表"""
+    columns = [Column(c.name, c.type, primary_key=c.primary_key, autoincrement=False) for c in source.columns]
+    table = Table(f'archived_{source.name}', metadata, *columns, Column('archived_at', DateTime))
+    if 'story_id' in source.columns and source.name != 'notification':
+        Index(f'ix_archived_{source.name}_story_id', table.c.story_id)
+    return table
+
+
+def _move(db, source, target, where, now):
+    """把 source 中满足 where 的行复制到 target 再删除，返回行数"""
+    names = [c.name for c in source.columns]
+    select = db.select(*[source.c[name] for name in names], db.literal(now, DateTime)).where(where)
+    db.session.execute(target.insert().from_select(names + ['archived_at'], select))
+    return db.session.execute(source.delete().where(where)).rowcount
+
+
+def ended_at_column():
+    """故事最近一次进入 ended 的时间（story_state_event）；没有状态历史的旧数据退回 created_at"""
+    from app import db, Story, StoryStateEvent
+
+    ended_event = db.select(db.func.max(StoryStateEvent.created_at))\
+        .where(StoryStateEvent.story_id == Story.id, StoryStateEvent.state == 'ended')\
+        .correlate(Story).scalar_subquery()
+    return db.func.coalesce(ended_event, Story.created_at)
+
+
+def archive_ended_stories(days=ARCHIVE_STORY_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    """归档完结超过 days 天的故事及其子表和相关通知，返回各表归档行数
+
+    'story_notification' 是随故事归档的通知数（指向这些故事或其评论，不论是否已读）。
+    """
+    from app import db, Story, Comment, Follow, Notification, archive_tables
+
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    ended_at = ended_at_column()
+    counts = {'story': 0, **{name: 0 for name, _ in STORY_CHILDREN}, 'story_notification': 0}
+    notification = Notification.__table__
+    while True:
+        story_ids = db.session.execute(
+            db.select(Story.id)
+            .where(Story.current_state == 'ended', ended_at < cutoff)
+            .order_by(Story.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not story_ids:
+            break
+
+        now = datetime.utcnow()
+        try:
+            # 通知引用故事和评论的 id，必须在评论移走之前处理，否则会留下指向不存在评论的通知
+            comment_ids = db.select(Comment.id).where(Comment.story_id.in_(story_ids))
+            counts['story_notification'] += _move(
+                db, notification, archive_tables['notification'],
+                db.or_(notification.c.story_id.in_(story_ids), notification.c.comment_id.in_(comment_ids)), now
+            )
+            for name, fk in STORY_CHILDREN:
+                source = db.metadata.tables[name]
+                counts[name] += _move(db, source, archive_tables[name], source.c[fk].in_(story_ids), now)
+            # 关注关系只在故事更新时用于发通知，归档后不再需要
+            db.session.execute(db.delete(Follow).where(Follow.story_id.in_(story_ids)))
+            story = Story.__table__
+            counts['story'] += _move(db, story, archive_tables['story'], story.c.id.in_(story_ids), now)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return counts
+
+
+def archive_read_notifications(days=ARCHIVE_NOTIFICATION_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    """归档已读且早于 days 天的通知，返回归档行数"""
+    from app import db, Notification, archive_tables
+
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    notification = Notification.__table__
+    total = 0
+    while True:
+        ids = db.session.execute(
+            db.select(Notification.id)
+            .where(Notification.is_read.is_(True), Notification.created_at < cutoff)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        try:
+            total += _move(db, notification, archive_tables['notification'], notification.c.id.in_(ids),
+                           datetime.utcnow())
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return total
+
+
+def run_archive(story_days=ARCHIVE_STORY_DAYS, notification_days=ARCHIVE_NOTIFICATION_DAYS,
+                batch_size=ARCHIVE_BATCH_SIZE):
+    """执行一轮归档（需在 app_context 中调用）"""
+    counts = archive_ended_stories(story_days, batch_size)
+    counts['notification'] = archive_read_notifications(notification_days, batch_size)
+    return counts
+
+
+def load_archived_story(story_id):
+    """按 id 读取已归档的故事，返回与 /api/stories/<id> 相同结构的字典（全部评论一次返回）；不存在时返回 None"""
+    from app import db, User, archive_tables
+
+    story = db.session.execute(
+        db.select(archive_tables['story']).where(archive_tables['story'].c.id == story_id)
+    ).mappings().first()
+    if story is None:
+        return None
+
+    evidence_table = archive_tables['evidence']
+    evidence = db.session.execute(
+        db.select(evidence_table).where(evidence_table.c.story_id == story_id).order_by(evidence_table.c.id)
+    ).mappings().all()
+
+    comment_table = archive_tables['comment']
+    rows = db.session.execute(
+        db.select(comment_table, User.username, User.avatar)
+        .outerjoin(User, User.id == comment_table.c.author_id)
+        .where(comment_table.c.story_id == story_id)
+        .order_by(comment_table.c.id)
+    ).mappings().all()
+
+    comments = {}
+    for row in rows:
+        comments[row['id']] = {
+            'id': row['id'],
+            'content': row['content'],
+            'is_ai_response': row['is_ai_response'],
+            'parent_id': row['parent_id'],
+            'author': {
+                'id': row['author_id'] if row['username'] else None,
+                'username': row['username'] or (story['ai_persona'] if row['is_ai_response'] else 'AI'),
+                'avatar': row['avatar'] or ''
+            },
+            'created_at': row['created_at'].isoformat(),
+            'replies': []
+        }
+    roots = []
+    for comment in comments.values():
+        parent = comments.get(comment['parent_id'])
+        (parent['replies'] if parent else roots).append(comment)
+
+    return {
+        'id': story['id'],
+        'title': story['title'],
+        'content': story['content'],
+        'category': story['category'],
+        'location': story['location'],
+        'is_ai_generated': story['is_ai_generated'],
+        'ai_persona': story['ai_persona'],
+        'current_state': story['current_state'],
+        'created_at': story['created_at'].isoformat(),
+        'views': story['views'] or 0,
+        'archived': True,
+        'evidence': [{
+            'id': e['id'],
+            'type': e['evidence_type'],
+            'file_path': e['file_path'],
+            'description': e['description'],
+            'created_at': e['created_at'].isoformat()
+        } for e in evidence],
+        'comments': roots,
+        'comments_pagination': {
+            'limit': len(roots),
+            'has_more': False,
+            'next_cursor': None,
+            'total': len(comments)
+        }
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='归档完结的故事和已读通知')
+    parser.add_argument('--story-days', type=int, default=ARCHIVE_STORY_DAYS, help='完结多少天后归档故事')
+    parser.add_argument('--notification-days', type=int, default=ARCHIVE_NOTIFICATION_DAYS,
+                        help='已读通知保留天数')
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='每个事务归档的故事/通知数')
+    args = parser.parse_args(argv)
+
+    from app import app
+    with app.app_context():
+        counts = run_archive(args.story_days, args.notification_days, args.batch_size)
+    print(f"📦 归档完成: {counts}")
+    return counts
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+LM Studio 调用开销基准：对比每次启动 curl 进程与共享连接池的 llm_client
+
+本地起一个立即返回固定回复的 OpenAI 兼容桩服务，测的是除模型推理之外的固定开销
+（进程启动、TCP 建连、请求序列化）：
+    python bench_llm_client.py --calls 200 --prompt-chars 2000
+
+--prompt-chars 超过约 128KB 时 curl 会因单个命令行参数过长而无法启动。
+"""
+import argparse
+import json
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import llm_client
+
+REPLY = '我昨晚又听到了那个声音。'
+
+
+class StubServer:
+    """OpenAI 兼容的 /v1/chat/completions 桩服务（HTTP/1.1 长连接），GET /v1/models 列出 models
+
+    statuses 中预置的状态码会依次用于接下来的请求（用于测试重试），用完后返回 200。
+    请求体带 stream=true 时按 chunk_chars 个字符一段、以 SSE 分块返回，每段间隔 chunk_delay 秒。
+    """
+
+    def __init__(self, reply=REPLY, delay=0.0, chunk_chars=2, chunk_delay=0.0, models=('stub-model',)):
+        self.reply = reply
+        self.models = list(models)
+        self.delay = delay
+        self.chunk_chars = chunk_chars
+        self.chunk_delay = chunk_delay
+        self.statuses = []
+        self.requests = []
+        self.connections = set()
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # 头部和正文分两次写出，不关 Nagle 时长连接上每次都会多等一个延迟确认（约 40ms）
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                data = json.dumps({'object': 'list', 'data': [{'id': model, 'object': 'model'}
+                                                              for model in stub.models]}).encode('utf-8')
+                self.send_response(200 if self.path.rstrip('/').endswith('/models') else 404)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with stub.lock:
+                    stub.requests.append(body)
+                    stub.connections.add(self.client_address)
+                    status = stub.statuses.pop(0) if stub.statuses else 200
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if status == 200 and body.get('stream'):
+                    self.send_stream()
+                    return
+                payload = {'choices': [{'message': {'role': 'assistant', 'content': stub.reply}}]}
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8') if status == 200 else b'busy'
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def send_stream(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                pieces = [stub.reply[i:i + stub.chunk_chars] for i in range(0, len(stub.reply), stub.chunk_chars)]
+                for piece in pieces:
+                    chunk = {'choices': [{'delta': {'content': piece}}]}
+                    self.write_chunk(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n')
+                    if stub.chunk_delay:
+                        time.sleep(stub.chunk_delay)
+                self.write_chunk('data: [DONE]\n\n')
+                self.wfile.write(b'0\r\n\r\n')
+
+            def write_chunk(self, text):
+                data = text.encode('utf-8')
+                self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}/v1'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def call_with_curl(url, messages):
+    """改动前的调用方式：每次一个 curl 进程，请求体通过命令行参数传入"""
+    request_data = {'messages': messages, 'temperature': 0.6, 'max_tokens': 200}
+    result = subprocess.run(
+        ['curl', '-s', '-X', 'POST', llm_client.chat_completions_url(url),
+         '-H', 'Content-Type: application/json',
+         '-d', json.dumps(request_data, ensure_ascii=False),
+         '--max-time', '120'],
+        capture_output=True, text=True, timeout=120
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'curl 命令失败: {result.stderr}')
+    return json.loads(result.stdout)['choices'][0]['message']['content']
+
+
+def call_with_client(url, messages):
+    return llm_client.chat(messages, temperature=0.6, max_tokens=200, timeout=120, url=url)
+
+
+def run(label, fn, url, messages, calls):
+    start = time.perf_counter()
+    try:
+        for _ in range(calls):
+            fn(url, messages)
+    except Exception as e:
+        print(f"{label:<12} ❌ {type(e).__name__}: {str(e)[:80]}")
+        return None
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {calls} 次  {elapsed:6.2f} 秒  每次 {elapsed / calls * 1000:7.2f} ms")
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='LM Studio 调用开销：curl 子进程 vs 连接池')
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--prompt-chars', type=int, default=2000, help='用户提示词长度（字符）')
+    args = parser.parse_args(argv)
+
+    messages = [
+        {'role': 'system', 'content': '你是"楼主"，这个都市传说帖子的发起人。'},
+        {'role': 'user', 'content': '网' * args.prompt_chars},
+    ]
+    with StubServer() as stub:
+        curl = run('curl', call_with_curl, stub.url, messages, args.calls)
+        before = len(stub.connections)
+        pooled = run('llm_client', call_with_client, stub.url, messages, args.calls)
+        print(f"llm_client 使用 {len(stub.connections) - before} 个 TCP 连接")
+    if curl and pooled:
+        print(f"⚡ 单次固定开销降低 {curl / pooled:.1f} 倍")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+通知扇出基准测试：一个故事有 N 个关注者时，发一轮通知需要多久
+
+对比两种写法（各自在一个事务中提交）：
+- legacy: 逐个查询关注者 ORM 对象、逐条 db.session.add(Notification(...))（旧实现）
+- bulk:   create_notifications_for_followers —— 一条查询取接收人 + 一条 executemany INSERT
+
+使用临时 SQLite 数据库，不影响本地数据：
+    python bench_notification_fanout.py --followers 10000 --rounds 3
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+_bench_dir = tempfile.mkdtemp(prefix='urban_legends_bench_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_bench_dir, 'bench.db')
+os.environ['USE_LM_STUDIO'] = 'false'
+
+from datetime import datetime  # noqa: E402
+
+from app import app, db, User, Story, Comment, Follow, Notification, create_notifications_for_followers  # noqa: E402
+
+
+def seed(followers):
+    story = Story(title='扇出基准测试', content='测试通知扇出', category='subway_ghost')
+    db.session.add(story)
+    db.session.flush()
+
+    now = datetime.utcnow()
+    db.session.execute(db.insert(User), [
+        {'username': f'bench_user_{i}', 'email': f'bench_{i}@example.com', 'password_hash': 'x', 'avatar': '', 'created_at': now}
+        for i in range(followers)
+    ])
+    user_ids = db.session.execute(db.select(User.id).where(User.username.like('bench_user_%'))).scalars().all()
+    db.session.execute(db.insert(Follow), [
+        {'user_id': user_id, 'story_id': story.id, 'created_at': now} for user_id in user_ids
+    ])
+
+    comment = Comment(content='触发通知的评论', story_id=story.id, author_id=user_ids[0])
+    db.session.add(comment)
+    db.session.commit()
+    return story.id, comment.id
+
+
+def legacy_fanout(story, comment):
+    """旧实现：ORM 逐条构造（保留在这里仅用于对比）"""
+    followers = Follow.query.filter_by(story_id=story.id).all()
+    for follow in followers:
+        if follow.user_id == comment.author_id:
+            continue
+        db.session.add(Notification(
+            user_id=follow.user_id,
+            story_id=story.id,
+            comment_id=comment.id,
+            notification_type='new_reply',
+            notification_category='comment',
+            content=f'你关注的故事 "{story.title}" 有了新回复。'
+        ))
+
+
+def bulk_fanout(story, comment):
+    create_notifications_for_followers(story, comment)
+
+
+def measure(fanout, story_id, comment_id, rounds):
+    timings = []
+    for _ in range(rounds):
+        db.session.expunge_all()
+        story, comment = db.session.get(Story, story_id), db.session.get(Comment, comment_id)
+        start = time.perf_counter()
+        fanout(story, comment)
+        db.session.commit()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='通知扇出基准测试')
+    parser.add_argument('--followers', type=int, default=10000, help='关注者数量')
+    parser.add_argument('--rounds', type=int, default=3, help='每种写法重复次数')
+    args = parser.parse_args()
+
+    with app.app_context():
+        print(f"📂 临时数据库: {_bench_dir}")
+        print(f"👥 准备 {args.followers} 个关注者...")
+        story_id, comment_id = seed(args.followers)
+
+        results = {}
+        for name, fanout in (('legacy', legacy_fanout), ('bulk', bulk_fanout)):
+            timings = measure(fanout, story_id, comment_id, args.rounds)
+            results[name] = statistics.median(timings)
+            print(f"   {name:<7} 中位数 {results[name] * 1000:8.1f} ms  ({', '.join(f'{t * 1000:.1f}' for t in timings)})")
+
+        total = db.session.query(db.func.count(Notification.id)).scalar()
+        print(f"📨 共写入 {total} 条通知")
+        print(f"⚡ bulk 相比 legacy 快 {results['legacy'] / results['bulk']:.1f} 倍")
+
+
+if __name__ == '__main__':
+    main()
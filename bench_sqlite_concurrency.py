@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+SQLite 并发压测：混合读写下对比默认配置与 sqlite_profile（WAL + busy_timeout 等）
+
+模拟请求线程读评论、后台线程（AI 回复/证据/定时任务）写评论和计数：
+    python bench_sqlite_concurrency.py --readers 8 --writers 4 --seconds 5
+
+每种配置使用独立的临时数据库文件。
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+import sqlite_profile
+
+SCHEMA = [
+    "CREATE TABLE story (id INTEGER PRIMARY KEY, title TEXT, comments_count INTEGER DEFAULT 0)",
+    "CREATE TABLE comment (id INTEGER PRIMARY KEY, story_id INTEGER, content TEXT, created_at DATETIME)",
+    "CREATE INDEX ix_comment_story_id ON comment (story_id)",
+]
+STORIES = 20
+
+
+def make_engine(tuned):
+    path = os.path.join(tempfile.mkdtemp(prefix='urban_legends_sqlite_bench_'), 'bench.db')
+    url = 'sqlite:///' + path
+    if tuned:
+        engine = create_engine(url, **sqlite_profile.engine_options(url))
+        event.listen(engine, 'connect', lambda conn, record: sqlite_profile.apply_pragmas(conn))
+    else:
+        # 与改动前一致：回滚日志模式，sqlite3 默认 5 秒超时，默认连接池
+        engine = create_engine(url, connect_args={'check_same_thread': False})
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO story (id, title) VALUES (:id, :title)"),
+                     [{'id': i, 'title': f'story {i}'} for i in range(1, STORIES + 1)])
+    return engine
+
+
+def reader(engine, stop, stats, lock, index):
+    reads = errors = 0
+    story_id = index % STORIES + 1
+    while not stop.is_set():
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT comments_count FROM story WHERE id = :id"), {'id': story_id}).scalar()
+                conn.execute(text(
+                    "SELECT id, content FROM comment WHERE story_id = :id ORDER BY id DESC LIMIT 20"
+                ), {'id': story_id}).fetchall()
+            reads += 1
+        except OperationalError:
+            errors += 1
+    with lock:
+        stats['reads'] += reads
+        stats['read_errors'] += errors
+
+
+def writer(engine, stop, stats, lock, index):
+    writes = errors = 0
+    story_id = index % STORIES + 1
+    while not stop.is_set():
+        try:
+            with engine.begin() as conn:
+                # 与 ORM 写路径一致：同一事务里先读后写
+                conn.execute(text("SELECT comments_count FROM story WHERE id = :id"), {'id': story_id}).scalar()
+                conn.execute(text(
+                    "INSERT INTO comment (story_id, content, created_at) VALUES (:id, :content, CURRENT_TIMESTAMP)"
+                ), {'id': story_id, 'content': '压测评论' * 10})
+                conn.execute(text(
+                    "UPDATE story SET comments_count = comments_count + 1 WHERE id = :id"
+                ), {'id': story_id})
+            writes += 1
+        except OperationalError:
+            errors += 1
+    with lock:
+        stats['writes'] += writes
+        stats['write_errors'] += errors
+
+
+def run(engine, readers, writers, seconds):
+    stats = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+    threads = [threading.Thread(target=reader, args=(engine, stop, stats, lock, i)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(engine, stop, stats, lock, i)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    stats['seconds'] = seconds
+    return stats
+
+
+def report(name, stats):
+    seconds = stats['seconds']
+    print(f"   {name:<8} 读 {stats['reads'] / seconds:9.0f}/s   写 {stats['writes'] / seconds:7.0f}/s   "
+          f"锁错误 读 {stats['read_errors']} / 写 {stats['write_errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite 混合读写压测')
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"🧪 {args.readers} 个读线程 + {args.writers} 个写线程，各跑 {args.seconds} 秒")
+    for name, tuned in (('default', False), ('profile', True)):
+        engine = make_engine(tuned)
+        report(name, run(engine, args.readers, args.writers, args.seconds))
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
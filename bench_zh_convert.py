@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+繁简转换吞吐基准：内置 zh_convert 对照表 vs OpenCC（已安装时）
+
+    python bench_zh_convert.py --chars 200000 --repeat 5
+
+原来没装 OpenCC 时每次转换都要调用一次 LM Studio（单次数秒到 30 秒以上），这里只对比本地转换。
+"""
+import argparse
+import time
+
+import zh_convert
+
+SAMPLE = (
+    '我們公司樓下那個舊電梯，每天晚上十二點以後總會自己停在四樓。保安說那層樓早就沒人住了，'
+    '可是監控裡偶爾能看到一個穿著灰色衣服的人站在門口，頭髮很長，一動不動。'
+    '我藉口加班留下來，想瞭解到底是怎麼回事。鐘錶店的老闆告訴我，乾脆別管這些事情，'
+    '袖裏乾坤，誰也說不清。後來我發現電梯按鈕上有一層乾淨的手印，像是剛剛有人按過。'
+)
+
+
+def run(label, convert, text, repeat):
+    convert(text)  # 预热
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        convert(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<10} {len(text)} 字  {best * 1000:8.2f} ms  {len(text) / best / 1e6:6.2f} M 字/秒")
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='繁简转换吞吐（字/秒）')
+    parser.add_argument('--chars', type=int, default=200000, help='测试文本长度（字符）')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    text = (SAMPLE * (args.chars // len(SAMPLE) + 1))[:args.chars]
+    builtin = run('zh_convert', zh_convert.to_simplified, text, args.repeat)
+    try:
+        from opencc import OpenCC
+    except ImportError:
+        print('opencc      未安装，跳过')
+        return
+    opencc = run('opencc', OpenCC('t2s').convert, text, args.repeat)
+    print(f"⚡ zh_convert 是 OpenCC 的 {opencc / builtin:.1f} 倍")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""pytest 公共配置：测试使用临时 SQLite 数据库，不连接本地 LM Studio
+
+必须在导入 app 之前设置环境变量（app 在导入时即创建数据库连接和默认数据）。
+设置 TEST_DATABASE_URL 时改用该数据库（如 generate_synthetic_data.py 生成的规模测试库）。
+create_story / create_user 是各测试共用的建数据工厂（fixture 内才导入 app）。
+"""
+import os
+import tempfile
+
+import pytest
+
+_test_dir = tempfile.mkdtemp(prefix='urban_legends_test_')
+os.environ['DATABASE_URL'] = os.getenv('TEST_DATABASE_URL') or 'sqlite:///' + os.path.join(_test_dir, 'test.db')
+os.environ['USE_LM_STUDIO'] = 'false'
+# 楼主回复默认延迟 60 秒，测试里立即生成
+os.environ['AI_REPLY_DELAY_SECONDS'] = '0'
+
+
+@pytest.fixture
+def create_story():
+    """工厂：在独立的 app_context 里创建并提交一个故事，返回 id
+
+    initialize_state=True 时按 AI 故事的方式写入初始状态和 story_state_event。
+    """
+    from app import app, db, Story
+    import story_engine
+
+    def create(title, content=None, initialize_state=False, **fields):
+        with app.app_context():
+            story = Story(title=title, content=content or f'{title}的内容', **fields)
+            db.session.add(story)
+            db.session.flush()
+            if initialize_state:
+                story_engine.initialize_story_state(story)
+            db.session.commit()
+            return story.id
+
+    return create
+
+
+@pytest.fixture
+def create_user():
+    """工厂：创建并提交一个用户（邮箱由用户名生成），返回 id"""
+    from app import app, db, User
+
+    def create(username):
+        with app.app_context():
+            user = User(username=username, email=f'{username}@example.com', password_hash='x')
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+
+    return create
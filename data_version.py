@@ -0,0 +1,155 @@
+"""
+数据版本号（用于 ETag 协商缓存）
+
+监听 SQLAlchemy 会话：只要一次提交里写入过被跟踪的表（story / comment / evidence），
+就在同一个事务里把 data_version 表中该名字的版本号 +1。读接口用「启动令牌 + 版本号」生成弱 ETag，
+版本号没变就直接返回 304，不必查询数据库、拼装 JSON。
+
+- ORM 对象的增删改在 after_flush 中识别；
+- session.execute(update/delete/insert) 这类批量语句在 do_orm_execute 中识别；
+- 不属于内容变化的写入（如浏览量回写）可带执行选项 skip_data_version=True 跳过；
+- 版本号变化时调用 on_change 注册的回调（如清空响应缓存）。
+
+版本号存在数据库里，其他进程的写入也会推进它：通过 app 会话写入的工具（archive.py 等）自动递增，
+直接用 Connection 写入的工具（generate_synthetic_data.py、python -m migrations）调用 bump_shared()。
+本进程提交后立即更新内存中的版本号；其他进程的变更最多 DATA_VERSION_POLL_SECONDS 秒后读到。
+启动令牌保证重启后旧 ETag 失效。
+"""
+import os
+import secrets
+import threading
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+POLL_SECONDS = float(os.getenv('DATA_VERSION_POLL_SECONDS', 1))
+DEFAULT_NAME = 'content'
+
+_SESSION_FLAG = 'data_version_changed'
+_SESSION_VERSION = 'data_version_committed'
+
+_BUMP_SQL = text(
+    "INSERT INTO data_version (name, version) VALUES (:name, 1) "
+    "ON CONFLICT (name) DO UPDATE SET version = version + 1 RETURNING version"
+)
+_READ_SQL = text("SELECT version FROM data_version WHERE name = :name")
+
+
+def bump_shared(conn, name=DEFAULT_NAME):
+    """在 conn 的当前事务里把共享版本号 +1，返回新版本号（供不经过 app 会话写数据的工具调用）"""
+    return conn.execute(_BUMP_SQL, {'name': name}).scalar()
+
+
+class DataVersion:
+    """被跟踪表的全局变更序号（保存在 data_version 表中，多进程共享）"""
+
+    def __init__(self, tables, name=DEFAULT_NAME, poll_interval=POLL_SECONDS):
+        self._tables = frozenset(tables)
+        self._name = name
+        self._poll_interval = poll_interval
+        self._engine = None
+        self._version = 0
+        self._polled_at = 0.0
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._boot = secrets.token_hex(4)
+        self._listeners = []
+
+        event.listen(Session, 'after_flush', self._after_flush)
+        event.listen(Session, 'do_orm_execute', self._do_orm_execute)
+        event.listen(Session, 'before_commit', self._before_commit)
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_rollback', self._after_rollback)
+
+    def bind(self, engine):
+        """指定读取共享版本号的数据库（在建表/迁移完成后调用），并立即读取一次"""
+        self._engine = engine
+        self._polled_at = 0.0
+        self._poll()
+
+    @property
+    def value(self):
+        self._poll()
+        return self._version
+
+    def etag(self, *parts):
+        """生成 ETag 值（不含 W/ 前缀和引号），parts 用于区分同一版本下的不同表示"""
+        return '-'.join([self._boot, str(self.value)] + [str(p) for p in parts])
+
+    def bump(self):
+        """不经过会话提交、直接递增共享版本号"""
+        with self._engine.begin() as conn:
+            version = bump_shared(conn, self._name)
+        self._advance(version)
+        return version
+
+    def on_change(self, listener):
+        """注册版本号变化回调（在发现变化的线程中调用：本进程提交或轮询到其他进程的变更）"""
+        self._listeners.append(listener)
+        return listener
+
+    def _advance(self, version):
+        with self._lock:
+            # 轮询和提交可能交错返回，只向前推进
+            if version is None or version <= self._version:
+                return
+            self._version = version
+        for listener in self._listeners:
+            try:
+                listener(version)
+            except Exception as e:
+                print(f"[data_version] 变更回调失败: {e}")
+
+    def _poll(self):
+        """每 poll_interval 秒读一次共享版本号；同时只有一个线程去读，其余直接用内存中的值"""
+        if self._engine is None or time.monotonic() - self._polled_at < self._poll_interval:
+            return
+        if not self._poll_lock.acquire(blocking=False):
+            return
+        try:
+            with self._engine.connect() as conn:
+                version = conn.execute(_READ_SQL, {'name': self._name}).scalar()
+            self._polled_at = time.monotonic()
+            self._advance(version or 0)
+        except Exception as e:
+            print(f"[data_version] 读取版本号失败: {e}")
+        finally:
+            self._poll_lock.release()
+
+    def _tracks(self, table):
+        return table is not None and getattr(table, 'name', None) in self._tables
+
+    def _after_flush(self, session, flush_context):
+        if session.info.get(_SESSION_FLAG):
+            return
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if self._tracks(getattr(obj, '__table__', None)):
+                if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+                    continue
+                session.info[_SESSION_FLAG] = True
+                return
+
+    def _do_orm_execute(self, orm_execute_state):
+        if orm_execute_state.is_select:
+            return
+        if orm_execute_state.execution_options.get('skip_data_version'):
+            return
+        if self._tracks(getattr(orm_execute_state.statement, 'table', None)):
+            orm_execute_state.session.info[_SESSION_FLAG] = True
+
+    def _before_commit(self, session):
+        # 先 flush，未刷出的对象变更才能在这里被识别；版本号与数据在同一个事务里提交
+        if session.new or session.dirty or session.deleted:
+            session.flush()
+        if session.info.pop(_SESSION_FLAG, False):
+            session.info[_SESSION_VERSION] = bump_shared(session.connection(), self._name)
+
+    def _after_commit(self, session):
+        version = session.info.pop(_SESSION_VERSION, None)
+        if version is not None:
+            self._advance(version)
+
+    def _after_rollback(self, session):
+        session.info.pop(_SESSION_FLAG, None)
+        session.info.pop(_SESSION_VERSION, None)
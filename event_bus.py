@@ -0,0 +1,81 @@
+"""
+进程内事件总线（为 /api/events SSE 推送服务）
+
+每个 SSE 连接是一个订阅者，拥有自己的有界队列。publish 只做非阻塞投递：
+队列满了不会拖慢写请求，而是标记该订阅者「溢出」，由推送端通知客户端整体刷新。
+
+事件分两类：
+- 广播（user_ids=None）：新故事、新评论、AI 回复、证据生成完成，所有在线读者都会收到；
+- 定向（user_ids=[...]）：通知，只投递给对应用户的连接。
+
+订阅者只存在于当前进程内存中，适用于当前单进程部署。
+"""
+import itertools
+import json
+import queue
+import threading
+
+
+class Subscription:
+    """单个 SSE 连接的事件队列"""
+
+    def __init__(self, user_id=None, maxsize=100):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def get(self, timeout):
+        """等待下一条事件，超时返回 None（用于发送心跳）"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """发布/订阅：按用户把事件投递到各个连接的队列"""
+
+    def __init__(self, queue_size=100):
+        self._queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, user_id=None):
+        sub = Subscription(user_id=user_id, maxsize=self._queue_size)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event_type, data, user_ids=None):
+        """投递事件，返回投递到的连接数；user_ids 为 None 表示广播"""
+        event = {'id': next(self._ids), 'type': event_type, 'data': data}
+        targets = None if user_ids is None else set(user_ids)
+
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        delivered = 0
+        for sub in subscribers:
+            if targets is not None and sub.user_id not in targets:
+                continue
+            try:
+                sub.queue.put_nowait(event)
+                delivered += 1
+            except queue.Full:
+                sub.overflowed = True
+        return delivered
+
+
+def format_sse(event):
+    """把事件编码成 SSE 报文"""
+    payload = json.dumps(event['data'], ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+规模测试数据生成器：向一个独立的 SQLite 数据库批量写入生产量级的用户、故事、评论、关注和通知
+
+    python generate_synthetic_data.py --stories 100000 --comments 5000000 \\
+        --notifications 1000000 --follows 50000 --database-url sqlite:////tmp/urban_legends_scale.db
+
+- 表结构由 app.py 的模型建出（导入 app 时 create_all + 迁移），文本来自
+  generate_realistic_username / generate_contextual_comment，不调用模型
+- 主键预先分配，各表按 --batch-size 一条 executemany 写入并逐批提交；导入前删除
+  故事/评论/通知的二级索引和全文检索的 INSERT 触发器，导入完成后一次性重建；
+  冗余计数列（comments_count 等）和 user_stats 在生成时直接算好，不需要事后重算
+- 导入期间关闭 synchronous，结束后执行 ANALYZE
+
+生成后，基准测试和执行计划测试可以直接跑在这份数据上：
+    TEST_DATABASE_URL=sqlite:////tmp/urban_legends_scale.db python -m pytest -q test_query_plans.py
+"""
+import argparse
+import json
+import os
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+DEFAULT_DATABASE = os.path.join(os.getcwd(), 'synthetic_data.db')
+
+# 每个故事预先生成的评论文本数，评论从中抽取（generate_contextual_comment 按故事关键词挑模板）
+COMMENT_TEXTS_PER_STORY = 8
+REPLY_RATIO = 0.3
+AI_RESPONSE_RATIO = 0.15
+READ_RATIO = 0.7
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def next_id(conn, table):
+    return (conn.exec_driver_sql(f"SELECT COALESCE(MAX(id), 0) FROM {table}").scalar() or 0) + 1
+
+
+def spread(total, buckets, rng):
+    """把 total 条记录按长尾分布分给 buckets 个故事（少数热门故事评论很多）"""
+    if buckets == 0:
+        return []
+    weights = [rng.paretovariate(1.2) for _ in range(buckets)]
+    scale = total / sum(weights)
+    counts = [int(w * scale) for w in weights]
+    for i in rng.sample(range(buckets), min(buckets, total - sum(counts))):
+        counts[i] += 1
+    return counts
+
+
+def drop_indexes(engine, tables):
+    """导入前删掉二级索引（随机顺序插入 B 树很慢），返回待重建的索引"""
+    indexes = [index for table in tables for index in table.indexes]
+    with engine.begin() as conn:
+        for index in indexes:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+    return indexes
+
+
+def create_indexes(engine, indexes, verbose=True):
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        for index in indexes:
+            index.create(conn, checkfirst=True)
+    if verbose:
+        print(f"✅ 重建 {len(indexes)} 个索引  {time.perf_counter() - start:7.1f} 秒")
+
+
+class Loader:
+    def __init__(self, engine, batch_size, verbose=True):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.verbose = verbose
+        self.timings = {}
+
+    def insert(self, table, rows):
+        """按批写入生成器产生的行，每批一个事务；返回写入行数"""
+        start = time.perf_counter()
+        total = 0
+        for batch in batched(rows, self.batch_size):
+            with self.engine.begin() as conn:
+                conn.exec_driver_sql("PRAGMA synchronous = OFF")
+                conn.execute(table.insert(), batch)
+            total += len(batch)
+            if self.verbose and total % (self.batch_size * 50) == 0:
+                print(f"   {table.name}: {total} ...")
+        elapsed = time.perf_counter() - start
+        self.timings[table.name] = (total, elapsed)
+        if self.verbose:
+            print(f"✅ {table.name:<14} {total:>9} 行  {elapsed:7.1f} 秒  ({total / max(elapsed, 1e-9):,.0f} 行/秒)")
+        return total
+
+
+def load(engine, users=20000, stories=100000, comments=5000000, notifications=1000000, follows=50000,
+         batch_size=10000, seed=42, verbose=True):
+    """生成并写入数据，返回 {表名: (行数, 秒)}"""
+    from app import (
+        db, User, Story, Comment, Follow, Notification, UserStats,
+        generate_realistic_username, generate_contextual_comment
+    )
+    from ai_engine import LEGEND_CATEGORIES, CITY_LOCATIONS
+    from story_engine import STORY_STATES
+    import data_version
+    import search_index
+
+    rng = random.Random(seed)
+    random.seed(seed)  # generate_realistic_username / generate_contextual_comment 使用全局 random
+    loader = Loader(engine, batch_size, verbose)
+    now = datetime.utcnow()
+    with engine.connect() as conn:
+        first_user, first_story, first_comment, first_notification = (
+            next_id(conn, name) for name in ('user', 'story', 'comment', 'notification')
+        )
+    run_tag = f'{seed}_{first_user}'
+    indexes = drop_indexes(engine, [Story.__table__, Comment.__table__, Notification.__table__])
+    search_index.drop_insert_triggers(engine)
+
+    # 用户
+    user_ids = list(range(first_user, first_user + users))
+    loader.insert(User.__table__, (
+        {'id': user_id, 'username': f'{generate_realistic_username()}#{run_tag}_{i}',
+         'email': f'synthetic_{run_tag}_{i}@example.com', 'password_hash': 'x', 'avatar': '',
+         'created_at': now - timedelta(days=rng.randint(0, 1000))}
+        for i, user_id in enumerate(user_ids)
+    ))
+
+    # 故事（评论数预先分配，计数列直接写入）
+    story_ids = list(range(first_story, first_story + stories))
+    comment_counts = spread(comments, stories, rng)
+    story_times = {}
+    story_text = {}
+    states = list(STORY_STATES)
+
+    def story_rows():
+        for i, story_id in enumerate(story_ids):
+            created = now - timedelta(minutes=rng.randint(0, 60 * 24 * 730))
+            state = rng.choice(states)
+            category = rng.choice(LEGEND_CATEGORIES)
+            title = f'{rng.choice(CITY_LOCATIONS)}的怪事 #{story_id}'
+            content = f'{title}。深夜地铁车厢里的镜子、走廊的脚步声和{category}有关的传闻……'
+            story_times[story_id] = created
+            story_text[story_id] = (title, content)
+            yield {
+                'id': story_id, 'title': title, 'content': content, 'category': category,
+                'location': rng.choice(CITY_LOCATIONS), 'is_ai_generated': rng.random() < 0.5,
+                'ai_persona': generate_realistic_username(), 'current_state': state,
+                'next_transition_time': None if state == 'ended' else created + timedelta(hours=rng.randint(1, 48)),
+                'user_interaction_count': rng.randint(0, 9), 'evidence_generated': 0,
+                'created_at': created, 'updated_at': created, 'views': rng.randint(0, 5000),
+                'comments_count': comment_counts[i], 'user_comments_count': 0, 'evidence_count': 0,
+            }
+
+    loader.insert(Story.__table__, story_rows())
+
+    # 评论：按故事顺序生成，回复指向同一故事里更早的评论
+    user_comment_totals = Counter()
+    story_user_comments = Counter()
+
+    def comment_rows():
+        comment_id = first_comment
+        for story_id, count in zip(story_ids, comment_counts):
+            if not count:
+                continue
+            title, content = story_text[story_id]
+            texts = [generate_contextual_comment(title, content, []) for _ in range(COMMENT_TEXTS_PER_STORY)]
+            first_in_story = comment_id
+            created = story_times[story_id]
+            for _ in range(count):
+                is_ai = rng.random() < AI_RESPONSE_RATIO
+                author_id = None if is_ai else rng.choice(user_ids)
+                parent_id = None
+                if comment_id > first_in_story and rng.random() < REPLY_RATIO:
+                    parent_id = rng.randint(first_in_story, comment_id - 1)
+                created = created + timedelta(seconds=rng.randint(1, 3600))
+                if author_id:
+                    user_comment_totals[author_id] += 1
+                    story_user_comments[story_id] += 1
+                yield {
+                    'id': comment_id, 'content': rng.choice(texts), 'story_id': story_id, 'author_id': author_id,
+                    'parent_id': parent_id, 'is_ai_response': is_ai, 'created_at': created,
+                }
+                comment_id += 1
+
+    loader.insert(Comment.__table__, comment_rows())
+
+    # 用户评论数在生成评论时才知道，按主键 executemany 回填
+    start = time.perf_counter()
+    story_table = Story.__table__
+    with engine.begin() as conn:
+        conn.execute(
+            story_table.update().where(story_table.c.id == db.bindparam('story_id')),
+            [{'story_id': story_id, 'user_comments_count': total} for story_id, total in story_user_comments.items()]
+        )
+    if verbose:
+        print(f"✅ {'story 计数':<14} {len(story_user_comments):>9} 行  {time.perf_counter() - start:7.1f} 秒")
+
+    # 关注：去重的 (user_id, story_id)
+    follows = min(follows, users * stories)
+    pairs = set()
+    while len(pairs) < follows:
+        pairs.add((rng.choice(user_ids), rng.choice(story_ids)))
+    loader.insert(Follow.__table__, (
+        {'user_id': user_id, 'story_id': story_id, 'created_at': story_times[story_id]}
+        for user_id, story_id in pairs
+    ))
+
+    # 通知
+    loader.insert(Notification.__table__, (
+        {'id': notification_id, 'user_id': rng.choice(user_ids), 'story_id': story_id, 'comment_id': None,
+         'notification_type': 'new_reply', 'notification_category': 'comment',
+         'content': f'你关注的故事 "{story_text[story_id][0]}" 有了新回复。',
+         'is_read': rng.random() < READ_RATIO,
+         'created_at': story_times[story_id] + timedelta(minutes=rng.randint(1, 60 * 24 * 30))}
+        for notification_id, story_id in (
+            (first_notification + i, rng.choice(story_ids)) for i in range(notifications)
+        )
+    ))
+
+    # 个人资料统计
+    loader.insert(UserStats.__table__, (
+        {'user_id': user_id, 'total_clicks': 0, 'total_comments': total,
+         'top_categories': json.dumps([]), 'updated_at': now}
+        for user_id, total in user_comment_totals.items()
+    ))
+
+    create_indexes(engine, indexes, verbose)
+    start = time.perf_counter()
+    if search_index.init_search_index(engine):
+        search_index.rebuild_search_index(engine)
+        if verbose:
+            print(f"✅ 重建全文索引  {time.perf_counter() - start:7.1f} 秒")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+        # 直接用 Connection 写入，不经过会话钩子：手动推进共享版本号，运行中的服务刷新 ETag 和列表缓存
+        data_version.bump_shared(conn)
+    return loader.timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量生成规模测试数据')
+    parser.add_argument('--database-url', default='sqlite:///' + DEFAULT_DATABASE,
+                        help=f'目标数据库（默认 {DEFAULT_DATABASE}）')
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--stories', type=int, default=100000)
+    parser.add_argument('--comments', type=int, default=5000000)
+    parser.add_argument('--notifications', type=int, default=1000000)
+    parser.add_argument('--follows', type=int, default=50000)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    if args.database_url.endswith('ai_urban_legends.db'):
+        parser.error('不要向应用的正式数据库写入测试数据，请指定一个新的 --database-url')
+
+    # 必须在导入 app 之前设置（app 导入时即按 DATABASE_URL 建表）
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ['USE_LM_STUDIO'] = 'false'
+    from app import app, db
+
+    print(f"📂 目标数据库: {args.database_url}")
+    start = time.perf_counter()
+    with app.app_context():
+        engine = db.engine
+    load(engine, args.users, args.stories, args.comments, args.notifications, args.follows,
+         args.batch_size, args.seed)
+    print(f"⏱️  总耗时 {time.perf_counter() - start:.1f} 秒")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+后台任务队列
+
+耗时的管理操作（如重置 AI 故事：批量删除 + 多次调用模型）不在 HTTP 请求里同步执行，
+而是提交到线程池，接口立即返回任务 id，再通过状态接口查询进度和结果。
+任务状态只保存在进程内存中，保留最近 history 条。
+"""
+import threading
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class JobQueue:
+    """按提交顺序执行任务的线程池 + 任务状态表"""
+
+    def __init__(self, max_workers=1, history=50, name='jobs'):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._history = history
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, unique=False, **kwargs):
+        """提交任务，返回任务状态快照
+
+        unique=True 时，若同类任务仍在排队或执行，直接返回该任务而不重复提交。
+        """
+        with self._lock:
+            if unique:
+                for job in self._jobs.values():
+                    if job['kind'] == kind and job['status'] in (QUEUED, RUNNING):
+                        return dict(job)
+            job = {
+                'id': uuid.uuid4().hex,
+                'kind': kind,
+                'status': QUEUED,
+                'result': None,
+                'error': None,
+                'created_at': datetime.utcnow().isoformat(),
+                'started_at': None,
+                'finished_at': None,
+            }
+            self._jobs[job['id']] = job
+            self._trim()
+            snapshot = dict(job)
+        self._executor.submit(self._run, job['id'], fn, args, kwargs)
+        return snapshot
+
+    def get(self, job_id):
+        """任务状态快照；未知或已淘汰的任务返回 None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def _run(self, job_id, fn, args, kwargs):
+        self._update(job_id, status=RUNNING, started_at=datetime.utcnow().isoformat())
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            self._update(job_id, status=FAILED, error=str(e), finished_at=datetime.utcnow().isoformat())
+        else:
+            self._update(job_id, status=SUCCEEDED, result=result, finished_at=datetime.utcnow().isoformat())
+
+    def _trim(self):
+        # 只淘汰已结束的任务
+        while len(self._jobs) > self._history:
+            for job_id, job in self._jobs.items():
+                if job['status'] in (SUCCEEDED, FAILED):
+                    del self._jobs[job_id]
+                    break
+            else:
+                return
@@ -0,0 +1,293 @@
+"""
+LM Studio（OpenAI 兼容接口）客户端
+
+ai_engine 中所有对本地模型的调用共用一个 httpx.Client：
+- 连接池保持长连接，不再为每次调用启动 curl 进程、重新建立 TCP 连接
+- 请求体直接作为 HTTP body 发送，长提示词不受命令行参数长度限制
+- 每次调用单独指定超时；连接失败和 502/503/504（模型加载中、服务过载）按退避重试，
+  读超时不重试（生成很慢时重试只会加重负载）
+
+所有调用先经过 dispatcher 排队：同时在跑的请求不超过 LLM_MAX_CONCURRENT，
+其余按到达顺序排队；队列已满或排队超时立即抛出 LLMBusy，调用方回退到模板回复，
+而不是把请求继续压给 LM Studio 换来 503。
+
+传入 on_delta 时以流式（stream=true）方式调用，模型每输出一段就回调一次，
+用于把 AI 楼主的回复逐字推给前端；此时 timeout 是相邻两段输出之间的最长等待。
+
+LM_STUDIO_URL 带不带 /v1 后缀均可。
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import httpx
+
+DEFAULT_BASE_URL = 'http://localhost:1234/v1'
+
+CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT_SECONDS', 5))
+MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 2))
+RETRY_BACKOFF = float(os.getenv('LLM_RETRY_BACKOFF_SECONDS', 0.5))
+MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', 10))
+KEEPALIVE_SECONDS = float(os.getenv('LLM_KEEPALIVE_SECONDS', 60))
+
+MAX_CONCURRENT = int(os.getenv('LLM_MAX_CONCURRENT', 2))
+MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', 20))
+QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT_SECONDS', 60))
+
+RETRY_STATUS = (502, 503, 504)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    """模型调用失败（连接失败、HTTP 错误状态、超时或响应格式不对）"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LLMBusy(LLMError):
+    """排队已满或排队超时，请求没有发给模型"""
+
+
+class Dispatcher:
+    """限制同时进行的模型请求数，超出的按到达顺序在有界队列里等待"""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT, max_queue=MAX_QUEUE, queue_timeout=QUEUE_TIMEOUT,
+                 name='llm'):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._name = name
+        self._cond = threading.Condition()
+        self._waiters = deque()
+        self._running = 0
+        self._peak_queued = 0
+        self._admitted = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._waits = deque(maxlen=1000)
+
+    @contextmanager
+    def slot(self, queue_timeout=None):
+        """占用一个并发名额直到 with 块结束；拿不到名额时抛出 LLMBusy"""
+        self._acquire(self.queue_timeout if queue_timeout is None else queue_timeout)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._completed += 1
+                self._cond.notify_all()
+
+    def _acquire(self, timeout):
+        with self._cond:
+            if self._running < self.max_concurrent and not self._waiters:
+                self._admit(0.0)
+                return
+            if len(self._waiters) >= self.max_queue:
+                self._rejected += 1
+                raise LLMBusy(f'模型请求排队已满（{self.max_queue}），放弃本次调用')
+
+            token = object()
+            self._waiters.append(token)
+            self._peak_queued = max(self._peak_queued, len(self._waiters))
+            start = time.monotonic()
+            ready = self._cond.wait_for(
+                lambda: self._waiters[0] is token and self._running < self.max_concurrent, timeout=timeout
+            )
+            self._waiters.remove(token)
+            if not ready:
+                self._timed_out += 1
+                self._cond.notify_all()
+                raise LLMBusy(f'模型请求排队超过 {timeout:g} 秒，放弃本次调用')
+            self._admit(time.monotonic() - start)
+            # 名额可能不止一个，让下一个排队者也检查一次
+            self._cond.notify_all()
+
+    def _admit(self, waited):
+        self._running += 1
+        self._admitted += 1
+        self._waits.append(waited)
+
+    def stats(self):
+        with self._cond:
+            waits = sorted(self._waits) or [0.0]
+            return {
+                'name': self._name,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'queue_timeout_seconds': self.queue_timeout,
+                'running': self._running,
+                'queued': len(self._waiters),
+                'peak_queued': self._peak_queued,
+                'admitted': self._admitted,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+                # 最近 1000 个请求的排队时间
+                'wait_ms': {
+                    'avg': round(sum(waits) / len(waits) * 1000, 1),
+                    'p95': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1),
+                    'max': round(waits[-1] * 1000, 1),
+                },
+            }
+
+
+dispatcher = Dispatcher()
+
+
+def base_url():
+    return os.getenv('LM_STUDIO_URL', DEFAULT_BASE_URL)
+
+
+def chat_completions_url(url=None):
+    """http://host:1234 或 http://host:1234/v1 → http://host:1234/v1/chat/completions"""
+    url = (url or base_url()).rstrip('/')
+    if url.endswith('/v1'):
+        url = url[:-3]
+    return f'{url}/v1/chat/completions'
+
+
+def models_url(url=None):
+    """http://host:1234 或 http://host:1234/v1 → http://host:1234/v1/models"""
+    return chat_completions_url(url)[:-len('/chat/completions')] + '/models'
+
+
+def list_models(url=None, timeout=5):
+    """GET /v1/models，返回服务端列出的模型 id（按返回顺序）；失败时抛出 LLMError"""
+    try:
+        response = get_client().get(models_url(url), timeout=httpx.Timeout(timeout, connect=min(CONNECT_TIMEOUT, timeout)))
+    except httpx.HTTPError as e:
+        raise LLMError(f'{type(e).__name__}: {e}') from e
+    if response.status_code != 200:
+        raise LLMError(f'HTTP {response.status_code}: {response.text[:200]}', response.status_code)
+    try:
+        return [model['id'] for model in response.json()['data']]
+    except (ValueError, KeyError, TypeError) as e:
+        raise LLMError(f'响应格式错误: {response.text[:200]}') from e
+
+
+def get_client():
+    """进程内共享的 httpx.Client（线程安全，首次使用时创建）"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONNECTIONS,
+                        max_keepalive_connections=MAX_CONNECTIONS,
+                        keepalive_expiry=KEEPALIVE_SECONDS,
+                    ),
+                    # 本地模型服务不走系统代理
+                    trust_env=False,
+                )
+    return _client
+
+
+def close():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+atexit.register(close)
+
+
+def _send(endpoint, payload, timeout, retries, stream):
+    """发送请求，连接失败和 RETRY_STATUS 按退避重试；返回 httpx.Response（流式时尚未读取正文）"""
+    client = get_client()
+    request_timeout = httpx.Timeout(timeout, connect=min(CONNECT_TIMEOUT, timeout))
+    for attempt in range(retries + 1):
+        try:
+            request = client.build_request('POST', endpoint, json=payload, timeout=request_timeout)
+            response = client.send(request, stream=stream)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+            # 连接没建立或服务端断开了空闲的长连接：可以安全重试
+            error = LLMError(f'{type(e).__name__}: {e}')
+        except httpx.TimeoutException as e:
+            raise LLMError(f'请求超时（{timeout} 秒）: {type(e).__name__}') from e
+        except httpx.HTTPError as e:
+            raise LLMError(f'{type(e).__name__}: {e}') from e
+        else:
+            if response.status_code not in RETRY_STATUS:
+                return response
+            response.read()
+            response.close()
+            error = LLMError(f'HTTP {response.status_code}: {response.text[:200]}', response.status_code)
+        if attempt < retries:
+            time.sleep(RETRY_BACKOFF * (2 ** attempt))
+    raise error
+
+
+def _read_stream(response, on_delta):
+    """解析 SSE 格式的流式响应，逐段回调 on_delta，返回完整文本"""
+    parts = []
+    for line in response.iter_lines():
+        if not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            # 继续读到正文结束，连接才能放回连接池
+            continue
+        try:
+            choices = json.loads(data).get('choices') or [{}]
+        except ValueError as e:
+            raise LLMError(f'响应格式错误: {data[:200]}') from e
+        content = (choices[0].get('delta') or {}).get('content')
+        if content:
+            parts.append(content)
+            on_delta(content)
+    return ''.join(parts)
+
+
+def chat(messages, temperature=0.7, max_tokens=None, timeout=60, url=None, retries=None, on_delta=None,
+         queue_timeout=None, **options):
+    """调用 /v1/chat/completions，返回第一条候选的 message.content
+
+    timeout 为读/写超时（秒），连接超时为 LLM_CONNECT_TIMEOUT_SECONDS；传入 on_delta 时流式调用，
+    每收到一段输出回调 on_delta(text)，返回值仍是完整文本（重试只发生在开始输出之前）。
+    排队最多等 queue_timeout 秒（默认取 LLM_QUEUE_TIMEOUT_SECONDS 与 timeout 中较小者）。
+    其余关键字参数（如 model、top_p）原样放进请求体。失败时抛出 LLMError（排不上队时为 LLMBusy）。
+    """
+    if queue_timeout is None:
+        queue_timeout = min(dispatcher.queue_timeout, timeout)
+    with dispatcher.slot(queue_timeout):
+        return _chat(messages, temperature, max_tokens, timeout, url, retries, on_delta, options)
+
+
+def _chat(messages, temperature, max_tokens, timeout, url, retries, on_delta, options):
+    payload = {'messages': messages, 'temperature': temperature, **options}
+    if max_tokens is not None:
+        payload['max_tokens'] = max_tokens
+    if on_delta is not None:
+        payload['stream'] = True
+    retries = MAX_RETRIES if retries is None else retries
+    response = _send(chat_completions_url(url), payload, timeout, retries, stream=on_delta is not None)
+
+    try:
+        if response.status_code != 200:
+            response.read()
+            raise LLMError(f'HTTP {response.status_code}: {response.text[:200]}', response.status_code)
+        if on_delta is not None:
+            return _read_stream(response, on_delta)
+        try:
+            return response.json()['choices'][0]['message']['content']
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise LLMError(f'响应格式错误: {response.text[:200]}') from e
+    except httpx.TimeoutException as e:
+        raise LLMError(f'等待输出超时（{timeout} 秒）: {type(e).__name__}') from e
+    except httpx.HTTPError as e:
+        raise LLMError(f'{type(e).__name__}: {e}') from e
+    finally:
+        response.close()
@@ -0,0 +1,22 @@
+"""
+数据库迁移脚本：为Story表添加评论/证据计数列，并按实际行数重算
+
+加列已并入版本化迁移（migrations/versions/v0003_story_counters.py）。
+本脚本先执行迁移，再按实际行数重算一次计数（可重复运行，用于修复计数漂移）。
+"""
+
+from migrations.__main__ import main as migrate
+
+def recount():
+    """使用 app 中的集合化 UPDATE 一次性重算所有故事的计数"""
+    from app import app, db, recount_story_counters
+
+    with app.app_context():
+        recount_story_counters()
+        db.session.commit()
+    print("✅ 故事计数已重算")
+
+if __name__ == '__main__':
+    print("🔄 开始数据库迁移...")
+    migrate(['upgrade'])
+    recount()
@@ -0,0 +1,87 @@
+"""
+版本化数据库迁移
+
+migrations/versions/ 下每个 vNNNN_*.py 是一个修订，包含：
+    revision     修订号（如 '0001'），按字符串顺序依次执行
+    description  简短说明
+    upgrade(conn)  在一个事务中执行的升级逻辑（conn 为 SQLAlchemy Connection）
+
+已执行的修订记录在 schema_migrations 表中。修订必须可重复执行（IF NOT EXISTS /
+先检查列是否存在），因为新数据库由 db.create_all() 按模型直接建出完整结构，
+随后运行的修订只会被记录为已应用。
+
+应用启动时自动升级；也可以手动执行：
+    python -m migrations            # 升级到最新
+    python -m migrations status     # 查看各修订状态
+"""
+import importlib
+import pkgutil
+from datetime import datetime
+
+from sqlalchemy import text
+
+import data_version
+from . import versions
+
+MIGRATIONS_TABLE = 'schema_migrations'
+
+
+def load_revisions():
+    """按修订号排序返回所有修订模块"""
+    modules = [
+        importlib.import_module(f'{versions.__name__}.{info.name}')
+        for info in pkgutil.iter_modules(versions.__path__)
+        if info.name.startswith('v')
+    ]
+    return sorted(modules, key=lambda module: module.revision)
+
+
+def _ensure_table(conn):
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+        "version VARCHAR(32) PRIMARY KEY, "
+        "description VARCHAR(200), "
+        "applied_at DATETIME NOT NULL)"
+    ))
+
+
+def applied_revisions(engine):
+    """已应用的修订 {version: applied_at}"""
+    with engine.begin() as conn:
+        _ensure_table(conn)
+        rows = conn.execute(text(f"SELECT version, applied_at FROM {MIGRATIONS_TABLE}")).fetchall()
+    return {row[0]: row[1] for row in rows}
+
+
+def upgrade(engine, verbose=True):
+    """依次执行未应用的修订，每个修订及其记录在同一个事务中提交；返回本次应用的修订号"""
+    done = applied_revisions(engine)
+    applied = []
+    for module in load_revisions():
+        if module.revision in done:
+            continue
+        if verbose:
+            print(f"[migrations] ⬆️  {module.revision}: {module.description}")
+        with engine.begin() as conn:
+            module.upgrade(conn)
+            conn.execute(
+                text(f"INSERT INTO {MIGRATIONS_TABLE} (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {'v': module.revision, 'd': module.description, 't': datetime.utcnow()}
+            )
+        applied.append(module.revision)
+    if applied:
+        # 修订可能改写内容数据：推进共享版本号，正在运行的服务不再用旧 ETag 回 304
+        with engine.begin() as conn:
+            data_version.bump_shared(conn)
+    return applied
+
+
+def status(engine):
+    """[(revision, description, applied_at 或 None), ...]"""
+    done = applied_revisions(engine)
+    return [(m.revision, m.description, done.get(m.revision)) for m in load_revisions()]
+
+
+def column_names(conn, table):
+    """修订中用于判断列是否已存在"""
+    return {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
@@ -0,0 +1,68 @@
+"""
+命令行执行迁移：
+    python -m migrations [upgrade|status] [--database-url sqlite:///path/to.db]
+
+未指定 --database-url 时依次使用 DATABASE_URL 环境变量、instance/ai_urban_legends.db、
+ai_urban_legends.db（与应用默认数据库位置一致）。
+"""
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+from migrations import upgrade, status
+
+POSSIBLE_PATHS = [
+    'instance/ai_urban_legends.db',
+    'ai_urban_legends.db'
+]
+
+
+def resolve_database_url(explicit=None):
+    if explicit:
+        return explicit
+    url = os.getenv('DATABASE_URL')
+    if url:
+        # Flask-SQLAlchemy 把相对路径的 SQLite 文件放在 instance/ 目录下
+        if url.startswith('sqlite:///') and not url.startswith('sqlite:////'):
+            relative = url[len('sqlite:///'):]
+            if os.path.exists(os.path.join('instance', relative)):
+                return 'sqlite:///' + os.path.join('instance', relative)
+        return url
+    for path in POSSIBLE_PATHS:
+        if os.path.exists(path):
+            return 'sqlite:///' + path
+    return None
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog='python -m migrations', description='版本化数据库迁移')
+    parser.add_argument('command', nargs='?', default='upgrade', choices=['upgrade', 'status'])
+    parser.add_argument('--database-url', help='数据库 URL（默认自动查找）')
+    args = parser.parse_args(argv)
+
+    url = resolve_database_url(args.database_url)
+    if not url:
+        print("ℹ️  数据库文件不存在")
+        print("💡 首次运行服务器时会按模型创建完整结构并自动执行迁移")
+        return 0
+
+    print(f"📂 数据库: {url}")
+    engine = create_engine(url)
+
+    if args.command == 'status':
+        for revision, description, applied_at in status(engine):
+            mark = f"✅ {applied_at}" if applied_at else "⏳ 未应用"
+            print(f"   {revision}  {description:<24} {mark}")
+        return 0
+
+    applied = upgrade(engine)
+    print(f"✅ 迁移完成，本次应用 {len(applied)} 个修订" if applied else "✅ 已是最新版本")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1 @@
+"""迁移修订（按修订号顺序执行，见 migrations/__init__.py）"""
@@ -0,0 +1,22 @@
+"""热点查询索引：故事列表/状态、按故事取评论与证据、关注者扇出、通知列表"""
+from sqlalchemy import text
+
+revision = '0001'
+description = '热点查询索引'
+
+INDEXES = [
+    ('ix_story_created_at_id', 'story', 'created_at, id'),
+    ('ix_story_current_state', 'story', 'current_state'),
+    ('ix_comment_story_id', 'comment', 'story_id'),
+    ('ix_comment_story_ai', 'comment', 'story_id, is_ai_response'),
+    ('ix_evidence_story_type', 'evidence', 'story_id, evidence_type'),
+    ('ix_follow_story_id', 'follow', 'story_id'),
+    ('ix_notification_user_read_created', 'notification', 'user_id, is_read, created_at'),
+    ('ix_notification_user_created', 'notification', 'user_id, created_at'),
+]
+
+
+def upgrade(conn):
+    for name, table, columns in INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+    conn.execute(text("ANALYZE"))
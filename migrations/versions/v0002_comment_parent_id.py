@@ -0,0 +1,13 @@
+"""评论回复：comment.parent_id 及其索引（取代 migrate_add_parent_id.py）"""
+from sqlalchemy import text
+
+from migrations import column_names
+
+revision = '0002'
+description = '评论 parent_id 字段'
+
+
+def upgrade(conn):
+    if 'parent_id' not in column_names(conn, 'comment'):
+        conn.execute(text("ALTER TABLE comment ADD COLUMN parent_id INTEGER REFERENCES comment(id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_comment_parent_id ON comment (parent_id)"))
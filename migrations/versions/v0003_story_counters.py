@@ -0,0 +1,25 @@
+"""故事评论/证据计数列，并按实际行数重算（取代 migrate_add_story_counters.py 的加列部分）"""
+from sqlalchemy import text
+
+from migrations import column_names
+
+revision = '0003'
+description = '故事评论/证据计数列'
+
+COUNTER_COLUMNS = ['comments_count', 'user_comments_count', 'evidence_count']
+
+RECOUNT_SQL = """
+UPDATE story SET
+    comments_count = (SELECT COUNT(*) FROM comment WHERE comment.story_id = story.id),
+    user_comments_count = (SELECT COUNT(*) FROM comment
+                           WHERE comment.story_id = story.id AND comment.is_ai_response = 0),
+    evidence_count = (SELECT COUNT(*) FROM evidence WHERE evidence.story_id = story.id)
+"""
+
+
+def upgrade(conn):
+    existing = column_names(conn, 'story')
+    for column in COUNTER_COLUMNS:
+        if column not in existing:
+            conn.execute(text(f"ALTER TABLE story ADD COLUMN {column} INTEGER DEFAULT 0"))
+    conn.execute(text(RECOUNT_SQL))
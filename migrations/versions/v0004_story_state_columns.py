@@ -0,0 +1,90 @@
+"""故事状态机热字段拆成列 + story_state_event 历史表，并从 state_data JSON 回填"""
+import json
+from datetime import datetime
+
+from sqlalchemy import DateTime, Integer, String, bindparam, column, table, text
+
+from migrations import column_names
+
+revision = '0004'
+description = '故事状态机列和状态历史表'
+
+STATE_COLUMNS = {
+    'next_transition_time': 'DATETIME',
+    'user_interaction_count': 'INTEGER DEFAULT 0',
+    'evidence_generated': 'INTEGER DEFAULT 0',
+}
+
+story = table(
+    'story',
+    column('id', Integer),
+    column('next_transition_time', DateTime),
+    column('user_interaction_count', Integer),
+    column('evidence_generated', Integer),
+)
+
+story_state_event = table(
+    'story_state_event',
+    column('story_id', Integer),
+    column('state', String),
+    column('trigger', String),
+    column('created_at', DateTime),
+)
+
+
+def _parse_time(value):
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def upgrade(conn):
+    existing = column_names(conn, 'story')
+    for name, ddl in STATE_COLUMNS.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE story ADD COLUMN {name} {ddl}"))
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS story_state_event ("
+        "id INTEGER NOT NULL PRIMARY KEY, "
+        "story_id INTEGER NOT NULL REFERENCES story(id), "
+        "state VARCHAR(50) NOT NULL, "
+        "\"trigger\" VARCHAR(50), "
+        "created_at DATETIME)"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_story_next_transition_time ON story (next_transition_time)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_story_user_interaction_count ON story (user_interaction_count)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_story_state_event_story_id ON story_state_event (story_id, id)"))
+
+    # 回填：只处理还没有历史记录的故事，重复执行不会重复插入
+    rows = conn.execute(text(
+        "SELECT id, state_data FROM story WHERE state_data IS NOT NULL "
+        "AND id NOT IN (SELECT story_id FROM story_state_event)"
+    )).fetchall()
+    updates, events = [], []
+    for story_id, raw in rows:
+        try:
+            data = json.loads(raw)
+        except (TypeError, ValueError):
+            continue
+        if not isinstance(data, dict) or 'current_state' not in data:
+            continue  # 如坟帖的 {"comments_locked": true}，不参与状态机
+        updates.append({
+            'b_id': story_id,
+            'next_transition_time': _parse_time(data.get('next_transition_time')),
+            'user_interaction_count': data.get('user_interaction_count') or 0,
+            'evidence_generated': data.get('evidence_generated') or 0,
+        })
+        for entry in data.get('state_history') or []:
+            events.append({
+                'story_id': story_id,
+                'state': entry.get('state') or data['current_state'],
+                'trigger': entry.get('trigger'),
+                'created_at': _parse_time(entry.get('timestamp')),
+            })
+
+    if updates:
+        # 其余键与列同名，executemany 时自动成为 SET 子句
+        conn.execute(story.update().where(story.c.id == bindparam('b_id')), updates)
+    if events:
+        conn.execute(story_state_event.insert(), events)
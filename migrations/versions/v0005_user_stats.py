@@ -0,0 +1,55 @@
+"""个人资料物化统计 user_stats，按现有评论和分类点击回填；评论按作者计数的索引"""
+import json
+from datetime import datetime
+
+from sqlalchemy import text
+
+revision = '0005'
+description = '个人资料统计表'
+
+TOP_CATEGORY_LIMIT = 2
+
+
+def upgrade(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS user_stats ("
+        "user_id INTEGER NOT NULL PRIMARY KEY REFERENCES user(id), "
+        "total_clicks INTEGER, "
+        "total_comments INTEGER, "
+        "top_categories TEXT, "
+        "updated_at DATETIME)"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_comment_author_id ON comment (author_id)"))
+
+    comments = dict(conn.execute(text(
+        "SELECT author_id, COUNT(*) FROM comment WHERE author_id IS NOT NULL GROUP BY author_id"
+    )).fetchall())
+    clicks = {}
+    has_clicks = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'category_click'"
+    )).first()
+    if has_clicks:
+        for user_id, category, click_count in conn.execute(text(
+            "SELECT user_id, category, click_count FROM category_click"
+        )):
+            clicks.setdefault(user_id, []).append((click_count or 0, category))
+
+    # 与 SQLAlchemy DateTime 在 SQLite 中的存储格式一致
+    now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')
+    rows = []
+    for user_id in set(comments) | set(clicks):
+        entries = sorted(clicks.get(user_id, []), key=lambda entry: (-entry[0], entry[1]))
+        top = [{'category': category, 'click_count': count} for count, category in entries[:TOP_CATEGORY_LIMIT]]
+        rows.append({
+            'user_id': user_id,
+            'total_clicks': sum(count for count, _ in entries),
+            'total_comments': comments.get(user_id, 0),
+            'top_categories': json.dumps(top, ensure_ascii=False),
+            'updated_at': now,
+        })
+    if rows:
+        # 重复执行时覆盖为最新的重算结果
+        conn.execute(text(
+            "INSERT OR REPLACE INTO user_stats (user_id, total_clicks, total_comments, top_categories, updated_at) "
+            "VALUES (:user_id, :total_clicks, :total_comments, :top_categories, :updated_at)"
+        ), rows)
@@ -0,0 +1,35 @@
+"""冷数据归档表 archived_*（列与源表一致，另加 archived_at；见 archive.py）"""
+from sqlalchemy import text
+
+revision = '0006'
+description = '冷数据归档表'
+
+STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS archived_story (
+        id INTEGER NOT NULL PRIMARY KEY, title VARCHAR(200), content TEXT, category VARCHAR(50),
+        location VARCHAR(100), is_ai_generated BOOLEAN, ai_persona VARCHAR(100), current_state VARCHAR(50),
+        state_data TEXT, next_transition_time DATETIME, user_interaction_count INTEGER, evidence_generated INTEGER,
+        created_at DATETIME, updated_at DATETIME, views INTEGER, comments_count INTEGER,
+        user_comments_count INTEGER, evidence_count INTEGER, archived_at DATETIME)""",
+    """CREATE TABLE IF NOT EXISTS archived_comment (
+        id INTEGER NOT NULL PRIMARY KEY, content TEXT, story_id INTEGER, author_id INTEGER, parent_id INTEGER,
+        is_ai_response BOOLEAN, created_at DATETIME, archived_at DATETIME)""",
+    "CREATE INDEX IF NOT EXISTS ix_archived_comment_story_id ON archived_comment (story_id)",
+    """CREATE TABLE IF NOT EXISTS archived_evidence (
+        id INTEGER NOT NULL PRIMARY KEY, story_id INTEGER, evidence_type VARCHAR(20), file_path VARCHAR(500),
+        description TEXT, created_at DATETIME, archived_at DATETIME)""",
+    "CREATE INDEX IF NOT EXISTS ix_archived_evidence_story_id ON archived_evidence (story_id)",
+    """CREATE TABLE IF NOT EXISTS archived_story_state_event (
+        id INTEGER NOT NULL PRIMARY KEY, story_id INTEGER, state VARCHAR(50), "trigger" VARCHAR(50),
+        created_at DATETIME, archived_at DATETIME)""",
+    "CREATE INDEX IF NOT EXISTS ix_archived_story_state_event_story_id ON archived_story_state_event (story_id)",
+    """CREATE TABLE IF NOT EXISTS archived_notification (
+        id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER, story_id INTEGER, comment_id INTEGER,
+        notification_type VARCHAR(50), notification_category VARCHAR(50), content TEXT, is_read BOOLEAN,
+        created_at DATETIME, archived_at DATETIME)""",
+]
+
+
+def upgrade(conn):
+    for statement in STATEMENTS:
+        conn.execute(text(statement))
@@ -0,0 +1,23 @@
+"""翻译缓存表 translation_cache（见 translation_cache.py）"""
+from sqlalchemy import text
+
+revision = '0007'
+description = '翻译缓存表'
+
+
+def upgrade(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS translation_cache ("
+        "text_hash VARCHAR(64) NOT NULL, "
+        "target VARCHAR(16) NOT NULL, "
+        "model VARCHAR(100) NOT NULL, "
+        "translated TEXT NOT NULL, "
+        "size_bytes INTEGER, "
+        "hits INTEGER, "
+        "created_at DATETIME, "
+        "last_used_at DATETIME, "
+        "PRIMARY KEY (text_hash, target, model))"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_translation_cache_last_used_at ON translation_cache (last_used_at)"
+    ))
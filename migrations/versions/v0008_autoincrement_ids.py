@@ -0,0 +1,81 @@
+"""会被归档的表改为 INTEGER PRIMARY KEY AUTOINCREMENT，id 不再复用
+
+归档把行连同原 id 复制进 archived_*。普通 rowid 表在最大 id 被删除后会把它再分配出去，
+之后归档复用了 id 的行会与 archived_* 主键冲突（每次归档都失败），按 id 读取归档故事也会读到旧行。
+SQLite 不能给已有表加 AUTOINCREMENT，只能重建：按原建表语句建新表、复制数据、删旧表、改名、重建索引和触发器
+（检索同步触发器，见 search_index.py），
+并把 sqlite_sequence 推到已归档的最大 id 之后。依赖外键约束未开启（PRAGMA foreign_keys 默认关闭）。
+"""
+import re
+
+from sqlalchemy import text
+
+from migrations import column_names
+
+revision = '0008'
+description = '归档相关表改用 AUTOINCREMENT 主键'
+
+TABLES = ('story', 'comment', 'evidence', 'story_state_event', 'notification')
+
+_INLINE_PK_RE = re.compile(r'\bid INTEGER (?:NOT NULL )?PRIMARY KEY\b', re.I)
+_TABLE_PK_RE = re.compile(r',\s*PRIMARY KEY \(id\)', re.I)
+_ID_COLUMN_RE = re.compile(r'\bid INTEGER NOT NULL\b', re.I)
+
+
+def autoincrement_sql(sql, name, new_name):
+    """把 name 的建表语句改写成名为 new_name、id 为 INTEGER PRIMARY KEY AUTOINCREMENT 的建表语句"""
+    sql, renamed = re.subn(r'^CREATE TABLE\s+"?%s"?\s*\(' % re.escape(name), f'CREATE TABLE {new_name} (', sql)
+    autoincrement = 'id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT'
+    if renamed and _INLINE_PK_RE.search(sql):
+        return _INLINE_PK_RE.sub(autoincrement, sql, count=1)
+    if renamed and _TABLE_PK_RE.search(sql) and _ID_COLUMN_RE.search(sql):
+        return _ID_COLUMN_RE.sub(autoincrement, _TABLE_PK_RE.sub('', sql, count=1), count=1)
+    raise RuntimeError(f'无法识别 {name} 的主键定义，请手动迁移: {sql}')
+
+
+def _rebuild(conn, name):
+    """重建为 AUTOINCREMENT 表；表不存在时返回 False"""
+    sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                       {'name': name}).scalar()
+    if sql is None:
+        return False
+    if 'AUTOINCREMENT' in sql.upper():
+        return True
+    # 删表会连带删除索引和触发器，重建后按原语句恢复（rowid 不变，外部内容的 FTS 索引仍然有效）
+    dependents = conn.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND tbl_name = :name AND sql IS NOT NULL "
+        "ORDER BY type"
+    ), {'name': name}).scalars().all()
+    new_name = f'{name}__autoincrement'
+    columns = ', '.join(f'"{column}"' for column in column_names(conn, name))
+
+    # 原样执行 sqlite_master 里的语句（不经 text() 解析 :name 形式的参数）
+    conn.exec_driver_sql(autoincrement_sql(sql, name, new_name))
+    conn.exec_driver_sql(f'INSERT INTO {new_name} ({columns}) SELECT {columns} FROM "{name}"')
+    conn.exec_driver_sql(f'DROP TABLE "{name}"')
+    conn.exec_driver_sql(f'ALTER TABLE {new_name} RENAME TO "{name}"')
+    for statement in dependents:
+        conn.exec_driver_sql(statement)
+    return True
+
+
+def _skip_archived_ids(conn, name):
+    """sqlite_sequence 至少推进到 archived_<name> 的最大 id，已归档的 id 不会再分配"""
+    archived = f'archived_{name}'
+    if not conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                        {'name': archived}).first():
+        return
+    highest = conn.execute(text(f'SELECT max(id) FROM {archived}')).scalar()
+    if highest is None:
+        return
+    updated = conn.execute(text("UPDATE sqlite_sequence SET seq = max(seq, :seq) WHERE name = :name"),
+                           {'seq': highest, 'name': name}).rowcount
+    if not updated:
+        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                     {'name': name, 'seq': highest})
+
+
+def upgrade(conn):
+    for name in TABLES:
+        if _rebuild(conn, name):
+            _skip_archived_ids(conn, name)
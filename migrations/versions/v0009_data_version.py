@@ -0,0 +1,13 @@
+"""共享数据版本号表 data_version（ETag 和列表缓存的版本号，见 data_version.py）"""
+from sqlalchemy import text
+
+revision = '0009'
+description = '共享数据版本号表'
+
+
+def upgrade(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS data_version ("
+        "name VARCHAR(50) NOT NULL PRIMARY KEY, "
+        "version INTEGER NOT NULL)"
+    ))
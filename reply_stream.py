@@ -0,0 +1,92 @@
+"""
+AI 楼主回复的逐字推送
+
+delayed_ai_response 以流式方式调用模型，每收到一段输出就更新该评论对应的 ReplyStream；
+/api/comments/<id>/ai-reply/stream 把最新的可见文本推给发表评论的客户端。
+
+与 event_bus 的事件队列不同，这里每个回复只保留「目前的全文」和一个递增的版本号：
+客户端跟不上时多次更新自然合并成一次，不会积压或溢出。
+生成结束后保留 retention 秒，稍晚连上的客户端仍能直接拿到结果。
+"""
+import threading
+import time
+
+PENDING = 'pending'
+STREAMING = 'streaming'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class ReplyStream:
+    """一条 AI 回复的生成进度"""
+
+    def __init__(self, comment_id):
+        self.comment_id = comment_id
+        self.status = PENDING
+        self.version = 0
+        self.text = ''
+        self.result = None
+        self.finished_at = None
+        self._cond = threading.Condition()
+
+    def _set(self, **fields):
+        with self._cond:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self._cond.notify_all()
+
+    def update(self, text):
+        """部分回复（已去掉思考内容的全文）"""
+        if self.status in (DONE, FAILED):
+            return
+        self._set(status=STREAMING, text=text)
+
+    def finish(self, result):
+        """回复已保存，result 为推给客户端的最终数据"""
+        self._set(status=DONE, result=result, text=result.get('content', self.text),
+                  finished_at=time.monotonic())
+
+    def fail(self, message):
+        self._set(status=FAILED, result={'error': message}, finished_at=time.monotonic())
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def wait(self, version, timeout):
+        """等到版本号超过 version 或超时，返回 (version, status, text, result) 快照"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version > version, timeout=timeout)
+            return self.version, self.status, self.text, self.result
+
+
+class ReplyStreamRegistry:
+    """按评论 id 登记进行中的回复"""
+
+    def __init__(self, retention=60):
+        self._retention = retention
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def open(self, comment_id):
+        stream = ReplyStream(comment_id)
+        with self._lock:
+            self._prune()
+            self._streams[comment_id] = stream
+        return stream
+
+    def get(self, comment_id):
+        with self._lock:
+            self._prune()
+            return self._streams.get(comment_id)
+
+    def active_count(self):
+        with self._lock:
+            return sum(1 for stream in self._streams.values() if not stream.finished)
+
+    def _prune(self):
+        cutoff = time.monotonic() - self._retention
+        for comment_id in [cid for cid, stream in self._streams.items()
+                           if stream.finished and stream.finished_at < cutoff]:
+            del self._streams[comment_id]
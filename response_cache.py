@@ -0,0 +1,75 @@
+"""
+进程内响应缓存（TTL + LRU）
+
+缓存已经序列化好的响应体，命中时不再查询数据库、也不再做 JSON 编码。
+条目在 ttl 秒后过期；超过 maxsize 时淘汰最久未使用的条目。
+调用方负责在数据变更时 clear()（见 app.py 中与 content_version 的联动）。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """线程安全的 TTL + LRU 缓存，附带命中统计"""
+
+    def __init__(self, maxsize=128, ttl=10.0, name='cache'):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._name = name
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def get(self, key):
+        """返回缓存值；未命中或已过期返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self._ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        """数据变更时整体失效"""
+        with self._lock:
+            self._entries.clear()
+            self._invalidations += 1
+
+    def discard(self, keys):
+        """只失效指定的键（如被淘汰的数据库条目），返回实际移除的条数"""
+        with self._lock:
+            removed = sum(1 for key in keys if self._entries.pop(key, None) is not None)
+            self._invalidations += removed
+            return removed
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'name': self._name,
+                'size': len(self._entries),
+                'maxsize': self._maxsize,
+                'ttl_seconds': self._ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations
+            }
@@ -4,7 +4,7 @@ import os
 
 def scheduled_story_generation():
     """Scheduled task to generate new AI stories - generates 2 stories per run"""
-    from app import app, db, Story
+    from app import app, db, Story, publish_event
     from ai_engine import generate_ai_story, should_generate_new_story
     from story_engine import initialize_story_state
     
@@ -35,6 +35,7 @@ def scheduled_story_generation():
                     initialize_story_state(story)
                     
                     db.session.commit()
+                    publish_event('story_created', {'story_id': story.id, 'title': story.title, 'category': story.category})
                     
                     generated_count += 1
                     print(f"✅ Generated story {i+1}/{stories_to_generate}: {story.title}")
@@ -48,31 +49,58 @@ def scheduled_story_generation():
 
 def daily_story_refresh():
     """Refresh AI-generated stories twice daily."""
-    from app import app, db
-    from app import admin_reset_ai_stories
+    from app import reset_ai_stories
 
-    with app.app_context():
-        print(f"[{datetime.now()}] Refreshing AI-generated stories...")
-        result = admin_reset_ai_stories()
+    # 调度器本身就在后台线程中，直接执行（不经过需要请求上下文的管理接口）
+    print(f"[{datetime.now()}] Refreshing AI-generated stories...")
+    try:
+        result = reset_ai_stories()
         print(f"   Result: {result}")
+    except Exception as e:
+        print(f"   ❌ Refresh failed: {e}")
 
 def scheduled_state_progression():
     """Check and progress story states"""
-    from app import app, db, Story
-    from story_engine import check_state_transition, transition_story_state
+    from app import app, db, Story, publish_event
+    from story_engine import check_state_transition, transition_story_state, active_state_filter, due_for_transition_filter
     
     with app.app_context():
         print(f"[{datetime.now()}] Checking story state transitions...")
         
-        active_stories = Story.query.filter(Story.current_state != 'ended').all()
+        # 只取到期或互动达到阈值的故事（走 next_transition_time / user_interaction_count 索引）
+        due_stories = Story.query.filter(
+            active_state_filter(Story.current_state),
+            due_for_transition_filter(datetime.utcnow())
+        ).all()
         
-        for story in active_stories:
+        for story in due_stories:
             if check_state_transition(story):
                 print(f"🔄 Transitioning story: {story.title}")
                 transition_story_state(story, app.app_context)
                 db.session.commit()
+                publish_event('story_updated', {'story_id': story.id, 'state': story.current_state})
                 print(f"✅ Story transitioned to: {story.current_state}")
 
+def scheduled_archive():
+    """Move ended stories and old read notifications into the archive tables"""
+    from app import app
+    from archive import run_archive
+
+    with app.app_context():
+        print(f"[{datetime.now()}] Archiving cold data...")
+        counts = run_archive()
+        print(f"📦 Archived: {counts}")
+
+def scheduled_translation_warmup():
+    """Pre-translate the newest stories so the first reader's translate click hits the cache"""
+    from app import app
+    from translation_cache import warmup_recent_stories
+
+    with app.app_context():
+        translated = warmup_recent_stories()
+        if translated:
+            print(f"[{datetime.now()}] 🌐 Pre-translated {translated} story texts")
+
 def start_scheduler(app):
     """Initialize and start the background scheduler"""
     scheduler = BackgroundScheduler()
@@ -156,6 +184,30 @@ def start_scheduler(app):
         replace_existing=True
     )
     print(f"   - 🔄 State progression: every 30 minutes")
+
+    # 每天凌晨归档完结的故事和旧的已读通知
+    scheduler.add_job(
+        func=scheduled_archive,
+        trigger='cron',
+        hour=4,
+        minute=0,
+        id='archive_cold_data',
+        name='Archive ended stories and read notifications',
+        replace_existing=True
+    )
+    print(f"   - 📦 Cold data archive: every day at 04:00")
+
+    # 预先翻译新故事（翻译服务不可用时本轮直接跳过）
+    warmup_minutes = int(os.getenv('TRANSLATION_WARMUP_INTERVAL_MINUTES', 10))
+    scheduler.add_job(
+        func=scheduled_translation_warmup,
+        trigger='interval',
+        minutes=warmup_minutes,
+        id='translation_warmup',
+        name='Pre-translate new stories',
+        replace_existing=True
+    )
+    print(f"   - 🌐 Translation warmup: every {warmup_minutes} minutes")
     
     scheduler.start()
     
@@ -0,0 +1,214 @@
+"""
+故事/评论全文检索（SQLite FTS5）
+
+story_fts、comment_fts 是外部内容表（content='story' / content='comment'），
+不额外保存正文，只保存倒排索引；由触发器在写入 story / comment 时增量同步，
+所以无论是发帖、评论、AI回复还是证据更新（改写 story.content）都会自动进入索引。
+
+分词器使用 trigram：按三字滑窗切分，中文等不带空格的文本也能做子串检索。
+少于3个字的关键词 trigram 无法匹配，回退到 LIKE 扫描。
+"""
+from sqlalchemy import text
+
+HIGHLIGHT_OPEN = '<mark>'
+HIGHLIGHT_CLOSE = '</mark>'
+MIN_TRIGRAM_TERM = 3
+
+# 评论命中的权重低于正文/标题命中（bm25 分数越小越相关）
+COMMENT_SCORE_FACTOR = 0.5
+
+SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS story_fts USING fts5(
+        title, content, content='story', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS comment_fts USING fts5(
+        content, content='comment', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS story_fts_ai AFTER INSERT ON story BEGIN
+        INSERT INTO story_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS story_fts_ad AFTER DELETE ON story BEGIN
+        INSERT INTO story_fts(story_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS story_fts_au AFTER UPDATE OF title, content ON story BEGIN
+        INSERT INTO story_fts(story_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO story_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comment_fts_ai AFTER INSERT ON comment BEGIN
+        INSERT INTO comment_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comment_fts_ad AFTER DELETE ON comment BEGIN
+        INSERT INTO comment_fts(comment_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS comment_fts_au AFTER UPDATE OF content ON comment BEGIN
+        INSERT INTO comment_fts(comment_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO comment_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+]
+
+FTS_SEARCH_SQL = """
+WITH hits AS (
+    SELECT story_fts.rowid AS story_id,
+           NULL AS comment_id,
+           bm25(story_fts, 5.0, 1.0) AS score,
+           snippet(story_fts, -1, :open, :close, '…', 24) AS snippet
+    FROM story_fts
+    WHERE story_fts MATCH :match
+    UNION ALL
+    SELECT comment.story_id,
+           comment.id,
+           bm25(comment_fts) * :comment_factor,
+           snippet(comment_fts, 0, :open, :close, '…', 24)
+    FROM comment_fts
+    JOIN comment ON comment.id = comment_fts.rowid
+    WHERE comment_fts MATCH :match
+),
+best AS (
+    -- SQLite 中单个 MIN() 聚合时，其余裸列取自分数最小的那一行
+    SELECT story_id, comment_id, MIN(score) AS score, snippet
+    FROM hits
+    GROUP BY story_id
+)
+SELECT best.story_id, best.comment_id, best.snippet, COUNT(*) OVER () AS total
+FROM best
+JOIN story ON story.id = best.story_id
+ORDER BY best.score, best.story_id DESC
+LIMIT :limit OFFSET :offset
+"""
+
+LIKE_SEARCH_SQL = """
+WITH matched AS (
+    SELECT story.id AS story_id, story.title, story.content, story.created_at,
+           (SELECT comment.id FROM comment
+             WHERE comment.story_id = story.id AND comment.content LIKE :pattern ESCAPE '\\'
+             ORDER BY comment.id LIMIT 1) AS comment_id
+    FROM story
+)
+SELECT matched.story_id, matched.title, matched.content, matched.comment_id,
+       comment.content AS comment_content,
+       COUNT(*) OVER () AS total
+FROM matched
+LEFT JOIN comment ON comment.id = matched.comment_id
+WHERE matched.title LIKE :pattern ESCAPE '\\'
+   OR matched.content LIKE :pattern ESCAPE '\\'
+   OR matched.comment_id IS NOT NULL
+ORDER BY matched.created_at DESC, matched.story_id DESC
+LIMIT :limit OFFSET :offset
+"""
+
+_fts_enabled = False
+
+def init_search_index(engine):
+    """创建 FTS 表与同步触发器；首次创建时从现有数据回填索引
+
+    SQLite 未编译 FTS5/trigram 时返回 False，检索自动回退到 LIKE。
+    """
+    global _fts_enabled
+    try:
+        with engine.begin() as conn:
+            existing = {
+                row[0] for row in conn.execute(text(
+                    "SELECT name FROM sqlite_master WHERE name IN ('story_fts', 'comment_fts')"
+                ))
+            }
+            for statement in SCHEMA:
+                conn.execute(text(statement))
+            if 'story_fts' not in existing:
+                conn.execute(text("INSERT INTO story_fts(story_fts) VALUES ('rebuild')"))
+            if 'comment_fts' not in existing:
+                conn.execute(text("INSERT INTO comment_fts(comment_fts) VALUES ('rebuild')"))
+        _fts_enabled = True
+    except Exception as e:
+        print(f"[search_index] FTS5 不可用，检索回退到 LIKE: {e}")
+        _fts_enabled = False
+    return _fts_enabled
+
+def drop_insert_triggers(engine):
+    """批量导入前删除 INSERT 同步触发器，避免逐行更新倒排索引
+
+    导入完成后调用 init_search_index 重建触发器，再调用 rebuild_search_index 一次性重建索引。
+    """
+    with engine.begin() as conn:
+        conn.execute(text("DROP TRIGGER IF EXISTS story_fts_ai"))
+        conn.execute(text("DROP TRIGGER IF EXISTS comment_fts_ai"))
+
+def rebuild_search_index(engine):
+    """从 story / comment 表完整重建索引（批量导入数据后使用）"""
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO story_fts(story_fts) VALUES ('rebuild')"))
+        conn.execute(text("INSERT INTO comment_fts(comment_fts) VALUES ('rebuild')"))
+
+def build_match_expression(query):
+    """把用户输入转成 FTS5 表达式：每个词作为短语，词之间为 AND"""
+    terms = query.split()
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def _like_snippet(content, term, radius=30):
+    """LIKE 回退时截取关键词附近的片段并高亮"""
+    if not content:
+        return ''
+    pos = content.lower().find(term.lower())
+    if pos < 0:
+        return content[:radius * 2]
+    start = max(0, pos - radius)
+    end = min(len(content), pos + len(term) + radius)
+    return (
+        ('…' if start > 0 else '')
+        + content[start:pos]
+        + HIGHLIGHT_OPEN + content[pos:pos + len(term)] + HIGHLIGHT_CLOSE
+        + content[pos + len(term):end]
+        + ('…' if end < len(content) else '')
+    )
+
+def search(session, query, limit=20, offset=0):
+    """检索故事标题、正文与评论，按相关度返回故事级结果
+
+    Returns:
+        (total, hits) 其中 hits 为 [{'story_id', 'comment_id', 'snippet'}, ...]
+    """
+    query = (query or '').strip()
+    if not query:
+        return 0, []
+
+    terms = query.split()
+    if _fts_enabled and all(len(term) >= MIN_TRIGRAM_TERM for term in terms):
+        rows = session.execute(text(FTS_SEARCH_SQL), {
+            'match': build_match_expression(query),
+            'open': HIGHLIGHT_OPEN,
+            'close': HIGHLIGHT_CLOSE,
+            'comment_factor': COMMENT_SCORE_FACTOR,
+            'limit': limit,
+            'offset': offset,
+        }).fetchall()
+        total = rows[0].total if rows else 0
+        return total, [
+            {'story_id': r.story_id, 'comment_id': r.comment_id, 'snippet': r.snippet}
+            for r in rows
+        ]
+
+    # 短关键词：trigram 无法匹配，退回 LIKE（只按整句子串匹配）
+    rows = session.execute(text(LIKE_SEARCH_SQL), {
+        'pattern': f"%{_escape_like(query)}%",
+        'limit': limit,
+        'offset': offset,
+    }).fetchall()
+    total = rows[0].total if rows else 0
+
+    hits = []
+    needle = query.lower()
+    for r in rows:
+        if needle in (r.title or '').lower():
+            snippet_source = r.title
+        elif needle in (r.content or '').lower():
+            snippet_source = r.content
+        else:
+            snippet_source = r.comment_content
+        hits.append({
+            'story_id': r.story_id,
+            'comment_id': r.comment_id,
+            'snippet': _like_snippet(snippet_source, query)
+        })
+    return total, hits
@@ -0,0 +1,80 @@
+"""
+SQLite 并发配置
+
+请求线程、AI 回复/证据生成后台线程和 APScheduler 任务共用同一个 SQLite 文件。
+默认的回滚日志模式下，写事务会阻塞所有读者，并发写入直接报 "database is locked"。
+这里在每个新连接上执行 PRAGMA：
+
+- journal_mode=WAL      读写互不阻塞（写者追加到 -wal 文件，读者读快照）
+- busy_timeout          遇到锁时等待而不是立即报错
+- synchronous=NORMAL    WAL 下仍保证数据库一致，只在断电时可能丢失最近的提交
+- mmap_size / cache_size  减少读路径上的系统调用和页缓存未命中
+
+各项均可通过环境变量调整，内存数据库会跳过 WAL。
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 10000))
+SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 20000))
+
+# 每个线程从连接池取自己的连接；后台线程较多，池子要比默认的 5 大
+POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', 10))
+MAX_OVERFLOW = int(os.getenv('SQLITE_MAX_OVERFLOW', 20))
+POOL_TIMEOUT = int(os.getenv('SQLITE_POOL_TIMEOUT', 30))
+
+
+def is_memory_url(url):
+    return url in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in url
+
+
+def engine_options(url):
+    """Flask-SQLAlchemy 的 SQLALCHEMY_ENGINE_OPTIONS；非 SQLite 时返回空字典"""
+    if not url.startswith('sqlite'):
+        return {}
+    options = {
+        'connect_args': {
+            # sqlite3 模块的 timeout 即 busy_timeout（秒）
+            'timeout': BUSY_TIMEOUT_MS / 1000,
+            # 连接由连接池在线程间复用，每次只被一个线程持有
+            'check_same_thread': False,
+        }
+    }
+    if not is_memory_url(url):
+        options.update({
+            'pool_size': POOL_SIZE,
+            'max_overflow': MAX_OVERFLOW,
+            'pool_timeout': POOL_TIMEOUT,
+        })
+    return options
+
+
+def apply_pragmas(dbapi_connection):
+    """对一个新的 sqlite3 连接执行并发相关 PRAGMA，返回实际生效的值"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA journal_mode = {JOURNAL_MODE}")
+        journal_mode = cursor.fetchone()[0]
+        cursor.execute(f"PRAGMA synchronous = {SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    finally:
+        cursor.close()
+    return journal_mode
+
+
+def _on_connect(dbapi_connection, connection_record):
+    if type(dbapi_connection).__module__ == 'sqlite3':
+        apply_pragmas(dbapi_connection)
+
+
+def install(engine=Engine):
+    """注册连接事件；默认对所有 SQLite 引擎生效（含迁移命令和测试里创建的引擎）"""
+    if not event.contains(engine, 'connect', _on_connect):
+        event.listen(engine, 'connect', _on_connect)
@@ -15,8 +15,133 @@ let totalPages = 1;
 let pagination = null;
 // Notification client-side cache and pagination state
 let notificationsCache = [];
+let notifNextCursor = null;
+let notifHasMore = false;
 let notifPerPage = 6;
 let notifCurrentPage = 1;
+// ETag 协商缓存：url -> { etag, data }
+const etagCache = {};
+
+// 带 If-None-Match 的 GET；服务端返回 304 时复用上次的数据
+async function fetchWithETag(url) {
+    const cached = etagCache[url];
+    const headers = cached ? { 'If-None-Match': cached.etag } : {};
+    const response = await fetch(url, { headers });
+    if (response.status === 304 && cached) {
+        return { data: cached.data, notModified: true };
+    }
+    if (!response.ok) throw new Error('HTTP ' + response.status);
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    if (etag) etagCache[url] = { etag, data };
+    return { data, notModified: false };
+}
+
+// SSE 实时推送连接
+let eventSource = null;
+let eventStreamConnected = false;
+let storiesRefreshTimer = null;
+
+// 连接 /api/events；浏览器不支持或连接被拒绝时回退到轮询
+function startEventStream() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+    eventStreamConnected = false;
+    if (!window.EventSource) return;
+    
+    const url = API_BASE + '/events' + (token ? '?token=' + encodeURIComponent(token) : '');
+    eventSource = new EventSource(url);
+    
+    eventSource.onopen = () => {
+        // 断线重连期间可能漏掉事件，重连后补一次刷新
+        if (eventStreamConnected === null) {
+            scheduleStoriesRefresh();
+            if (currentUser) checkNotifications();
+        }
+        eventStreamConnected = true;
+    };
+    eventSource.onerror = () => {
+        // CLOSED 表示服务端拒绝（如 token 失效），浏览器不会再重连，交给轮询
+        eventStreamConnected = eventSource.readyState === EventSource.CLOSED ? false : null;
+    };
+    
+    ['story_created', 'story_updated', 'comment_created', 'feed_reset', 'resync'].forEach(type => {
+        eventSource.addEventListener(type, () => scheduleStoriesRefresh());
+    });
+    ['ai_reply', 'evidence_ready'].forEach(type => {
+        eventSource.addEventListener(type, (e) => {
+            scheduleStoriesRefresh();
+            const data = JSON.parse(e.data);
+            refreshOpenStory(data.story_id);
+        });
+    });
+    eventSource.addEventListener('notification', () => {
+        if (currentUser) checkNotifications();
+    });
+}
+
+// 短时间内的多个事件合并成一次列表刷新
+function scheduleStoriesRefresh() {
+    if (storiesRefreshTimer) return;
+    storiesRefreshTimer = setTimeout(() => {
+        storiesRefreshTimer = null;
+        loadStories(true);
+    }, 500);
+}
+
+// 正在查看的故事有 AI 回复或新证据时刷新详情
+function refreshOpenStory(storyId) {
+    const storyModal = document.getElementById('story-modal');
+    if (storyModal && storyModal.style.display === 'flex' && window.currentStoryId === storyId) {
+        const contentEl = document.getElementById('story-content');
+        const scrollTop = contentEl ? contentEl.scrollTop : 0;
+        showStoryDetail(storyId).then(() => {
+            if (contentEl) contentEl.scrollTop = scrollTop;
+        });
+    }
+}
+
+// 逐字显示楼主对刚发表评论的回复（/api/comments/<id>/ai-reply/stream）
+// 回复保存后由 ai_reply 推送刷新详情；推送未连接时在 done 事件里自己刷新
+function streamAiReply(storyId, data) {
+    if (!window.EventSource || !data || !data.ai_reply_stream_url) return;
+    const commentId = data.comment.id;
+    const source = new EventSource(data.ai_reply_stream_url);
+    
+    const render = (text) => {
+        if (window.currentStoryId !== storyId) return;
+        let el = document.getElementById('ai-stream-' + commentId);
+        if (!el) {
+            const parent = document.getElementById('comment-' + commentId);
+            if (!parent) return;
+            parent.insertAdjacentHTML('afterend',
+                '<div id="ai-stream-' + commentId + '" class="comment-item" style="margin-left: 20px; border-left: 2px solid #ccc; padding-left: 10px;">' +
+                '<div class="comment-author">楼主</div>' +
+                '<div class="comment-text"></div>' +
+                '<div class="comment-time">正在输入...</div>' +
+                '</div>');
+            el = document.getElementById('ai-stream-' + commentId);
+        }
+        el.querySelector('.comment-text').textContent = text;
+    };
+    
+    source.addEventListener('partial', (e) => render(JSON.parse(e.data).text));
+    source.addEventListener('done', (e) => {
+        source.close();
+        render(JSON.parse(e.data).content);
+        if (!eventStreamConnected) refreshOpenStory(storyId);
+    });
+    source.addEventListener('failed', () => {
+        source.close();
+        const el = document.getElementById('ai-stream-' + commentId);
+        if (el) el.remove();
+    });
+    // 连接出错时不自动重连（回复保存后仍会通过 ai_reply 推送或轮询出现）
+    source.onerror = () => source.close();
+}
+
 // 在线用户数缓存（避免每次完全随机）
 let cachedOnlineUsers = Math.floor(Math.random() * 13) + 3; // 初始3-15人
 
@@ -32,8 +157,10 @@ document.addEventListener('DOMContentLoaded', () => {
     // 新菜单栏事件
     bindHeaderEvents();
     
-    // 每30秒检查新故事和通知
+    // 优先使用 SSE 实时推送；推送不可用时每30秒轮询新故事和通知
+    startEventStream();
     setInterval(() => {
+        if (eventStreamConnected) return;
         loadStories(true);  // 静默刷新
         if (currentUser) checkNotifications();
     }, 30000);
@@ -61,7 +188,9 @@ function bindEvents() {
             document.querySelectorAll('.category-item').forEach(i => i.classList.remove('active'));
             item.classList.add('active');
             currentCategory = item.dataset.category;
-            renderStories();
+            // 分类在服务端过滤，切换后从第一页重新加载（总数随分类变化，不提示新故事）
+            lastStoryCount = 0;
+            loadStories(false, 1);
         });
     });
     
@@ -133,21 +262,39 @@ function bindHeaderEvents() {
     }
 }
 
-// 搜索故事
-function searchStories(keyword) {
+// 搜索故事（服务端全文检索，覆盖全部故事和评论，而不只是当前页）
+async function searchStories(keyword) {
     if (!keyword) {
         renderStories();
         return;
     }
     
-    const filtered = allStories.filter(story => 
-        story.title.toLowerCase().includes(keyword.toLowerCase()) ||
-        story.content.toLowerCase().includes(keyword.toLowerCase())
-    );
-    
-    console.log(`🔍 搜索结果: 找到 ${filtered.length} 个故事`);
-    renderStoriesFromList(filtered);
-    showToast(`🔍 找到 ${filtered.length} 个相关故事`, 'info');
+    try {
+        const res = await fetch(`${API_BASE}/search?q=${encodeURIComponent(keyword)}&per_page=20`);
+        if (!res.ok) throw new Error('search failed: ' + res.status);
+        const data = await res.json();
+        const total = data.pagination ? data.pagination.total : data.results.length;
+        
+        console.log(`🔍 搜索结果: 找到 ${total} 个故事`);
+        renderStoriesFromList(data.results);
+        showToast(`🔍 找到 ${total} 个相关故事`, 'info');
+    } catch (error) {
+        // 服务端检索不可用时退回到当前页内过滤
+        console.error('搜索失败，使用本地过滤:', error);
+        const filtered = allStories.filter(story => 
+            story.title.toLowerCase().includes(keyword.toLowerCase()) ||
+            story.content.toLowerCase().includes(keyword.toLowerCase())
+        );
+        renderStoriesFromList(filtered);
+        showToast(`🔍 找到 ${filtered.length} 个相关故事`, 'info');
+    }
+}
+
+// 搜索片段：先转义，再还原服务端的 <mark> 高亮标记
+function renderSnippet(snippet) {
+    return escapeHtml(snippet)
+        .replace(/&lt;mark&gt;/g, '<mark>')
+        .replace(/&lt;\/mark&gt;/g, '</mark>');
 }
 
 // 从指定列表渲染故事
@@ -170,7 +317,7 @@ function renderStoriesFromList(stories) {
             '<span>💬 ' + story.comments_count + '</span>' +
             '<span>📸 ' + story.evidence_count + '</span>' +
             '</div>' +
-            '<div class="story-preview">' + escapeHtml(story.content.substring(0, 80)) + '</div>' +
+            '<div class="story-preview">' + (story.snippet ? renderSnippet(story.snippet) : escapeHtml(story.content.substring(0, 80))) + '</div>' +
             '<div class="story-footer">' +
             '<span>' + (story.ai_persona || '🤖 AI') + '</span>' +
             '<span>' + formatDate(story.created_at) + '</span>' +
@@ -610,8 +757,11 @@ async function trackCategoryClick(category) {
 
 async function loadStories(silent = false, page = 1) {
     try {
-        const response = await fetch(`${API_BASE}/stories?page=${page}&per_page=8`);
-        const data = await response.json();
+        let url = `${API_BASE}/stories?page=${page}&per_page=8`;
+        if (currentCategory && currentCategory !== 'all') url += '&category=' + encodeURIComponent(currentCategory);
+        const { data, notModified } = await fetchWithETag(url);
+        // 静默刷新且内容未变：不重绘列表
+        if (notModified && silent && page === currentPage) return;
         
         allStories = data.stories;
         pagination = data.pagination;
@@ -664,27 +814,32 @@ async function checkNotifications() {
     if (!token || !currentUser) return;
     
     try {
-        const res = await fetch(API_BASE + '/notifications', {
+        // 只取未读数；有新通知时再拉取最新几条未读用于弹窗
+        const res = await fetch(API_BASE + '/notifications/unread_count', {
             headers: { 'Authorization': 'Bearer ' + token }
         });
         
         if (res.ok) {
-            const notifications = await res.json();
-            const unread = notifications.filter(n => !n.is_read);
+            const { unread_count: unreadCount } = await res.json();
 
             // 更新菜单红点
-            updateNotificationBadge(unread.length);
-
-            if (unread.length > lastNotificationCheck) {
-                // 有新通知 - 仅对新出现的显示弹窗（可点击跳转）
-                const newCount = unread.length - lastNotificationCheck;
-                const newOnes = unread.slice(0, newCount);
-                newOnes.forEach(n => {
-                    showNotificationPopup(n);
+            updateNotificationBadge(unreadCount);
+
+            if (unreadCount > lastNotificationCheck) {
+                // 有新通知 - 仅对新出现的显示弹窗（可点击跳转，最多5条）
+                const newCount = Math.min(unreadCount - lastNotificationCheck, 5);
+                const res2 = await fetch(API_BASE + '/notifications?unread=1&limit=' + newCount, {
+                    headers: { 'Authorization': 'Bearer ' + token }
                 });
+                if (res2.ok) {
+                    const data = await res2.json();
+                    data.notifications.forEach(n => {
+                        showNotificationPopup(n);
+                    });
+                }
             }
 
-            lastNotificationCheck = unread.length;
+            lastNotificationCheck = unreadCount;
         }
     } catch (error) {
         console.error('检查通知失败:', error);
@@ -746,7 +901,13 @@ async function openNotificationTarget(storyId, commentId, notificationId) {
         await new Promise(r => setTimeout(r, 180));
 
         if (commentId) {
-            const el = document.getElementById('comment-' + commentId);
+            // 目标评论可能不在第一页，逐页加载直到找到或没有更多
+            let el = document.getElementById('comment-' + commentId);
+            let pagination = window.currentStoryDetail ? window.currentStoryDetail.comments_pagination : null;
+            while (!el && pagination && pagination.has_more) {
+                pagination = await loadMoreComments(storyId, pagination.next_cursor);
+                el = document.getElementById('comment-' + commentId);
+            }
             if (el) {
                 el.scrollIntoView({ behavior: 'smooth', block: 'center' });
                 el.classList.add('comment-highlight');
@@ -792,12 +953,10 @@ async function showNotificationCenter() {
     }
 
     try {
-        const res = await fetch(API_BASE + '/notifications', { headers: { 'Authorization': 'Bearer ' + token } });
-        if (!res.ok) return showToast('无法加载通知', 'error');
-        const notifications = await res.json();
-
-        // cache notifications for client-side filtering/pagination
-        notificationsCache = notifications || [];
+        // cache notifications for client-side filtering/pagination (older pages are fetched on demand)
+        notificationsCache = [];
+        notifNextCursor = null;
+        if (!(await fetchNotificationsPage())) return showToast('无法加载通知', 'error');
         notifCurrentPage = 1;
 
         // render UI controls and list
@@ -903,9 +1062,9 @@ async function showNotificationCenter() {
         if (markAllBtn) markAllBtn.onclick = async () => {
             await markAllNotificationsRead();
             // refresh view
-            const res2 = await fetch(API_BASE + '/notifications', { headers: { 'Authorization': 'Bearer ' + token } });
-            if (res2.ok) {
-                notificationsCache = await res2.json();
+            notificationsCache = [];
+            notifNextCursor = null;
+            if (await fetchNotificationsPage()) {
                 notifCurrentPage = 1;
                 renderNotificationListPage();
                 renderNotificationPagination();
@@ -918,6 +1077,19 @@ async function showNotificationCenter() {
     }
 }
 
+// 拉取下一页通知并追加到缓存；首次调用（notifNextCursor 为空）拉取第一页
+async function fetchNotificationsPage() {
+    let url = API_BASE + '/notifications?limit=50';
+    if (notifNextCursor) url += '&cursor=' + encodeURIComponent(notifNextCursor);
+    const res = await fetch(url, { headers: { 'Authorization': 'Bearer ' + token } });
+    if (!res.ok) return false;
+    const data = await res.json();
+    notificationsCache = notificationsCache.concat(data.notifications);
+    notifHasMore = data.pagination.has_more;
+    notifNextCursor = data.pagination.next_cursor;
+    return true;
+}
+
 function getFilteredNotifications() {
     const filterBtn = document.getElementById('notification-filter-button');
     const mode = (filterBtn && filterBtn.dataset && filterBtn.dataset.value) ? filterBtn.dataset.value : 'all';
@@ -1023,7 +1195,7 @@ function renderNotificationPagination() {
     const nextBtn = document.createElement('button');
     nextBtn.className = 'macos3-button';
     nextBtn.textContent = '▶';
-    if (notifCurrentPage >= pages) {
+    if (notifCurrentPage >= pages && !notifHasMore) {
         nextBtn.disabled = true;
         nextBtn.style.opacity = '0.5';
     } else {
@@ -1039,17 +1211,33 @@ function renderNotificationPagination() {
 }
 
 // global helper for pagination buttons
-function changeNotifPage(p) {
+async function changeNotifPage(p) {
+    // 翻到已加载部分之后时，向服务端取更早的通知
+    while (notifHasMore && getFilteredNotifications().length < p * notifPerPage) {
+        if (!(await fetchNotificationsPage())) break;
+    }
     notifCurrentPage = p;
     renderNotificationListPage();
     renderNotificationPagination();
 }
 
 async function markAllNotificationsRead() {
-    if (!notificationsCache || notificationsCache.length === 0) return;
-    const unread = notificationsCache.filter(n => !n.is_read).map(n => n.id);
-    if (unread.length === 0) return;
-    await markNotificationsRead(unread);
+    try {
+        // 服务端一次标记全部未读（包括尚未加载的更早通知）
+        const res = await fetch(API_BASE + '/notifications/read', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Authorization': 'Bearer ' + token
+            },
+            body: JSON.stringify({ all: true })
+        });
+        if (!res.ok) return;
+    } catch (err) {
+        console.error('标记通知已读失败:', err);
+        return;
+    }
+    lastNotificationCheck = 0;
     // mark local cache
     notificationsCache.forEach(n => { n.is_read = true; });
     updateNotificationBadge(0);
@@ -1127,8 +1315,7 @@ async function showStoryDetail(storyId) {
         // 保存当前故事ID到全局变量
         window.currentStoryId = storyId;
         
-        const response = await fetch(API_BASE + '/stories/' + storyId);
-        const story = await response.json();
+        const { data: story } = await fetchWithETag(API_BASE + '/stories/' + storyId);
         
         // 追踪用户点击的分类
         if (currentUser && story.category && token) {
@@ -1178,57 +1365,14 @@ async function showStoryDetail(storyId) {
         
         html += '<div class="comment-section"><h3 style="color: #6b0080; border-bottom: 2px dashed #6b0080; padding-bottom: 8px;">💬 评论</h3>';
         
-        if (story.comments && story.comments.length > 0) {
-            // 构建评论树结构
-            const commentMap = {};
-            const topLevelComments = [];
-            
-            // 第一遍：创建所有评论的映射
-            story.comments.forEach(c => {
-                commentMap[c.id] = {...c, replies: []};
-            });
-            
-            // 第二遍：构建树结构
-            story.comments.forEach(c => {
-                if (c.parent_id && commentMap[c.parent_id]) {
-                    commentMap[c.parent_id].replies.push(commentMap[c.id]);
-                } else {
-                    topLevelComments.push(commentMap[c.id]);
-                }
-            });
-            
-            // 渲染评论树
-            const renderComment = (comment, isReply = false) => {
-                const indent = isReply ? 'margin-left: 20px; border-left: 2px solid #ccc; padding-left: 10px;' : '';
-                let commentHtml = '<div id="comment-' + comment.id + '" class="comment-item" style="' + indent + '">' +
-                    '<div class="comment-author">' + escapeHtml(comment.author.username) + ' ' + comment.author.avatar + '</div>' +
-                    '<div class="comment-text">' + escapeHtml(comment.content) + '</div>' +
-                    '<div class="comment-time">' + formatDate(comment.created_at);
-                
-                // 添加回复按钮（如果未封贴且用户已登录）
-                const isLocked = story.current_state === 'locked' || (story.title && story.title.includes('【已封贴】'));
-                if (!isLocked && currentUser) {
-                    commentHtml += ' <a href="#" onclick="showReplyBox(' + comment.id + ', \'' + escapeHtml(comment.author.username) + '\'); return false;" style="color: #6b0080; font-size: 10px; margin-left: 10px;">回复</a>';
-                }
-                
-                commentHtml += '</div>' +
-                    '<div id="reply-box-' + comment.id + '" style="display: none; margin-top: 8px;"></div>' +
-                    '</div>';
-                
-                // 渲染子回复
-                if (comment.replies && comment.replies.length > 0) {
-                    comment.replies.forEach(reply => {
-                        commentHtml += renderComment(reply, true);
-                    });
-                }
-                
-                return commentHtml;
-            };
-            
-            topLevelComments.forEach(c => {
-                html += renderComment(c);
-            });
-        }
+        // 服务端已组装好评论树（replies），这里只渲染第一页，其余按需加载
+        window.currentStoryDetail = story;
+        html += '<div id="comment-list">';
+        (story.comments || []).forEach(c => {
+            html += renderComment(c, story);
+        });
+        html += '</div>';
+        html += renderLoadMoreComments(storyId, story.comments_pagination);
         
         // 检查是否封贴
         const isLocked = story.current_state === 'locked' || (story.title && story.title.includes('【已封贴】'));
@@ -1267,6 +1411,67 @@ async function showStoryDetail(storyId) {
     }
 }
 
+function renderComment(comment, story, isReply = false) {
+    const indent = isReply ? 'margin-left: 20px; border-left: 2px solid #ccc; padding-left: 10px;' : '';
+    let commentHtml = '<div id="comment-' + comment.id + '" class="comment-item" style="' + indent + '">' +
+        '<div class="comment-author">' + escapeHtml(comment.author.username) + ' ' + comment.author.avatar + '</div>' +
+        '<div class="comment-text">' + escapeHtml(comment.content) + '</div>' +
+        '<div class="comment-time">' + formatDate(comment.created_at);
+    
+    // 添加回复按钮（如果未封贴且用户已登录）
+    const isLocked = story.current_state === 'locked' || (story.title && story.title.includes('【已封贴】'));
+    if (!isLocked && currentUser) {
+        commentHtml += ' <a href="#" onclick="showReplyBox(' + comment.id + ', \'' + escapeHtml(comment.author.username) + '\'); return false;" style="color: #6b0080; font-size: 10px; margin-left: 10px;">回复</a>';
+    }
+    
+    commentHtml += '</div>' +
+        '<div id="reply-box-' + comment.id + '" style="display: none; margin-top: 8px;"></div>' +
+        '</div>';
+    
+    // 渲染子回复
+    if (comment.replies && comment.replies.length > 0) {
+        comment.replies.forEach(reply => {
+            commentHtml += renderComment(reply, story, true);
+        });
+    }
+    
+    return commentHtml;
+}
+
+function renderLoadMoreComments(storyId, pagination) {
+    if (!pagination || !pagination.has_more) {
+        return '<div id="comments-load-more"></div>';
+    }
+    return '<div id="comments-load-more" style="text-align: center; margin: 10px 0;">' +
+        '<button class="macos3-button" onclick="loadMoreComments(' + storyId + ', ' + pagination.next_cursor + ')">加载更多评论</button>' +
+        '</div>';
+}
+
+async function loadMoreComments(storyId, cursor) {
+    try {
+        const res = await fetch(API_BASE + '/stories/' + storyId + '/comments?cursor=' + cursor);
+        if (!res.ok) throw new Error('HTTP ' + res.status);
+        const data = await res.json();
+        const story = window.currentStoryDetail;
+        const listEl = document.getElementById('comment-list');
+        if (!story || story.id !== storyId || !listEl) return;
+        
+        let html = '';
+        data.comments.forEach(c => {
+            html += renderComment(c, story);
+        });
+        listEl.insertAdjacentHTML('beforeend', html);
+        
+        const moreEl = document.getElementById('comments-load-more');
+        if (moreEl) moreEl.outerHTML = renderLoadMoreComments(storyId, data.pagination);
+        return data.pagination;
+    } catch (error) {
+        console.error('加载更多评论失败:', error);
+        showToast('加载失败', 'error');
+        return null;
+    }
+}
+
 function showReplyBox(commentId, authorName) {
     // 隐藏其他回复框
     document.querySelectorAll('[id^="reply-box-"]').forEach(box => {
@@ -1352,8 +1557,9 @@ async function submitReply(event, parentCommentId) {
         });
         
         if (res.ok) {
+            const data = await res.json();
             showToast('已回复', 'success');
-            setTimeout(() => showStoryDetail(storyId), 1500);
+            showStoryDetail(storyId).then(() => streamAiReply(storyId, data));
         } else {
             const err = await res.json();
             showToast(err.error || '回复失败', 'error');
@@ -1390,8 +1596,9 @@ async function submitComment(event, storyId) {
         });
         
         if (res.ok) {
+            const data = await res.json();
             showToast('已发表', 'success');
-            setTimeout(() => showStoryDetail(storyId), 1500);
+            showStoryDetail(storyId).then(() => streamAiReply(storyId, data));
         } else {
             const err = await res.json();
             showToast(err.error || '发表失败', 'error');
@@ -1488,8 +1695,9 @@ async function handleAuthSubmit(event) {
             closeAuthModal();
             showToast((isReg ? '注册' : '登录') + '成功', 'success');
             
-            // 登录成功后立即检查通知
+            // 登录成功后立即检查通知，并用新 token 重新连接推送
             checkNotifications();
+            startEventStream();
         } else {
             const err = await res.json();
             showToast(err.error || '错误', 'error');
@@ -1525,6 +1733,7 @@ function logout() {
     localStorage.removeItem('token');
     localStorage.removeItem('currentUser');
     updateAuthUI();
+    startEventStream();
     showToast('已登出', 'success');
 }
 
@@ -1532,16 +1741,14 @@ async function verifyToken() {
     if (!token) return;
     
     try {
-        const res = await fetch(API_BASE + '/notifications', {
+        const res = await fetch(API_BASE + '/me', {
             headers: { 'Authorization': 'Bearer ' + token }
         });
         
         if (res.ok) {
-            const userStr = localStorage.getItem('currentUser');
-            if (userStr) {
-                currentUser = JSON.parse(userStr);
-                updateAuthUI();
-            }
+            currentUser = await res.json();
+            localStorage.setItem('currentUser', JSON.stringify(currentUser));
+            updateAuthUI();
         } else {
             localStorage.removeItem('token');
             token = null;
@@ -1,5 +1,5 @@
-import json
 from datetime import datetime, timedelta
+from sqlalchemy.orm.attributes import set_committed_value
 from ai_engine import generate_evidence_image, generate_evidence_audio
 
 # Story state machine
@@ -66,76 +66,81 @@ STORY_STATES = {
     }
 }
 
+def active_state_filter(column):
+    """current_state != 'ended' 的等价条件
+
+    拆成两个范围条件后 SQLite 可以对 ix_story_current_state 做两段索引查找，
+    完结的故事越多越省；直接写 != 只能全表扫描。
+    """
+    from sqlalchemy import or_
+    return or_(column < 'ended', column > 'ended')
+
+# 互动次数达到该值时提前推进状态
+INTERACTION_THRESHOLD = 10
+
 def initialize_story_state(story):
     """Initialize state machine for a story"""
-    state_data = {
-        'current_state': 'init',
-        'state_history': [
-            {
-                'state': 'init',
-                'timestamp': datetime.utcnow().isoformat(),
-                'trigger': 'story_created'
-            }
-        ],
-        'next_transition_time': (datetime.utcnow() + timedelta(hours=STORY_STATES['init']['duration_hours'])).isoformat(),
-        'user_interaction_count': 0,
-        'evidence_generated': 0
-    }
-    
-    story.state_data = json.dumps(state_data)
+    now = datetime.utcnow()
     story.current_state = 'init'
-    
+    story.next_transition_time = now + timedelta(hours=STORY_STATES['init']['duration_hours'])
+    story.user_interaction_count = 0
+    story.evidence_generated = 0
+    record_state_event(story, 'init', 'story_created', now)
+
     return story
 
+def record_state_event(story, state, trigger, timestamp):
+    """追加一条状态历史；通过 backref 关联，不加载故事已有的历史记录"""
+    from app import db, StoryStateEvent
+    db.session.add(StoryStateEvent(story=story, state=state, trigger=trigger, created_at=timestamp))
+
+def needs_state_init(story):
+    """尚未进入状态机的故事（用户发帖、预置帖）；封贴和已完结的故事不参与"""
+    return story.next_transition_time is None and story.current_state not in ('locked', 'ended')
+
 def check_state_transition(story):
     """Check if story should transition to next state"""
-    if not story.state_data:
-        return False
-    
-    state_data = json.loads(story.state_data)
-    
-    # Check if next_transition_time exists
-    if 'next_transition_time' not in state_data:
-        # Initialize state data if missing
-        initialize_story_state(story)
+    if story.next_transition_time is None:
         return False
-    
+
     # Check if it's time to transition
-    next_transition_time = datetime.fromisoformat(state_data['next_transition_time'])
-    
-    if datetime.utcnow() >= next_transition_time:
+    if datetime.utcnow() >= story.next_transition_time:
         return True
-    
+
     # Check if user interaction threshold is met (can trigger early transition)
-    if state_data.get('user_interaction_count', 0) >= 10:
+    if (story.user_interaction_count or 0) >= INTERACTION_THRESHOLD:
         return True
-    
+
     return False
 
+def due_for_transition_filter(now):
+    """check_state_transition 的 SQL 版本，供定时任务直接筛出需要推进的故事"""
+    from sqlalchemy import or_
+    from app import Story
+    return or_(Story.next_transition_time <= now, Story.user_interaction_count >= INTERACTION_THRESHOLD)
+
 def transition_story_state(story, app_context):
     """Transition story to next state"""
-    from app import db, Evidence
-    from ai_engine import generate_ai_story, generate_evidence_image, generate_evidence_audio
-    
-    if not story.state_data:
+    from app import db
+
+    if needs_state_init(story):
         initialize_story_state(story)
         db.session.commit()
         return
-    
-    state_data = json.loads(story.state_data)
-    current_state = state_data['current_state']
-    
+
+    current_state = story.current_state
+
     # Get possible next states
-    possible_next_states = STORY_STATES[current_state]['next_states']
-    
+    possible_next_states = STORY_STATES.get(current_state, {}).get('next_states')
+
     if not possible_next_states:
         return  # Story has ended
-    
+
     # Choose next state based on user interaction
     # More interactions = more investigation/revelation path
     # Fewer interactions = more escalation/danger path
-    interaction_ratio = state_data['user_interaction_count'] / 10.0
-    
+    interaction_ratio = (story.user_interaction_count or 0) / float(INTERACTION_THRESHOLD)
+
     if interaction_ratio > 0.7 and 'investigation' in possible_next_states:
         next_state = 'investigation'
     elif interaction_ratio > 0.5 and 'revelation' in possible_next_states:
@@ -148,35 +153,34 @@ def transition_story_state(story, app_context):
         # Random choice from available
         import random
         next_state = random.choice(possible_next_states)
-    
+
     # Update state
-    state_data['current_state'] = next_state
-    state_data['state_history'].append({
-        'state': next_state,
-        'timestamp': datetime.utcnow().isoformat(),
-        'trigger': 'time_based' if datetime.utcnow() >= datetime.fromisoformat(state_data['next_transition_time']) else 'interaction_based'
-    })
-    
-    # Set next transition time
+    now = datetime.utcnow()
+    trigger = 'time_based' if story.next_transition_time and now >= story.next_transition_time else 'interaction_based'
+    story.current_state = next_state
+    record_state_event(story, next_state, trigger, now)
+
+    # Set next transition time（结局状态时长为 0：下一轮立即进入 ended；ended 不再调度）
     duration = STORY_STATES[next_state]['duration_hours']
     if duration > 0:
-        state_data['next_transition_time'] = (datetime.utcnow() + timedelta(hours=duration)).isoformat()
-    
+        story.next_transition_time = now + timedelta(hours=duration)
+    elif STORY_STATES[next_state]['next_states']:
+        story.next_transition_time = now
+    else:
+        story.next_transition_time = None
+
     # Reset interaction counter
-    state_data['user_interaction_count'] = 0
-    
-    story.state_data = json.dumps(state_data)
-    story.current_state = next_state
-    
+    story.user_interaction_count = 0
+
     # Generate new evidence based on state
     with app_context():
         generate_state_evidence(story, next_state)
-    
+
     db.session.commit()
 
 def generate_state_evidence(story, state):
     """Generate appropriate evidence for current state"""
-    from app import db, Evidence, Comment
+    from app import db, Evidence, Comment, bump_story_counters
     
     # Generate evidence based on state
     evidence_types = {
@@ -203,6 +207,7 @@ def generate_state_evidence(story, state):
                     description=f'在{story.location}发现的可疑照片'
                 )
                 db.session.add(evidence)
+                bump_story_counters(story.id, evidence=1)
         
         elif evidence_type == 'audio':
             audio_path = generate_evidence_audio(story.content)
@@ -214,6 +219,7 @@ def generate_state_evidence(story, state):
                     description=f'{story.ai_persona}的录音记录'
                 )
                 db.session.add(evidence)
+                bump_story_counters(story.id, evidence=1)
         
         elif evidence_type == 'text':
             # Generate text update via AI
@@ -237,23 +243,25 @@ def generate_state_evidence(story, state):
                 is_ai_response=True
             )
             db.session.add(comment)
+            bump_story_counters(story.id, comments=1)
     
     # Update evidence count
-    if story.state_data:
-        state_data = json.loads(story.state_data)
-        state_data['evidence_generated'] += len(types_to_generate)
-        story.state_data = json.dumps(state_data)
+    story.evidence_generated = (story.evidence_generated or 0) + len(types_to_generate)
 
 def record_user_interaction(story):
-    """Record user interaction with story"""
-    if not story.state_data:
+    """Record user interaction with story
+
+    计数用一条原子 UPDATE ... RETURNING 累加（随调用方的 commit 提交），并发评论不会互相覆盖。
+    返回累加后的互动次数。
+    """
+    from app import bump_story_counters
+
+    if needs_state_init(story):
         initialize_story_state(story)
-    
-    state_data = json.loads(story.state_data)
-    
-    # 确保 user_interaction_count 存在
-    if 'user_interaction_count' not in state_data:
-        state_data['user_interaction_count'] = 0
-    
-    state_data['user_interaction_count'] += 1
-    story.state_data = json.dumps(state_data)
+
+    counters = bump_story_counters(story.id, interactions=1)
+    if counters is None:
+        return None
+    # 同步到已加载的对象上，但不标记为已修改（否则 flush 时会用旧值覆盖其他事务的累加）
+    set_committed_value(story, 'user_interaction_count', counters['user_interaction_count'])
+    return counters['user_interaction_count']
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""测试重置 AI 故事：作为后台任务执行，集合删除不留孤儿行，三个预置帖并发生成"""
+
+import threading
+import time
+
+import ai_engine
+import app as app_module
+from app import (
+    app, db, Story, Comment, Evidence, Follow, Notification, StoryStateEvent, UserStats
+)
+
+ADMIN = {'X-ADMIN-KEY': app.config['SECRET_KEY']}
+
+
+def slow_story(calls):
+    def generate_ai_story(category=None, location=None, persona=None):
+        calls.append(threading.get_ident())
+        time.sleep(0.3)
+        return None  # 使用内置的备用内容
+    return generate_ai_story
+
+
+def wait_for(client, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f'/api/admin/jobs/{job_id}', headers=ADMIN).get_json()
+        if job['status'] in ('succeeded', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError('任务超时')
+
+
+def test_reset_runs_as_job_and_leaves_no_orphans(monkeypatch, create_user):
+    calls = []
+    monkeypatch.setattr(ai_engine, 'generate_ai_story', slow_story(calls))
+    monkeypatch.setattr(app_module, 'maybe_add_fake_comment', lambda *args, **kwargs: None)
+
+    user_id = create_user('reset_user')
+    with app.app_context():
+        ai_story = Story(title='旧AI故事', content='内容', is_ai_generated=True)
+        anomaly = Story(title='时空异常', content='内容', category='time_anomaly')
+        kept = Story(title='用户故事', content='内容', category='urban')
+        db.session.add_all([ai_story, anomaly, kept])
+        db.session.flush()
+        comment = Comment(content='评论', story_id=ai_story.id, author_id=user_id)
+        db.session.add(comment)
+        db.session.flush()
+        db.session.add_all([
+            Comment(content='保留的评论', story_id=kept.id, author_id=user_id),
+            Evidence(story_id=anomaly.id, evidence_type='image', file_path='/x.png'),
+            StoryStateEvent(story_id=ai_story.id, state='init', trigger='story_created'),
+            Follow(user_id=user_id, story_id=ai_story.id),
+            Notification(user_id=user_id, story_id=ai_story.id, comment_id=comment.id,
+                         notification_type='new_reply', content='通知'),
+        ])
+        db.session.commit()
+        app_module.recount_user_stats([user_id])
+        db.session.commit()
+        removed_ids = [ai_story.id, anomaly.id]
+        kept_id = kept.id
+
+    with app.test_client() as client:
+        assert client.post('/api/admin/reset_ai_stories').status_code == 403
+
+        start = time.perf_counter()
+        response = client.post('/api/admin/reset_ai_stories', headers=ADMIN)
+        assert response.status_code == 202
+        # 接口立即返回，不等模型生成
+        assert time.perf_counter() - start < 0.3
+        job = wait_for(client, response.get_json()['job_id'])
+
+    assert job['status'] == 'succeeded', job['error']
+    assert len(job['result']['seeded']) == 3
+    # 三次生成并发执行
+    assert len(calls) == 3 and len(set(calls)) == 3
+
+    with app.app_context():
+        assert Story.query.filter(Story.id.in_(removed_ids)).count() == 0
+        for model in (Comment, Evidence, Follow, StoryStateEvent):
+            assert model.query.filter(model.story_id.in_(removed_ids)).count() == 0
+        assert Notification.query.filter_by(user_id=user_id).count() == 0
+        assert db.session.get(Story, kept_id) is not None
+        assert db.session.get(UserStats, user_id).total_comments == 1
+        seeded = Story.query.filter(Story.id.in_(job['result']['seeded_ids'])).all()
+        assert len(seeded) == 3 and all(s.is_ai_generated for s in seeded)
+
+
+def test_unknown_job_is_404():
+    with app.test_client() as client:
+        assert client.get('/api/admin/jobs/nope', headers=ADMIN).status_code == 404
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""测试 AI 楼主回复的流式推送：思考内容不外泄，部分回复逐段推送，最终回复照常保存"""
+
+import json
+import time
+
+import app as app_module
+from ai_engine import ThinkTagStripper, strip_think_partial
+from app import app, db, Story, Comment, generate_token, reply_streams
+from bench_llm_client import StubServer
+from test_event_stream import read_event
+
+
+def test_strip_think_partial_handles_chunk_boundaries():
+    assert strip_think_partial('<think>分析一下') == ''
+    assert strip_think_partial('<think>分析</think>我昨晚<thi') == '我昨晚'
+    assert strip_think_partial('先想想</think>\n我不敢回去') == '我不敢回去'
+
+    stripper = ThinkTagStripper()
+    visible = [stripper.feed(piece) for piece in ['<th', 'ink>嗯', '</thi', 'nk>我', '昨晚']]
+    assert visible == [None, None, None, '我', '我昨晚']
+
+
+def test_reply_is_streamed_then_saved(monkeypatch, create_user, create_story):
+    monkeypatch.setattr(app_module, 'generate_evidence_for_story', lambda *args, **kwargs: None)
+    monkeypatch.setattr(app_module, 'maybe_add_fake_comment', lambda *args, **kwargs: None)
+    monkeypatch.setattr(app_module, 'AI_REPLY_DELAY_SECONDS', 0)
+
+    user_id = create_user('stream_user')
+    story_id = create_story('流式回复测试', content='地铁末班车上的镜子', category='subway_ghost')
+
+    reply = '<think>网友在问镜子，我应该表现得害怕。</think>我昨晚又去看了那面镜子，它还在。'
+    with StubServer(reply=reply, chunk_chars=3, chunk_delay=0.02) as stub:
+        monkeypatch.setenv('USE_LM_STUDIO', 'true')
+        monkeypatch.setenv('LM_STUDIO_URL', stub.url)
+        with app.test_client() as client:
+            started = time.monotonic()
+            created = client.post(f'/api/stories/{story_id}/comments', json={'content': '镜子后来怎么样了？'},
+                                  headers={'Authorization': 'Bearer ' + generate_token(user_id)})
+            assert created.status_code == 201
+            body = created.get_json()
+            comment_id = body['comment']['id']
+
+            response = client.get(body['ai_reply_stream_url'], buffered=False)
+            assert response.mimetype == 'text/event-stream'
+            events = iter(response.response)
+            partials = []
+            first_partial_at = None
+            while True:
+                event_type, data = read_event(events)
+                if event_type != 'partial':
+                    break
+                first_partial_at = first_partial_at or time.monotonic()
+                partials.append(data['text'])
+            response.close()
+
+    assert stub.requests[0]['stream'] is True
+    assert event_type == 'done'
+    assert first_partial_at - started < 1.0
+    assert partials and all('think' not in text and '应该' not in text for text in partials)
+    assert partials[-1] == '我昨晚又去看了那面镜子，它还在。'
+    assert data['content'] == '【楼主回复】我昨晚又去看了那面镜子，它还在。'
+    assert data['parent_id'] == comment_id and data['is_ai_response']
+
+    with app.app_context():
+        saved = Comment.query.filter_by(parent_id=comment_id, is_ai_response=True).one()
+        assert saved.content == data['content']
+        assert db.session.get(Story, story_id).comments_count == 2
+
+    # 保留期过后从数据库返回最终回复
+    monkeypatch.setattr(reply_streams, '_retention', 0)
+    with app.test_client() as client:
+        late = client.get(f'/api/comments/{comment_id}/ai-reply/stream')
+        event = late.get_data(as_text=True)
+        assert 'event: done' in event
+        assert json.loads(event.split('data: ', 1)[1])['id'] == saved.id
+
+
+def test_unknown_comment_stream_is_404():
+    with app.test_client() as client:
+        assert client.get('/api/comments/987654/ai-reply/stream').status_code == 404
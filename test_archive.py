@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""测试冷数据归档：完结旧故事连同子表和相关通知移入 archived_*，已读旧通知归档，归档后的故事仍可按 id 读取"""
+
+from datetime import datetime, timedelta
+
+from app import (
+    app, db, Story, Comment, Evidence, Follow, Notification, StoryStateEvent, archive_tables
+)
+from archive import run_archive
+
+OLD = datetime.utcnow() - timedelta(days=60)
+
+
+def count(table, **filters):
+    query = db.select(db.func.count()).select_from(table)
+    for name, value in filters.items():
+        query = query.where(table.c[name] == value)
+    return db.session.execute(query).scalar()
+
+
+def test_archive_moves_cold_rows_and_keeps_them_readable(create_story, create_user):
+    user_id = create_user('archive_user')
+    # 完结时间看状态历史：updated_at 刚被计数累加刷新的旧故事照样归档，刚完结的老故事不归档
+    cold_id = create_story('已完结旧故事', current_state='ended', created_at=OLD, updated_at=datetime.utcnow())
+    warm_id = create_story('刚完结的故事', current_state='ended', created_at=OLD, updated_at=OLD)
+    active_id = create_story('进行中的旧故事', current_state='danger', created_at=OLD, updated_at=OLD)
+
+    with app.app_context():
+        root = Comment(content='顶级评论', story_id=cold_id, author_id=user_id, created_at=OLD)
+        db.session.add(root)
+        db.session.flush()
+        db.session.add_all([
+            Comment(content='回复', story_id=cold_id, parent_id=root.id, is_ai_response=True, created_at=OLD),
+            Evidence(story_id=cold_id, evidence_type='image', file_path='/x.png', created_at=OLD),
+            StoryStateEvent(story_id=cold_id, state='ended', trigger='time_based', created_at=OLD),
+            StoryStateEvent(story_id=warm_id, state='ended', trigger='time_based'),
+            Follow(user_id=user_id, story_id=cold_id),
+            Notification(user_id=user_id, notification_type='new_reply', content='旧已读', is_read=True, created_at=OLD),
+            Notification(user_id=user_id, notification_type='new_reply', content='旧未读', is_read=False, created_at=OLD),
+            Notification(user_id=user_id, notification_type='new_reply', content='新已读', is_read=True),
+            Notification(user_id=user_id, story_id=cold_id, comment_id=root.id, notification_type='new_reply',
+                         content='旧故事的回复', is_read=False),
+        ])
+        db.session.commit()
+        root_id = root.id
+
+        counts = run_archive(story_days=30, notification_days=30)
+        assert counts['story'] >= 1 and counts['comment'] >= 2 and counts['notification'] >= 1
+        assert counts['story_notification'] >= 1
+
+        assert db.session.get(Story, cold_id) is None
+        assert db.session.get(Story, warm_id) is not None
+        assert db.session.get(Story, active_id) is not None
+        assert Comment.query.filter_by(story_id=cold_id).count() == 0
+        assert Evidence.query.filter_by(story_id=cold_id).count() == 0
+        assert Follow.query.filter_by(story_id=cold_id).count() == 0
+        assert count(archive_tables['comment'], story_id=cold_id) == 2
+        assert count(archive_tables['evidence'], story_id=cold_id) == 1
+        assert count(archive_tables['story_state_event'], story_id=cold_id) == 1
+
+        remaining = {n.content for n in Notification.query.filter_by(user_id=user_id)}
+        assert remaining == {'旧未读', '新已读'}
+        assert count(archive_tables['notification'], user_id=user_id) == 2
+        assert count(archive_tables['notification'], comment_id=root_id) == 1
+
+    with app.test_client() as client:
+        detail = client.get(f'/api/stories/{cold_id}').get_json()
+        assert detail['archived'] is True
+        assert detail['title'] == '已完结旧故事'
+        assert len(detail['evidence']) == 1
+        [top] = detail['comments']
+        assert top['author']['username'] == 'archive_user'
+        assert [r['content'] for r in top['replies']] == ['回复']
+
+        comments = client.get(f'/api/stories/{cold_id}/comments').get_json()
+        assert comments['pagination']['has_more'] is False
+
+        feed_ids = {s['id'] for s in client.get('/api/stories?per_page=100').get_json()['stories']}
+        assert cold_id not in feed_ids and warm_id in feed_ids
+
+        assert client.get('/api/stories/999999').status_code == 404
+
+
+def test_archived_ids_are_not_reused(create_story):
+    # 最大 id 的故事归档后，新故事不能拿到同一个 id，否则再次归档时主键冲突、按 id 会读到旧故事
+    with app.app_context():
+        first_id = create_story('最新的完结故事', current_state='ended', created_at=OLD)
+        assert run_archive(story_days=30)['story'] >= 1
+
+        second_id = create_story('归档后的新故事', current_state='ended', created_at=OLD)
+        assert second_id > first_id
+        assert run_archive(story_days=30)['story'] >= 1
+
+    with app.test_client() as client:
+        assert client.get(f'/api/stories/{first_id}').get_json()['title'] == '最新的完结故事'
+        assert client.get(f'/api/stories/{second_id}').get_json()['title'] == '归档后的新故事'
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""测试分类点击写后缓冲：点击只进内存，批量 upsert 写回后计数不丢失"""
+
+import threading
+import time
+
+from app import app, db, CategoryClick, category_click_buffer, flush_category_clicks, generate_token
+from write_behind import CounterBuffer
+
+
+def persisted_clicks(user_id):
+    with app.app_context():
+        rows = CategoryClick.query.filter_by(user_id=user_id).all()
+        return {row.category: row.click_count for row in rows}
+
+
+def test_clicks_are_buffered_then_upserted(create_user):
+    user_id = create_user('click_buffer')
+    headers = {'Authorization': 'Bearer ' + generate_token(user_id)}
+    with app.app_context():
+        # 已有记录：写回时在原值上累加
+        db.session.add(CategoryClick(user_id=user_id, category='subway_ghost', click_count=5))
+        db.session.commit()
+
+    with app.test_client() as client:
+        for category in ['subway_ghost'] * 3 + ['campus_mystery'] * 2:
+            response = client.post('/api/track-category-click', json={'category': category}, headers=headers)
+            assert response.status_code == 202
+        assert response.get_json()['pending_clicks'] == 2
+
+    # 点击接口本身不写库
+    assert persisted_clicks(user_id) == {'subway_ghost': 5}
+
+    category_click_buffer.flush()
+    assert persisted_clicks(user_id) == {'subway_ghost': 8, 'campus_mystery': 2}
+
+
+def test_concurrent_clicks_lose_nothing(create_user):
+    user_ids = [create_user(f'click_concurrent_{i}') for i in range(4)]
+    clicks_per_thread = 50
+    done = threading.Event()
+
+    def clicker(user_id):
+        headers = {'Authorization': 'Bearer ' + generate_token(user_id)}
+        with app.test_client() as client:
+            for i in range(clicks_per_thread):
+                category = 'subway_ghost' if i % 2 else 'campus_mystery'
+                client.post('/api/track-category-click', json={'category': category}, headers=headers)
+
+    def flusher():
+        while not done.is_set():
+            category_click_buffer.flush()
+
+    flush_thread = threading.Thread(target=flusher)
+    flush_thread.start()
+    threads = [threading.Thread(target=clicker, args=(user_id,)) for user_id in user_ids for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    done.set()
+    flush_thread.join()
+    category_click_buffer.flush()
+
+    for user_id in user_ids:
+        assert persisted_clicks(user_id) == {'subway_ghost': clicks_per_thread, 'campus_mystery': clicks_per_thread}
+
+
+def test_max_pending_triggers_early_flush(create_user):
+    user_id = create_user('click_max_pending')
+    buffer = CounterBuffer(flush_category_clicks, interval=60, name='test_clicks', max_pending=3)
+    for category in ('a', 'b', 'c'):
+        buffer.add((user_id, category))
+
+    deadline = time.time() + 5
+    while persisted_clicks(user_id) != {'a': 1, 'b': 1, 'c': 1} and time.time() < deadline:
+        time.sleep(0.05)
+    buffer.stop()
+    assert persisted_clicks(user_id) == {'a': 1, 'b': 1, 'c': 1}
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""测试故事列表/详情的 ETag 协商缓存：内容未变返回 304，评论、证据变更后失效"""
+
+from app import app, db, Comment, Evidence, bump_story_counters, story_view_buffer
+
+
+def test_story_list_returns_304_until_content_changes(create_story):
+    story_id = create_story('列表 ETag 测试')
+
+    with app.test_client() as client:
+        first = client.get('/api/stories?page=1&per_page=8')
+        etag = first.headers['ETag']
+        assert etag.startswith('W/')
+
+        again = client.get('/api/stories?page=1&per_page=8', headers={'If-None-Match': etag})
+        assert again.status_code == 304
+        assert again.data == b''
+
+        # 浏览量回写不算内容变化
+        client.get(f'/api/stories/{story_id}')
+        story_view_buffer.flush()
+        assert client.get('/api/stories?page=1&per_page=8', headers={'If-None-Match': etag}).status_code == 304
+
+        with app.app_context():
+            db.session.add(Comment(story_id=story_id, content='新评论'))
+            bump_story_counters(story_id, comments=1)
+            db.session.commit()
+
+        changed = client.get('/api/stories?page=1&per_page=8', headers={'If-None-Match': etag})
+        assert changed.status_code == 200
+        assert changed.headers['ETag'] != etag
+
+
+def test_story_detail_etag_changes_with_evidence(create_story):
+    story_id = create_story('详情 ETag 测试')
+
+    with app.test_client() as client:
+        etag = client.get(f'/api/stories/{story_id}').headers['ETag']
+        assert client.get(f'/api/stories/{story_id}', headers={'If-None-Match': etag}).status_code == 304
+
+        with app.app_context():
+            db.session.add(Evidence(story_id=story_id, evidence_type='image', file_path='/x.png'))
+            db.session.commit()
+
+        changed = client.get(f'/api/stories/{story_id}', headers={'If-None-Match': etag})
+        assert changed.status_code == 200
+        assert len(changed.get_json()['evidence']) == 1
+
+
+def test_rolled_back_writes_do_not_change_etag(create_story):
+    story_id = create_story('回滚 ETag 测试')
+
+    with app.test_client() as client:
+        etag = client.get(f'/api/stories/{story_id}').headers['ETag']
+
+        with app.app_context():
+            db.session.add(Comment(story_id=story_id, content='不会提交的评论'))
+            db.session.flush()
+            db.session.rollback()
+
+        assert client.get(f'/api/stories/{story_id}', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_writes_from_other_processes_invalidate_etag_and_feed_cache(create_story, monkeypatch):
+    from sqlalchemy import create_engine, text
+
+    import data_version
+    from app import content_version
+
+    create_story('其他进程写入 ETag 测试')
+    monkeypatch.setattr(content_version, '_poll_interval', 0)
+
+    with app.test_client() as client:
+        etag = client.get('/api/stories?page=1&per_page=8').headers['ETag']
+        assert client.get('/api/stories?page=1&per_page=8').headers['X-Cache'] == 'HIT'
+
+        # 另一个进程（归档 CLI、数据生成脚本）用自己的连接写入并推进共享版本号
+        with app.app_context():
+            other = create_engine(db.engine.url)
+        with other.begin() as conn:
+            conn.execute(text("DELETE FROM story WHERE title = '其他进程写入 ETag 测试'"))
+            data_version.bump_shared(conn)
+        other.dispose()
+
+        changed = client.get('/api/stories?page=1&per_page=8', headers={'If-None-Match': etag})
+        assert changed.status_code == 200 and changed.headers['X-Cache'] == 'MISS'
+        assert '其他进程写入 ETag 测试' not in {s['title'] for s in changed.get_json()['stories']}
+
+
+def test_archive_cli_bumps_the_shared_version(create_story):
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import text
+
+    from archive import run_archive
+
+    create_story('归档推进版本号', current_state='ended', created_at=datetime.utcnow() - timedelta(days=60))
+    with app.app_context():
+        before = db.session.execute(text("SELECT version FROM data_version WHERE name = 'content'")).scalar()
+        run_archive(story_days=30)
+        after = db.session.execute(text("SELECT version FROM data_version WHERE name = 'content'")).scalar()
+    assert after > before
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""测试 SSE 推送：广播事件所有连接都能收到，通知只推给对应用户，非法 token 被拒绝"""
+
+import json
+
+from app import app, event_bus, generate_token, publish_event
+
+
+def read_event(stream):
+    """跳过注释/心跳，返回下一条事件 (type, data)"""
+    while True:
+        chunk = next(stream)
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('utf-8')
+        fields = dict(
+            line.split(': ', 1) for line in chunk.strip().splitlines()
+            if line and not line.startswith(':') and ': ' in line
+        )
+        if 'event' in fields:
+            return fields['event'], json.loads(fields['data'])
+
+
+def open_stream(client, token=None):
+    url = '/api/events' + (f'?token={token}' if token else '')
+    response = client.get(url, buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    return response
+
+
+def test_broadcast_and_targeted_events():
+    with app.test_client() as client:
+        anonymous = open_stream(client)
+        user_stream = open_stream(client, generate_token(4242))
+        anon_iter, user_iter = iter(anonymous.response), iter(user_stream.response)
+
+        publish_event('comment_created', {'story_id': 1, 'comment_id': 7, 'parent_id': None})
+        publish_event('notification', {'story_id': 1}, user_ids=[4242])
+        publish_event('ai_reply', {'story_id': 1, 'comment_id': 8, 'parent_id': 7})
+
+        assert read_event(anon_iter) == ('comment_created', {'story_id': 1, 'comment_id': 7, 'parent_id': None})
+        # 匿名连接收不到个人通知，直接收到下一条广播
+        assert read_event(anon_iter)[0] == 'ai_reply'
+
+        assert read_event(user_iter)[0] == 'comment_created'
+        assert read_event(user_iter) == ('notification', {'story_id': 1})
+        assert read_event(user_iter)[0] == 'ai_reply'
+
+        anonymous.close()
+        user_stream.close()
+
+
+def test_closed_stream_unsubscribes():
+    with app.test_client() as client:
+        before = event_bus.subscriber_count()
+        stream = open_stream(client)
+        next(iter(stream.response))
+        assert event_bus.subscriber_count() == before + 1
+        stream.close()
+
+    assert event_bus.subscriber_count() == before
+
+
+def test_invalid_token_rejected():
+    with app.test_client() as client:
+        assert client.get('/api/events?token=not-a-token').status_code == 401
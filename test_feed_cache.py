@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""测试故事列表响应缓存：重复请求命中缓存，评论/故事提交后立即失效，分类过滤单独缓存"""
+
+from app import app, db, Comment, feed_cache
+
+
+def test_repeated_feed_requests_hit_cache(create_story):
+    create_story('缓存命中测试', category='subway_ghost')
+    before = feed_cache.stats()
+
+    with app.test_client() as client:
+        first = client.get('/api/stories?page=1&per_page=8')
+        second = client.get('/api/stories?page=1&per_page=8')
+
+    assert first.headers['X-Cache'] == 'MISS'
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_json() == first.get_json()
+
+    after = feed_cache.stats()
+    assert after['hits'] == before['hits'] + 1
+    assert after['misses'] == before['misses'] + 1
+
+
+def test_commit_invalidates_cached_pages(create_story):
+    story_id = create_story('缓存失效测试', category='subway_ghost')
+
+    with app.test_client() as client:
+        client.get('/api/stories?page=1&per_page=8')
+        assert client.get('/api/stories?page=1&per_page=8').headers['X-Cache'] == 'HIT'
+
+        with app.app_context():
+            db.session.add(Comment(story_id=story_id, content='让缓存失效的评论'))
+            db.session.commit()
+
+        assert client.get('/api/stories?page=1&per_page=8').headers['X-Cache'] == 'MISS'
+
+        new_id = create_story('提交后立即出现', category='subway_ghost')
+        ids = [s['id'] for s in client.get('/api/stories?page=1&per_page=8').get_json()['stories']]
+        assert new_id in ids
+
+
+def test_category_filter_is_cached_separately(create_story):
+    ghost_id = create_story('分类过滤测试', category='mirror_realm')
+
+    with app.test_client() as client:
+        everything = client.get('/api/stories?page=1&per_page=50')
+        filtered = client.get('/api/stories?page=1&per_page=50&category=mirror_realm')
+
+    assert filtered.headers['X-Cache'] == 'MISS'
+    stories = filtered.get_json()['stories']
+    assert ghost_id in [s['id'] for s in stories]
+    assert all(s['category'] == 'mirror_realm' for s in stories)
+    assert len(stories) < len(everything.get_json()['stories'])
+
+
+def test_cache_stats_requires_admin_key():
+    with app.test_client() as client:
+        assert client.get('/api/admin/cache_stats').status_code == 403
+        stats = client.get('/api/admin/cache_stats', headers={'X-ADMIN-KEY': app.config['SECRET_KEY']}).get_json()
+
+    assert {'hits', 'misses', 'hit_rate', 'size'} <= set(stats['feed'])
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""测试 LM Studio 客户端：长连接复用、失败重试、超时、并发上限与排队；ai_engine 的调用走共享客户端"""
+
+import threading
+import time
+
+import pytest
+
+import llm_client
+from bench_llm_client import StubServer
+
+
+def test_chat_completions_url_accepts_base_with_or_without_v1():
+    assert llm_client.chat_completions_url('http://host:1234') == 'http://host:1234/v1/chat/completions'
+    assert llm_client.chat_completions_url('http://host:1234/v1/') == 'http://host:1234/v1/chat/completions'
+
+
+def test_calls_reuse_one_connection_and_send_long_prompts():
+    prompt = '网' * 200000  # 远超单个命令行参数的长度上限
+    with StubServer() as stub:
+        for _ in range(5):
+            reply = llm_client.chat([{'role': 'user', 'content': prompt}], max_tokens=50, url=stub.url,
+                                    model='qwen')
+            assert reply == '我昨晚又听到了那个声音。'
+    assert len(stub.connections) == 1
+    assert stub.requests[0]['messages'][0]['content'] == prompt
+    assert stub.requests[0]['max_tokens'] == 50
+    assert stub.requests[0]['model'] == 'qwen'
+
+
+def test_retries_service_unavailable(monkeypatch):
+    monkeypatch.setattr(llm_client, 'RETRY_BACKOFF', 0)
+    with StubServer() as stub:
+        stub.statuses = [503, 503]
+        assert llm_client.chat([{'role': 'user', 'content': 'hi'}], url=stub.url, retries=2)
+        assert len(stub.requests) == 3
+
+        stub.statuses = [503, 503]
+        with pytest.raises(llm_client.LLMError) as excinfo:
+            llm_client.chat([{'role': 'user', 'content': 'hi'}], url=stub.url, retries=1)
+        assert excinfo.value.status_code == 503
+
+
+def test_read_timeout_is_not_retried():
+    with StubServer(delay=0.5) as stub:
+        with pytest.raises(llm_client.LLMError):
+            llm_client.chat([{'role': 'user', 'content': 'hi'}], timeout=0.1, url=stub.url, retries=3)
+        assert len(stub.requests) == 1
+
+
+def test_ai_engine_uses_shared_client(monkeypatch):
+    import ai_engine
+
+    with StubServer(reply='你好') as stub:
+        monkeypatch.setenv('LM_STUDIO_URL', stub.url)
+        monkeypatch.setenv('LM_STUDIO_MODEL', 'qwen3-4b')
+        assert ai_engine.translate_text('你好') == '你好'
+        assert ai_engine.generate_audio_description_with_lm_studio('标题', '内容') == '你好'
+    assert stub.requests[0]['model'] == 'qwen3-4b'
+    assert stub.requests[1]['model'] == 'qwen2.5-7b-instruct-1m'
+
+
+def test_streaming_calls_on_delta_and_keeps_connection():
+    with StubServer(reply='我昨晚又听到了那个声音。', chunk_chars=4) as stub:
+        pieces = []
+        text = llm_client.chat([{'role': 'user', 'content': 'hi'}], url=stub.url, on_delta=pieces.append)
+        assert text == '我昨晚又听到了那个声音。'
+        assert pieces == ['我昨晚又', '听到了那', '个声音。']
+        assert llm_client.chat([{'role': 'user', 'content': 'hi'}], url=stub.url) == text
+    assert stub.requests[0]['stream'] is True and 'stream' not in stub.requests[1]
+    assert len(stub.connections) == 1
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_dispatcher_caps_concurrency_and_rejects_when_queue_full(monkeypatch):
+    dispatcher = llm_client.Dispatcher(max_concurrent=1, max_queue=1, queue_timeout=5)
+    monkeypatch.setattr(llm_client, 'dispatcher', dispatcher)
+    results = []
+
+    def call():
+        results.append(llm_client.chat([{'role': 'user', 'content': 'hi'}], url=stub.url))
+
+    with StubServer(delay=0.3) as stub:
+        threads = [threading.Thread(target=call) for _ in range(2)]
+        threads[0].start()
+        wait_until(lambda: dispatcher.stats()['running'] == 1)
+        threads[1].start()
+        wait_until(lambda: dispatcher.stats()['queued'] == 1)
+
+        # 队列已满：立即拒绝，不发给模型
+        start = time.monotonic()
+        with pytest.raises(llm_client.LLMBusy):
+            llm_client.chat([{'role': 'user', 'content': 'hi'}], url=stub.url)
+        assert time.monotonic() - start < 0.1
+
+        for thread in threads:
+            thread.join()
+    assert len(results) == 2 and len(stub.requests) == 2
+
+    stats = dispatcher.stats()
+    assert stats['admitted'] == stats['completed'] == 2
+    assert stats['rejected'] == 1 and stats['peak_queued'] == 1
+    assert stats['running'] == 0 and stats['queued'] == 0
+    assert stats['wait_ms']['max'] >= 200
+
+
+def test_dispatcher_queue_timeout(monkeypatch):
+    dispatcher = llm_client.Dispatcher(max_concurrent=1, max_queue=5, queue_timeout=5)
+    monkeypatch.setattr(llm_client, 'dispatcher', dispatcher)
+    with StubServer(delay=0.5) as stub:
+        worker = threading.Thread(target=llm_client.chat, args=([{'role': 'user', 'content': 'hi'}],),
+                                  kwargs={'url': stub.url})
+        worker.start()
+        wait_until(lambda: dispatcher.stats()['running'] == 1)
+        with pytest.raises(llm_client.LLMBusy):
+            llm_client.chat([{'role': 'user', 'content': 'hi'}], url=stub.url, queue_timeout=0.1)
+        worker.join()
+    assert dispatcher.stats()['timed_out'] == 1
+    assert len(stub.requests) == 1
+
+
+def test_busy_model_falls_back_to_template_reply(monkeypatch):
+    import ai_engine
+
+    class Busy:
+        queue_timeout = 0
+
+        def slot(self, queue_timeout=None):
+            raise llm_client.LLMBusy('busy')
+
+    class Item:
+        title = '镜子'
+        content = '地铁末班车上的镜子'
+
+    monkeypatch.setattr(llm_client, 'dispatcher', Busy())
+    monkeypatch.setenv('USE_LM_STUDIO', 'true')
+    reply = ai_engine.generate_ai_response(Item(), type('Comment', (), {'content': '然后呢？'})())
+    assert reply and reply.startswith('【楼主回复】')
+
+
+def test_admin_llm_stats():
+    from app import app
+
+    with app.test_client() as client:
+        assert client.get('/api/admin/llm_stats').status_code == 403
+        data = client.get('/api/admin/llm_stats', headers={'X-ADMIN-KEY': app.config['SECRET_KEY']}).get_json()
+    assert data['llm']['max_concurrent'] == llm_client.MAX_CONCURRENT
+    assert {'queued', 'running', 'rejected', 'wait_ms'} <= set(data['llm'])
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""测试版本化迁移：把旧版结构（无索引、无 parent_id、无计数列、状态机存 JSON、无个人资料统计）升级到与模型一致，且可重复执行"""
+
+import json
+import os
+import sqlite3
+import tempfile
+
+from sqlalchemy import create_engine, inspect
+
+import migrations
+from app import db
+
+# 项目最初版本的表结构（节选迁移涉及的表）
+LEGACY_SCHEMA = """
+CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(80) UNIQUE NOT NULL, email VARCHAR(120) UNIQUE NOT NULL,
+                   password_hash VARCHAR(200) NOT NULL, avatar VARCHAR(200), created_at DATETIME);
+CREATE TABLE story (id INTEGER PRIMARY KEY, title VARCHAR(200) NOT NULL, content TEXT NOT NULL, category VARCHAR(50),
+                    location VARCHAR(100), is_ai_generated BOOLEAN, ai_persona VARCHAR(100), current_state VARCHAR(50),
+                    state_data TEXT, created_at DATETIME, updated_at DATETIME, views INTEGER);
+CREATE TABLE comment (id INTEGER PRIMARY KEY, content TEXT NOT NULL, story_id INTEGER NOT NULL, author_id INTEGER,
+                      is_ai_response BOOLEAN, created_at DATETIME);
+CREATE TABLE evidence (id INTEGER PRIMARY KEY, story_id INTEGER NOT NULL, evidence_type VARCHAR(20),
+                       file_path VARCHAR(500), description TEXT, created_at DATETIME);
+CREATE TABLE follow (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, story_id INTEGER NOT NULL, created_at DATETIME,
+                     CONSTRAINT _user_story_uc UNIQUE (user_id, story_id));
+CREATE TABLE notification (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, story_id INTEGER, comment_id INTEGER,
+                           notification_type VARCHAR(50) NOT NULL, notification_category VARCHAR(50),
+                           content TEXT NOT NULL, is_read BOOLEAN, created_at DATETIME);
+CREATE TABLE category_click (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, category VARCHAR(50) NOT NULL,
+                             click_count INTEGER, updated_at DATETIME,
+                             CONSTRAINT _user_category_uc UNIQUE (user_id, category));
+INSERT INTO user (id, username, email, password_hash) VALUES (1, '老用户', 'old@example.com', 'x');
+INSERT INTO story (id, title, content) VALUES (1, '旧故事', '旧内容');
+INSERT INTO comment (story_id, content, is_ai_response, author_id) VALUES (1, '用户评论', 0, 1), (1, 'AI回复', 1, NULL);
+INSERT INTO category_click (user_id, category, click_count) VALUES (1, 'subway_ghost', 7), (1, 'campus_mystery', 2),
+                                                                   (1, 'cursed_object', 4);
+INSERT INTO evidence (story_id, evidence_type) VALUES (1, 'image');
+INSERT INTO story (id, title, content, current_state, state_data) VALUES (2, '状态机故事', '内容', 'unfolding',
+    '{"current_state": "unfolding", "next_transition_time": "2025-01-01T12:00:00", "user_interaction_count": 4,
+      "evidence_generated": 3, "state_history": [{"state": "init", "timestamp": "2025-01-01T00:00:00",
+      "trigger": "story_created"}, {"state": "unfolding", "timestamp": "2025-01-01T06:00:00", "trigger": "time_based"}]}');
+INSERT INTO story (id, title, content, current_state, state_data) VALUES (3, '坟帖', '内容', 'locked',
+    '{"comments_locked": true}');
+"""
+
+
+def legacy_engine():
+    path = os.path.join(tempfile.mkdtemp(prefix='urban_legends_migrate_'), 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    conn.close()
+    return create_engine('sqlite:///' + path)
+
+
+def test_upgrade_brings_legacy_schema_in_line_with_models():
+    engine = legacy_engine()
+
+    applied = migrations.upgrade(engine, verbose=False)
+    assert applied == [m.revision for m in migrations.load_revisions()]
+
+    inspector = inspect(engine)
+    for table in ('story', 'comment', 'evidence', 'follow', 'notification', 'story_state_event', 'user_stats',
+                  'archived_story', 'archived_comment', 'archived_evidence', 'archived_story_state_event',
+                  'archived_notification'):
+        model_columns = {c.name for c in db.metadata.tables[table].columns}
+        assert model_columns <= {c['name'] for c in inspector.get_columns(table)}
+
+        model_indexes = {i.name for i in db.metadata.tables[table].indexes}
+        assert model_indexes <= {i['name'] for i in inspector.get_indexes(table)}, table
+
+    with engine.connect() as conn:
+        counts = conn.exec_driver_sql(
+            "SELECT comments_count, user_comments_count, evidence_count FROM story WHERE id = 1"
+        ).one()
+    assert tuple(counts) == (2, 1, 1)
+
+
+def test_upgrade_backfills_state_columns_from_state_data():
+    engine = legacy_engine()
+    migrations.upgrade(engine, verbose=False)
+
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            "SELECT id, next_transition_time, user_interaction_count, evidence_generated FROM story ORDER BY id"
+        ).fetchall()
+        events = conn.exec_driver_sql(
+            "SELECT story_id, state, \"trigger\" FROM story_state_event ORDER BY id"
+        ).fetchall()
+
+    by_id = {row[0]: row[1:] for row in rows}
+    assert by_id[2][0].startswith('2025-01-01 12:00:00')
+    assert tuple(by_id[2][1:]) == (4, 3)
+    # 坟帖没有状态机数据，保持不参与调度
+    assert by_id[3][0] is None
+    assert [tuple(e) for e in events] == [(2, 'init', 'story_created'), (2, 'unfolding', 'time_based')]
+
+
+def test_upgrade_is_recorded_and_idempotent():
+    engine = legacy_engine()
+    migrations.upgrade(engine, verbose=False)
+
+    assert migrations.upgrade(engine, verbose=False) == []
+    assert all(applied_at for _, _, applied_at in migrations.status(engine))
+
+
+def test_upgrade_backfills_user_stats():
+    engine = legacy_engine()
+    migrations.upgrade(engine, verbose=False)
+
+    with engine.connect() as conn:
+        row = conn.exec_driver_sql(
+            "SELECT total_clicks, total_comments, top_categories FROM user_stats WHERE user_id = 1"
+        ).one()
+    assert row[0] == 13 and row[1] == 1
+    assert [c['category'] for c in json.loads(row[2])] == ['subway_ghost', 'cursed_object']
+
+
+def test_upgrade_rebuilds_archived_tables_with_autoincrement_ids():
+    from migrations.versions import v0008_autoincrement_ids
+
+    engine = legacy_engine()
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE INDEX ix_story_legacy ON story (category)")
+        conn.exec_driver_sql("CREATE TABLE story_log (story_id INTEGER)")
+        conn.exec_driver_sql("CREATE TRIGGER story_log_ai AFTER INSERT ON story BEGIN "
+                             "INSERT INTO story_log (story_id) VALUES (new.id); END")
+    migrations.upgrade(engine, verbose=False)
+
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in ('story', 'comment', 'evidence', 'story_state_event', 'notification'):
+            sql = conn.exec_driver_sql("SELECT sql FROM sqlite_master WHERE name = ?", (table,)).scalar()
+            assert 'AUTOINCREMENT' in sql, table
+        assert conn.exec_driver_sql("SELECT title FROM story WHERE id = 2").scalar() == '状态机故事'
+        assert 'ix_story_legacy' in {i['name'] for i in inspector.get_indexes('story')}
+
+        # 删除最大 id 后不再复用
+        conn.exec_driver_sql("DELETE FROM story WHERE id = 3")
+        conn.exec_driver_sql("INSERT INTO story (title, content) VALUES ('新故事', '内容')")
+        assert conn.exec_driver_sql("SELECT max(id) FROM story").scalar() == 4
+        assert conn.exec_driver_sql("SELECT story_id FROM story_log").scalars().all() == [4]
+
+        # 已归档的 id 比热表里的都大（升级前已经复用过 id 的库）：新行从归档的最大 id 之后分配
+        conn.exec_driver_sql("INSERT INTO archived_story (id, title) VALUES (50, '已归档')")
+        v0008_autoincrement_ids.upgrade(conn)
+        conn.exec_driver_sql("INSERT INTO story (title, content) VALUES ('又一个故事', '内容')")
+        assert conn.exec_driver_sql("SELECT max(id) FROM story").scalar() == 51
+
+
+def test_autoincrement_sql_handles_both_primary_key_forms():
+    from migrations.versions.v0008_autoincrement_ids import autoincrement_sql
+
+    inline = autoincrement_sql('CREATE TABLE story (id INTEGER PRIMARY KEY, story_id INTEGER)', 'story', 'new')
+    assert inline == 'CREATE TABLE new (id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, story_id INTEGER)'
+    separate = autoincrement_sql('CREATE TABLE comment (\n\tid INTEGER NOT NULL, \n\tparent_id INTEGER, '
+                                 '\n\tPRIMARY KEY (id), \n\tFOREIGN KEY(parent_id) REFERENCES comment (id)\n)',
+                                 'comment', 'new')
+    assert separate.startswith('CREATE TABLE new (\n\tid INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, ')
+    assert 'PRIMARY KEY (id)' not in separate and 'REFERENCES comment (id)' in separate
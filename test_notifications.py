@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""测试通知分页、未读筛选、未读计数和 /api/me"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import app, db, Story, Comment, Follow, Notification, generate_token, create_notifications_for_followers
+
+
+@pytest.fixture
+def create_user_with_notifications(create_user):
+    """工厂：创建用户和 total 条通知（前 unread 条未读），返回用户 id"""
+    def create(username, total, unread):
+        user_id = create_user(username)
+        with app.app_context():
+            base = datetime.utcnow() - timedelta(hours=1)
+            for i in range(total):
+                db.session.add(Notification(
+                    user_id=user_id,
+                    notification_type='new_reply',
+                    content=f'通知 {i}',
+                    is_read=i >= unread,
+                    # 制造相同时间戳，验证游标按 (created_at, id) 翻页不重不漏
+                    created_at=base + timedelta(minutes=i // 2)
+                ))
+            db.session.commit()
+        return user_id
+
+    return create
+
+
+def auth(user_id):
+    return {'Authorization': 'Bearer ' + generate_token(user_id)}
+
+
+def test_cursor_pagination_visits_every_notification_once(create_user_with_notifications):
+    user_id = create_user_with_notifications('notif_pager', total=25, unread=5)
+
+    seen = []
+    cursor = None
+    with app.test_client() as client:
+        while True:
+            url = '/api/notifications?limit=7' + (f'&cursor={cursor}' if cursor else '')
+            data = client.get(url, headers=auth(user_id)).get_json()
+            seen.extend(n['id'] for n in data['notifications'])
+            cursor = data['pagination']['next_cursor']
+            if not data['pagination']['has_more']:
+                break
+
+    assert len(seen) == 25
+    assert len(set(seen)) == 25
+
+
+def test_unread_filter_and_count(create_user_with_notifications):
+    user_id = create_user_with_notifications('notif_unread', total=12, unread=4)
+
+    with app.test_client() as client:
+        unread = client.get('/api/notifications?unread=1', headers=auth(user_id)).get_json()
+        assert len(unread['notifications']) == 4
+        assert not any(n['is_read'] for n in unread['notifications'])
+
+        count = client.get('/api/notifications/unread_count', headers=auth(user_id)).get_json()
+        assert count == {'unread_count': 4}
+
+        client.post('/api/notifications/read', json={'all': True}, headers=auth(user_id))
+        count = client.get('/api/notifications/unread_count', headers=auth(user_id)).get_json()
+        assert count == {'unread_count': 0}
+
+
+def test_me_endpoint(create_user_with_notifications):
+    user_id = create_user_with_notifications('notif_me', total=0, unread=0)
+
+    with app.test_client() as client:
+        me = client.get('/api/me', headers=auth(user_id))
+        assert me.status_code == 200
+        assert me.get_json()['username'] == 'notif_me'
+
+        assert client.get('/api/me').status_code == 401
+        assert client.get('/api/me', headers={'Authorization': 'Bearer nope'}).status_code == 401
+
+
+def test_follower_fanout_skips_author_and_joins_caller_transaction(create_user, create_story):
+    user_ids = [create_user(f'fanout_{i}') for i in range(4)]
+    story_id = create_story('扇出测试')
+    with app.app_context():
+        story = db.session.get(Story, story_id)
+        db.session.add_all([Follow(user_id=user_id, story_id=story_id) for user_id in user_ids])
+        comment = Comment(content='评论', story_id=story_id, author_id=user_ids[0])
+        db.session.add(comment)
+        db.session.flush()
+
+        recipients = create_notifications_for_followers(story, comment)
+        assert sorted(recipients) == sorted(user_ids[1:])
+
+        # 不自行提交：回滚后通知一起消失
+        db.session.rollback()
+        assert Notification.query.filter(Notification.user_id.in_(recipients)).count() == 0
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""测试热点查询的执行计划：实际调用 app.py / story_engine.py / scheduler_tasks.py 中的代码路径，
+记录它们发出的 SELECT，用 EXPLAIN QUERY PLAN 确认走了迁移建立的索引、没有全表扫描"""
+
+import re
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+import ai_engine
+import scheduler_tasks
+from app import (
+    app, db, User, Story, Comment, Evidence, Follow, generate_token,
+    create_notifications_for_followers, delayed_ai_response, generate_evidence_for_story
+)
+
+# 数据量会增长的表；出现 "SCAN <表>"（不带索引）即视为全表扫描
+GROWING_TABLES = ('story', 'comment', 'evidence', 'follow', 'notification')
+
+
+@contextmanager
+def captured_selects():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')) and not executemany:
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def query_plan(statement, parameters):
+    with app.app_context():
+        rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return [row[-1] for row in rows]
+
+
+def plans_for(statements, table):
+    """只返回涉及 table 的语句的执行计划"""
+    pattern = re.compile(rf'\bFROM {table}\b|\bJOIN {table}\b', re.IGNORECASE)
+    return [query_plan(sql, params) for sql, params in statements if pattern.search(sql)]
+
+
+def assert_no_full_scans(statements):
+    for sql, params in statements:
+        for line in query_plan(sql, params):
+            for table in GROWING_TABLES:
+                assert not re.fullmatch(rf'SCAN {table}( AS \w+)?', line), f'{line}\n{sql}'
+
+
+def assert_uses_index(statements, table, index):
+    plans = plans_for(statements, table)
+    assert plans, f'没有捕获到查询 {table} 的语句'
+    assert any(index in line for plan in plans for line in plan), plans
+
+
+@pytest.fixture(scope='module')
+def story_with_activity():
+    with app.app_context():
+        users = [User(username=f'plan_user_{i}', email=f'plan_{i}@example.com', password_hash='x') for i in range(3)]
+        story = Story(title='执行计划测试', content='执行计划测试内容', category='subway_ghost')
+        db.session.add_all(users + [story])
+        db.session.flush()
+        db.session.add_all([Follow(user_id=u.id, story_id=story.id) for u in users])
+        root = Comment(content='顶级评论', story_id=story.id, author_id=users[0].id)
+        db.session.add(root)
+        db.session.flush()
+        db.session.add_all([
+            Comment(content='回复', story_id=story.id, author_id=users[1].id, parent_id=root.id),
+            Comment(content='AI回复', story_id=story.id, parent_id=root.id, is_ai_response=True),
+            Evidence(story_id=story.id, evidence_type='image', file_path='/x.png'),
+        ])
+        db.session.commit()
+        yield {'story_id': story.id, 'comment_id': root.id, 'user_id': users[0].id}
+
+
+def test_feed_and_detail_queries(story_with_activity):
+    story_id = story_with_activity['story_id']
+    with captured_selects() as statements, app.test_client() as client:
+        client.get('/api/stories?page=2&per_page=5')
+        client.get('/api/stories?after=&per_page=5&category=subway_ghost')
+        client.get(f'/api/stories/{story_id}')
+        client.get(f'/api/stories/{story_id}/comments?cursor=0')
+
+    assert_uses_index(statements, 'story', 'ix_story_created_at_id')
+    assert_uses_index(statements, 'comment', 'ix_comment_story_id')
+    assert_uses_index(statements, 'comment', 'ix_comment_parent_id')
+    assert_uses_index(statements, 'evidence', 'ix_evidence_story_type')
+    assert_no_full_scans(statements)
+
+
+def test_notification_queries(story_with_activity):
+    headers = {'Authorization': 'Bearer ' + generate_token(story_with_activity['user_id'])}
+    with captured_selects() as statements, app.test_client() as client:
+        client.get('/api/notifications/unread_count', headers=headers)
+        client.get('/api/notifications?unread=1', headers=headers)
+        client.get('/api/notifications', headers=headers)
+
+    assert_uses_index(statements, 'notification', 'ix_notification_user_read_created')
+    assert_uses_index(statements, 'notification', 'ix_notification_user_created')
+    assert_no_full_scans(statements)
+
+
+def test_background_job_queries(story_with_activity, monkeypatch):
+    story_id = story_with_activity['story_id']
+    comment_id = story_with_activity['comment_id']
+    # 不调用模型：AI 回复为空、图片生成返回空列表，只留下查询
+    monkeypatch.setattr(ai_engine, 'generate_ai_response', lambda *args, **kwargs: None)
+    monkeypatch.setattr(ai_engine, 'generate_evidence_image', lambda *args, **kwargs: [])
+
+    with captured_selects() as statements:
+        delayed_ai_response(story_id, comment_id, delay_seconds=0)
+        generate_evidence_for_story(story_id, trigger_comment_id=comment_id)
+        with app.app_context():
+            story, comment = db.session.get(Story, story_id), db.session.get(Comment, comment_id)
+            create_notifications_for_followers(story, comment)
+            db.session.rollback()
+            ai_engine.should_generate_new_story()
+        scheduler_tasks.scheduled_state_progression()
+
+    assert_uses_index(statements, 'comment', 'ix_comment_story_ai')
+    assert_uses_index(statements, 'evidence', 'ix_evidence_story_type')
+    assert_uses_index(statements, 'follow', 'ix_follow_story_id')
+    assert_uses_index(statements, 'story', 'ix_story_current_state')
+    assert_uses_index(statements, 'story', 'ix_story_next_transition_time')
+    assert_no_full_scans(statements)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""测试 SQLite 并发配置：PRAGMA 已在应用连接上生效，混合读写下不出现 "database is locked" """
+
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+import sqlite_profile
+from app import app, db, Story, Comment, bump_story_counters
+
+
+def test_pragmas_applied_to_app_engine():
+    with app.app_context():
+        conn = db.session.connection()
+        assert conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert conn.exec_driver_sql('PRAGMA busy_timeout').scalar() == sqlite_profile.BUSY_TIMEOUT_MS
+        # synchronous: 1 = NORMAL
+        assert conn.exec_driver_sql('PRAGMA synchronous').scalar() == 1
+        db.session.rollback()
+
+
+def test_engine_options_skip_pool_for_memory_database():
+    assert 'pool_size' not in sqlite_profile.engine_options('sqlite://')
+    assert sqlite_profile.engine_options('sqlite:///x.db')['pool_size'] == sqlite_profile.POOL_SIZE
+    assert sqlite_profile.engine_options('postgresql://localhost/db') == {}
+
+
+def test_mixed_readers_and_writers_without_lock_errors():
+    with app.app_context():
+        story = Story(title='并发测试', content='并发测试内容', category='subway_ghost')
+        db.session.add(story)
+        db.session.commit()
+        story_id = story.id
+
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0}
+    errors = []
+    lock = threading.Lock()
+
+    def reader():
+        reads = 0
+        with app.test_client() as client:
+            while not stop.is_set():
+                response = client.get(f'/api/stories/{story_id}/comments')
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+                reads += 1
+        with lock:
+            counts['reads'] += reads
+
+    def writer():
+        # 与 AI 回复后台线程一致：先读故事，再写评论和计数，一次提交
+        writes = 0
+        with app.app_context():
+            while not stop.is_set():
+                try:
+                    db.session.get(Story, story_id)
+                    db.session.add(Comment(content='并发评论', story_id=story_id, is_ai_response=True))
+                    bump_story_counters(story_id, comments=1)
+                    db.session.commit()
+                    writes += 1
+                except OperationalError as e:
+                    db.session.rollback()
+                    errors.append(str(e))
+        with lock:
+            counts['writes'] += writes
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    threads += [threading.Thread(target=writer) for _ in range(3)]
+    seconds = 2
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    print(f"\n读 {counts['reads'] / seconds:.0f}/s, 写 {counts['writes'] / seconds:.0f}/s")
+    assert errors == []
+    assert counts['reads'] > 0 and counts['writes'] > 0
+
+    with app.app_context():
+        story = db.session.get(Story, story_id)
+        assert story.comments_count == counts['writes']
+        assert Comment.query.filter_by(story_id=story_id).count() == counts['writes']
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""测试故事状态机：状态存于列、历史写入 story_state_event，互动计数原子累加，定时任务只处理到期或互动达标的故事"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import ai_engine
+import app as app_module
+import scheduler_tasks
+import story_engine
+from app import app, db, Story, StoryStateEvent, generate_token
+
+# AI 生成的故事：带初始状态和第一条状态历史
+AI_STORY = {'category': 'subway_ghost', 'is_ai_generated': True, 'initialize_state': True}
+
+
+def test_initialize_and_record_interaction(create_story):
+    story_id = create_story('状态机初始化', **AI_STORY)
+
+    with app.app_context():
+        story = db.session.get(Story, story_id)
+        assert story.current_state == 'init'
+        assert story.next_transition_time > datetime.utcnow()
+        assert [(e.state, e.trigger) for e in story.state_events] == [('init', 'story_created')]
+
+        assert [story_engine.record_user_interaction(story) for _ in range(3)] == [1, 2, 3]
+        db.session.commit()
+        db.session.expire_all()
+        assert db.session.get(Story, story_id).user_interaction_count == 3
+
+
+def test_scheduler_progresses_only_due_stories(monkeypatch, create_story):
+    monkeypatch.setattr(story_engine, 'generate_evidence_image', lambda *args, **kwargs: None)
+    monkeypatch.setattr(story_engine, 'generate_evidence_audio', lambda *args, **kwargs: None)
+    monkeypatch.setattr(ai_engine, 'generate_evidence_image', lambda *args, **kwargs: None)
+
+    due_id = create_story('到期故事', **AI_STORY)
+    busy_id = create_story('热门故事', **AI_STORY)
+    idle_id = create_story('未到期故事', **AI_STORY)
+    with app.app_context():
+        db.session.get(Story, due_id).next_transition_time = datetime.utcnow() - timedelta(minutes=1)
+        db.session.get(Story, busy_id).user_interaction_count = story_engine.INTERACTION_THRESHOLD
+        db.session.commit()
+
+    scheduler_tasks.scheduled_state_progression()
+
+    with app.app_context():
+        due, busy, idle = (db.session.get(Story, i) for i in (due_id, busy_id, idle_id))
+        assert due.current_state == 'unfolding'
+        assert busy.current_state == 'unfolding'
+        assert idle.current_state == 'init'
+        assert busy.user_interaction_count == 0
+        assert due.next_transition_time > datetime.utcnow()
+
+        triggers = db.session.execute(
+            db.select(StoryStateEvent.story_id, StoryStateEvent.trigger)
+            .where(StoryStateEvent.state == 'unfolding')
+            .where(StoryStateEvent.story_id.in_([due_id, busy_id]))
+        ).all()
+        assert sorted(triggers) == [(due_id, 'time_based'), (busy_id, 'interaction_based')]
+
+
+def test_concurrent_comments_do_not_lose_interactions(monkeypatch, create_story, create_user):
+    # 只测计数：不启动 AI 回复、虚拟评论和证据生成线程
+    monkeypatch.setattr(app_module, 'delayed_ai_response', lambda *args, **kwargs: None)
+    monkeypatch.setattr(app_module, 'generate_evidence_for_story', lambda *args, **kwargs: None)
+    monkeypatch.setattr(app_module, 'maybe_add_fake_comment', lambda *args, **kwargs: None)
+
+    story_id = create_story('并发互动', **AI_STORY)
+    headers = {'Authorization': 'Bearer ' + generate_token(create_user('interaction_user'))}
+
+    total = 200
+
+    def post(i):
+        with app.test_client() as client:
+            return client.post(f'/api/stories/{story_id}/comments', json={'content': f'评论 {i}'},
+                               headers=headers).status_code
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        statuses = list(pool.map(post, range(total)))
+
+    assert statuses == [201] * total
+    with app.app_context():
+        story = db.session.get(Story, story_id)
+        assert story.user_interaction_count == total
+        assert story.user_comments_count == total
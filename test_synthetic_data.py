@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""测试规模数据生成器：小规模写入当前测试库，计数列、个人资料统计和全文索引与实际数据一致"""
+
+from generate_synthetic_data import load
+import search_index
+from app import app, db, Story, Comment, Follow, Notification, UserStats
+
+
+def test_load_small_volume_is_consistent():
+    with app.app_context():
+        engine = db.engine
+        before = {model: model.query.count() for model in (Story, Comment, Follow, Notification)}
+        first_story = (db.session.query(db.func.max(Story.id)).scalar() or 0) + 1
+
+    timings = load(engine, users=30, stories=40, comments=600, notifications=200, follows=50,
+                   batch_size=64, verbose=False)
+    assert timings['comment'][0] == 600
+
+    with app.app_context():
+        assert Story.query.count() - before[Story] == 40
+        assert Comment.query.count() - before[Comment] == 600
+        assert Follow.query.count() - before[Follow] == 50
+        assert Notification.query.count() - before[Notification] == 200
+
+        # 生成的故事冗余计数与实际行数一致
+        mismatched = db.session.execute(db.text(
+            "SELECT COUNT(*) FROM story WHERE id >= :first AND (comments_count != "
+            "(SELECT COUNT(*) FROM comment WHERE comment.story_id = story.id) "
+            "OR user_comments_count != (SELECT COUNT(*) FROM comment "
+            "WHERE comment.story_id = story.id AND comment.is_ai_response = 0))"
+        ), {'first': first_story}).scalar()
+        assert mismatched == 0
+
+        authored = Comment.query.filter(Comment.author_id.isnot(None), Comment.story_id >= first_story).count()
+        assert db.session.query(db.func.sum(UserStats.total_comments)).scalar() >= authored
+
+        # 回复只指向同一故事里的评论
+        orphans = db.session.execute(db.text(
+            "SELECT COUNT(*) FROM comment c JOIN comment p ON p.id = c.parent_id WHERE p.story_id != c.story_id"
+        )).scalar()
+        assert orphans == 0
+
+        # 索引和全文检索触发器已恢复
+        indexes = {row[0] for row in db.session.execute(db.text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+        assert {'ix_comment_story_id', 'ix_story_created_at_id', 'ix_notification_user_created'} <= indexes
+        triggers = {row[0] for row in db.session.execute(db.text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))}
+        assert {'story_fts_ai', 'comment_fts_ai'} <= triggers
+        story = Story.query.order_by(Story.id.desc()).first()
+        total, hits = search_index.search(db.session, story.title)
+        assert any(hit['story_id'] == story.id for hit in hits)
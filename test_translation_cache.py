@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""测试翻译缓存：重复翻译不再调用模型，按模型/目标语言区分，按总字节数淘汰，预热新故事"""
+
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import ai_engine
+import translation_cache
+from app import app, db, Story, TranslationCache
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    calls = []
+    models = ['stub:v1']
+
+    def translate(text, target='en'):
+        calls.append((text, target))
+        return f'[{target}] {text}', models[0]
+
+    monkeypatch.setattr(ai_engine, 'translate_text_with_model', translate)
+    monkeypatch.setattr(ai_engine, 'translation_models', lambda: list(models))
+    translation_cache.touches.flush()
+    with app.app_context():
+        db.session.query(TranslationCache).delete()
+        db.session.commit()
+    monkeypatch.setattr(translation_cache, '_total_bytes', None)
+    translation_cache.memory.clear()
+    return calls, models
+
+
+def test_repeat_translations_hit_cache(fake_model):
+    calls, models = fake_model
+    with app.test_client() as client:
+        first = client.post('/api/translate', json={'text': '末班车上的镜子'}).get_json()
+        second = client.post('/api/translate', json={'text': '末班车上的镜子'}).get_json()
+        assert first == {'translated': '[en] 末班车上的镜子', 'cached': False}
+        assert second == {'translated': '[en] 末班车上的镜子', 'cached': True}
+        assert len(calls) == 1
+
+        # 内存层失效后从数据库读回
+        translation_cache.memory.clear()
+        with app.app_context():
+            assert translation_cache.translate('末班车上的镜子') == ('[en] 末班车上的镜子', 'db')
+            assert translation_cache.translate('末班车上的镜子') == ('[en] 末班车上的镜子', 'memory')
+            start = time.perf_counter()
+            for _ in range(1000):
+                translation_cache.translate('末班车上的镜子')
+            assert (time.perf_counter() - start) / 1000 < 0.0005
+
+        # 目标语言或模型不同都不能复用
+        client.post('/api/translate', json={'text': '末班车上的镜子', 'target': 'ja'})
+        models[0] = 'stub:v2'
+        assert client.post('/api/translate', json={'text': '末班车上的镜子'}).get_json()['cached'] is False
+        assert len(calls) == 3
+
+        stats = client.get('/api/admin/cache_stats', headers={'X-ADMIN-KEY': app.config['SECRET_KEY']}).get_json()
+    assert stats['translation']['db_rows'] == 3
+    assert stats['translation']['db_hits'] >= 1
+
+
+def test_cache_hits_do_not_write_until_touches_flush(fake_model):
+    from sqlalchemy import event
+
+    with app.app_context():
+        translation_cache.translate('楼道里的灯')
+        translation_cache.memory.clear()
+        writes = []
+
+        def record(conn, cursor, statement, *args):
+            if not statement.lstrip().upper().startswith('SELECT'):
+                writes.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            assert translation_cache.lookup('楼道里的灯', 'en')[1] == 'db'
+            assert translation_cache.lookup_many(['楼道里的灯'], 'en') == {'楼道里的灯': '[en] 楼道里的灯'}
+            assert translation_cache.lookup('楼道里的灯', 'en')[1] == 'memory'
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert writes == []
+
+        translation_cache.touches.flush()
+        key = (translation_cache.text_hash('楼道里的灯'), 'en', 'stub:v1')
+        db.session.expire_all()
+        assert db.session.get(TranslationCache, key).hits == 3
+
+
+def test_evicts_least_recently_used_by_size(fake_model):
+    with app.app_context():
+        for i in range(4):
+            translation_cache.store(f'原文{i}', 'en', 'stub:v1', 'x' * 100)
+            key = (translation_cache.text_hash(f'原文{i}'), 'en', 'stub:v1')
+            db.session.get(TranslationCache, key).last_used_at = datetime.utcnow() - timedelta(minutes=10 - i)
+        db.session.commit()
+        # 最早用过的 原文0 被再次读取后变成最近使用
+        translation_cache.memory.clear()
+        assert translation_cache.lookup('原文0', 'en')[1] == 'db'
+
+        removed = translation_cache.evict(max_bytes=250)
+        remaining = {row.text_hash for row in TranslationCache.query.all()}
+    assert removed == 2
+    assert remaining == {translation_cache.text_hash('原文0'), translation_cache.text_hash('原文3')}
+
+
+def test_steady_state_writes_keep_memory_layer_and_skip_full_scans(fake_model, monkeypatch):
+    from sqlalchemy import event
+
+    monkeypatch.setattr(translation_cache, 'MAX_BYTES', 1000)
+    monkeypatch.setattr(translation_cache, 'EVICT_TO_RATIO', 0.5)
+    sums = []
+
+    def record(conn, cursor, statement, *args):
+        if 'coalesce(sum(translation_cache.size_bytes)' in statement.lower():
+            sums.append(statement)
+
+    with app.app_context():
+        evicted_before = translation_cache.stats()['evicted']
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            for i in range(20):
+                translation_cache.store(f'第{i:02d}条', 'en', 'stub:v1', 'x' * 92)  # 每条 8 + 92 = 100 字节
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        evictions = translation_cache.stats()['evicted'] - evicted_before
+        rows = TranslationCache.query.count()
+        assert translation_cache.total_bytes() == rows * 100 <= 1000
+
+    # 首次读取总数 + 每次淘汰前对齐一次；淘汰一次删到 500 字节，20 次写入只触发 2 次淘汰
+    assert evictions == 12
+    assert len(sums) == 1 + 2
+    # 没被淘汰的最近条目仍在内存层
+    assert translation_cache.memory.get((translation_cache.text_hash('第19条'), 'en', 'stub:v1')) == 'x' * 92
+    assert translation_cache.memory.get((translation_cache.text_hash('第00条'), 'en', 'stub:v1')) is None
+
+
+def test_warmup_pre_translates_new_stories(fake_model):
+    calls, _ = fake_model
+    with app.app_context():
+        story = Story(title='预热测试', content='楼道里的脚步声', category='subway_ghost')
+        db.session.add(story)
+        db.session.commit()
+        assert translation_cache.warmup_recent_stories(limit=1) == 2
+        assert translation_cache.warmup_recent_stories(limit=1) == 0
+    assert len(calls) == 2
+
+    with app.test_client() as client:
+        assert client.post('/api/translate', json={'text': '楼道里的脚步声'}).get_json()['cached'] is True
+    assert len(calls) == 2
+
+
+@pytest.fixture
+def fake_batch_model(fake_model, monkeypatch):
+    batches = []
+
+    def translate_batch(texts, target='en'):
+        batches.append(list(texts))
+        payload = '\n'.join(f'<<<{i}>>>\n[{target}] {text}' for i, text in enumerate(texts, 1))
+        if len(texts) == 3:
+            payload = payload.replace('<<<2>>>', '')  # 模型漏掉一个标记
+        return ai_engine.split_translation_batch('好的：\n' + payload, len(texts)), 'stub:v1'
+
+    monkeypatch.setattr(ai_engine, 'translate_batch_with_model', translate_batch)
+    return fake_model[0], batches
+
+
+def test_batch_dedupes_packs_and_keeps_order(fake_batch_model):
+    calls, batches = fake_batch_model
+    story = '故事正文' * 10
+    comments = [f'评论{i}' for i in range(40)]
+    texts = [story] + comments + ['评论0', '']
+
+    with app.test_client() as client:
+        client.post('/api/translate', json={'text': '评论5'})
+        data = client.post('/api/translate/batch', json={'texts': texts}).get_json()
+        assert data['translated'] == [f'[en] {text}' if text else '' for text in texts]
+        assert data['cached'][6] is True and data['cached'][1] is False and data['cached'][-1] is False
+        # 40 个未命中（去掉重复的 评论0 和已缓存的 评论5），每包最多 20 条
+        assert data['model_calls'] == 2
+        assert [len(batch) for batch in batches] == [20, 20]
+        assert len(calls) == 1
+
+        again = client.post('/api/translate/batch', json={'texts': texts}).get_json()
+        assert again['model_calls'] == 0 and all(again['cached'][:-1])
+
+        assert client.post('/api/translate/batch', json={'texts': 'x'}).status_code == 400
+
+
+def test_batch_splits_again_when_markers_are_lost(fake_batch_model):
+    calls, batches = fake_batch_model
+    with app.app_context():
+        translated, cached, model_calls = translation_cache.translate_many(['甲', '乙', '丙'])
+    assert translated == ['[en] 甲', '[en] 乙', '[en] 丙']
+    # 3 段的包拆分失败 → 1 段逐条翻译 + 2 段打包
+    assert batches == [['甲', '乙', '丙'], ['乙', '丙']]
+    assert calls == [('甲', 'en')]
+    assert model_calls == 3
+
+
+def test_batch_is_stored_in_one_statement_and_calls_are_counted_exactly(fake_batch_model):
+    from sqlalchemy import event
+
+    calls, batches = fake_batch_model
+    texts = [f'评论{i}' for i in range(20)]
+    inserts = []
+
+    def record(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith('INSERT INTO TRANSLATION_CACHE'):
+            inserts.append(statement)
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            translated, _, model_calls = translation_cache.translate_many(texts)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        assert translated == [f'[en] {text}' for text in texts]
+        assert model_calls == 1 and len(inserts) == 1
+        assert TranslationCache.query.count() == 20
+
+        # 单条退回路径命中缓存时没有调用模型
+        results = {}
+        assert translation_cache._translate_batch(['评论0'], 'en', results) == 0
+        assert results == {'评论0': '[en] 评论0'}
+    assert calls == []
+
+
+def test_split_translation_batch():
+    reply = 'Sure:\n<<<1>>>\nHello\n<<< 2 >>>\nWorld\n《《《3》》》\nBye'
+    assert ai_engine.split_translation_batch(reply, 3) == ['Hello', 'World', 'Bye']
+    assert ai_engine.split_translation_batch(reply, 4) is None
+    assert ai_engine.split_translation_batch('<<<1>>>a<<<1>>>b', 2) is None
+    assert ai_engine.split_translation_batch('Hello World', 1) is None
+
+
+def test_batch_prompt_round_trip(monkeypatch):
+    from bench_llm_client import StubServer
+
+    with StubServer(reply='<<<1>>>\nThe mirror\n<<<2>>>\nThe last train') as stub:
+        monkeypatch.setenv('LM_STUDIO_URL', stub.url)
+        monkeypatch.setenv('LM_STUDIO_MODEL', 'qwen')
+        translated, model = ai_engine.translate_batch_with_model(['镜子', '末班车'])
+    assert (translated, model) == (['The mirror', 'The last train'], 'lm-studio:qwen')
+    assert stub.requests[0]['messages'][1]['content'] == '<<<1>>>\n镜子\n<<<2>>>\n末班车'
+
+
+def test_lm_studio_model_is_resolved_when_not_configured(monkeypatch):
+    from bench_llm_client import StubServer
+
+    monkeypatch.setattr(ai_engine, '_resolved_lm_studio_models', {})
+    with StubServer(reply='The mirror', models=['qwen2.5-7b-instruct', 'other']) as stub:
+        monkeypatch.setenv('LM_STUDIO_URL', stub.url)
+        monkeypatch.delenv('LM_STUDIO_MODEL', raising=False)
+        # 没有指定模型：从 /v1/models 取第一个，请求和缓存键都用它
+        assert ai_engine.translation_models()[0] == 'lm-studio:qwen2.5-7b-instruct'
+        assert ai_engine.translate_text_with_model('镜子') == ('The mirror', 'lm-studio:qwen2.5-7b-instruct')
+
+        monkeypatch.setenv('LM_STUDIO_MODEL', 'qwen3-4b')
+        assert ai_engine.translate_text_with_model('镜子') == ('The mirror', 'lm-studio:qwen3-4b')
+    assert [request['model'] for request in stub.requests] == ['qwen2.5-7b-instruct', 'qwen3-4b']
+
+
+def test_lm_studio_is_skipped_when_no_model_can_be_resolved(monkeypatch):
+    from bench_llm_client import StubServer
+
+    monkeypatch.setattr(ai_engine, '_resolved_lm_studio_models', {})
+    with StubServer(reply='The mirror', models=[]) as stub:
+        monkeypatch.setenv('LM_STUDIO_URL', stub.url)
+        monkeypatch.delenv('LM_STUDIO_MODEL', raising=False)
+        assert 'lm-studio' not in ' '.join(ai_engine.translation_models())
+        assert not (ai_engine.translate_text_with_model('镜子')[1] or '').startswith('lm-studio')
+    assert stub.requests == []
+
+
+def test_unknown_targets_are_rejected_before_the_cache(fake_model):
+    calls, _ = fake_model
+    with app.test_client() as client:
+        for body in ({'text': '镜子', 'target': 'xx-fake'}, {'text': '镜子', 'target': ['en']},
+                     {'texts': ['镜子'], 'target': 'klingon'}):
+            url = '/api/translate/batch' if 'texts' in body else '/api/translate'
+            response = client.post(url, json=body)
+            assert response.status_code == 400
+            assert response.get_json() == {'error': 'Unsupported target language'}
+    assert calls == []
+    with app.app_context():
+        assert TranslationCache.query.count() == 0
+
+
+def test_target_language_reaches_lm_studio_prompt(monkeypatch):
+    from bench_llm_client import StubServer
+
+    with StubServer(reply='鏡') as stub:
+        monkeypatch.setenv('LM_STUDIO_URL', stub.url)
+        monkeypatch.setenv('LM_STUDIO_MODEL', 'qwen3-4b')
+        assert ai_engine.translate_text('镜子', target='ja') == '鏡'
+    assert '翻译成日文' in stub.requests[0]['messages'][0]['content']
+
+
+def test_limits_are_derived_from_the_context_window(monkeypatch):
+    from bench_llm_client import StubServer
+
+    monkeypatch.setattr(ai_engine, 'TRANSLATION_CONTEXT_TOKENS', 8192)
+    monkeypatch.setattr(ai_engine, 'TRANSLATION_MAX_OUTPUT_TOKENS', 4096)
+    limit = ai_engine.translation_max_chars()
+    # 提示 + 原文 + 译文放得进窗口，译文不超过输出上限
+    assert ai_engine.translation_max_tokens(limit) <= 4096
+    assert ai_engine.TRANSLATION_PROMPT_TOKENS + limit + ai_engine.translation_max_tokens(limit) <= 8192
+    assert ai_engine.translation_max_tokens(10 ** 6) >= 1
+
+    # TRANSLATION_BATCH_MAX_CHARS 只能调小
+    monkeypatch.setattr(translation_cache, 'BATCH_MAX_CHARS', 0)
+    assert translation_cache.batch_max_chars() == limit
+    monkeypatch.setattr(translation_cache, 'BATCH_MAX_CHARS', 10 ** 6)
+    assert translation_cache.batch_max_chars() == limit
+    monkeypatch.setattr(translation_cache, 'BATCH_MAX_CHARS', 500)
+    assert translation_cache.batch_max_chars() == 500
+
+    monkeypatch.setattr(ai_engine, 'TRANSLATION_CONTEXT_TOKENS', 2048)
+    with StubServer(reply='<<<1>>>\nA\n<<<2>>>\nB') as stub:
+        monkeypatch.setenv('LM_STUDIO_URL', stub.url)
+        monkeypatch.setenv('LM_STUDIO_MODEL', 'qwen')
+        ai_engine.translate_batch_with_model(['镜' * 600, '车' * 600])
+    assert stub.requests[0]['max_tokens'] <= 2048 - ai_engine.TRANSLATION_PROMPT_TOKENS - 1200
+
+
+def test_split_long_text():
+    text = '第一段第一句。第一段第二句！\n第二段很长' + '长' * 30 + '。结尾？'
+    pieces = translation_cache.split_long_text(text, 20)
+    assert ''.join(pieces) == text
+    assert all(len(piece) <= 20 for piece in pieces)
+    assert pieces[0] == '第一段第一句。第一段第二句！\n'
+    assert translation_cache.split_long_text('短句', 20) == ['短句']
+    assert translation_cache.join_translations(['甲。', '乙\n', '丙'], ['A.', 'B', 'C']) == 'A. B\nC'
+
+
+def test_long_texts_are_translated_in_chunks(fake_model, monkeypatch):
+    calls, _ = fake_model
+    monkeypatch.setattr(ai_engine, 'translation_max_chars', lambda: 10)
+    text = '镜子里的人。' * 3 + '末班车'
+    with app.app_context():
+        translated, source = translation_cache.translate(text)
+        assert source == 'model'
+        assert translated == '[en] 镜子里的人。 [en] 镜子里的人。 [en] 镜子里的人。末班车'
+        # 相同的片段只翻译一次，每个片段单独缓存
+        assert calls == [('镜子里的人。', 'en'), ('镜子里的人。末班车', 'en')]
+        assert translation_cache.translate(text) == (translated, 'memory')
+
+        translated, cached, model_calls = translation_cache.translate_many([text, '镜子里的人。' * 2])
+        assert translated == [translation_cache.translate(text)[0], '[en] 镜子里的人。 [en] 镜子里的人。']
+        assert cached == [True, True] and model_calls == 0
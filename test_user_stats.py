@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""测试个人资料物化统计：评论和分类点击写入时增量维护，接口只做一次主键查询"""
+
+from sqlalchemy import event
+
+import app as app_module
+from app import app, db, category_click_buffer, generate_token, recount_user_stats
+
+
+def test_stats_follow_comments_and_clicks(monkeypatch, create_user, create_story):
+    monkeypatch.setattr(app_module, 'delayed_ai_response', lambda *args, **kwargs: None)
+    monkeypatch.setattr(app_module, 'generate_evidence_for_story', lambda *args, **kwargs: None)
+    monkeypatch.setattr(app_module, 'maybe_add_fake_comment', lambda *args, **kwargs: None)
+
+    user_id = create_user('stats_user')
+    headers = {'Authorization': 'Bearer ' + generate_token(user_id)}
+    story_id = create_story('统计测试', category='subway_ghost')
+
+    with app.test_client() as client:
+        empty = client.get('/api/user-top-categories', headers=headers).get_json()
+        assert empty == {'categories': [], 'stats': {'total_clicks': 0, 'total_comments': 0}}
+
+        for i in range(3):
+            client.post(f'/api/stories/{story_id}/comments', json={'content': f'评论 {i}'}, headers=headers)
+        for category in ['subway_ghost'] * 4 + ['campus_mystery'] * 2 + ['cursed_object']:
+            client.post('/api/track-category-click', json={'category': category}, headers=headers)
+        category_click_buffer.flush()
+
+        statements = []
+        with app.app_context():
+            engine = db.engine
+        record = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            data = client.get('/api/user-top-categories', headers=headers).get_json()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+
+    assert data['stats'] == {'total_clicks': 7, 'total_comments': 3}
+    assert [c['category'] for c in data['categories']] == ['subway_ghost', 'campus_mystery']
+    assert len(statements) == 1 and 'user_stats' in statements[0]
+
+
+def test_recount_matches_incremental_stats(create_user):
+    user_id = create_user('stats_recount')
+    headers = {'Authorization': 'Bearer ' + generate_token(user_id)}
+    with app.test_client() as client:
+        client.post('/api/track-category-click', json={'category': 'urban'}, headers=headers)
+        category_click_buffer.flush()
+        before = client.get('/api/user-top-categories', headers=headers).get_json()
+
+        with app.app_context():
+            recount_user_stats([user_id])
+            db.session.commit()
+        after = client.get('/api/user-top-categories', headers=headers).get_json()
+
+    assert before == after
+    assert after['stats'] == {'total_clicks': 1, 'total_comments': 0}
+
+
+def test_full_recount_is_set_based_and_chunked(monkeypatch, create_user, create_story):
+    from app import Comment, UserStats
+
+    monkeypatch.setattr(app_module, 'USER_STATS_CHUNK_SIZE', 2)
+    user_ids = [create_user(f'stats_full_{i}') for i in range(5)]
+    story_id = create_story('全量重算测试')
+    statements = []
+    with app.app_context():
+        db.session.add_all([Comment(content=f'评论 {n}', story_id=story_id, author_id=user_id)
+                            for n, user_id in enumerate(user_ids) for _ in range(n)])
+        # 先把统计改乱，确认重算按实际数据覆盖
+        db.session.execute(db.update(UserStats).values(total_comments=99))
+        db.session.commit()
+
+        record = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            recount_user_stats()
+            db.session.commit()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        counts = dict(db.session.execute(
+            db.select(UserStats.user_id, UserStats.total_comments).where(UserStats.user_id.in_(user_ids))
+        ).all())
+        assert counts == {user_id: n for n, user_id in enumerate(user_ids)}
+
+        # 指定用户时分批，结果相同
+        recount_user_stats(user_ids)
+        db.session.commit()
+        assert db.session.get(UserStats, user_ids[4]).total_comments == 4
+
+    updates = [s for s in statements if s.lstrip().upper().startswith('UPDATE USER_STATS')]
+    assert len(updates) == 1 and 'CASE' not in updates[0].upper()
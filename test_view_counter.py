@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""测试浏览量写后缓冲：并发读取时计数不丢失，响应中显示缓冲后的数值"""
+
+import threading
+
+from app import app, db, Story, story_view_buffer
+from write_behind import CounterBuffer
+
+
+def persisted_views(story_id):
+    with app.app_context():
+        return db.session.get(Story, story_id).views or 0
+
+
+def test_response_shows_buffered_views(create_story):
+    story_id = create_story('浏览量显示测试')
+    story_view_buffer.flush()
+
+    with app.test_client() as client:
+        first = client.get(f'/api/stories/{story_id}').get_json()['views']
+        second = client.get(f'/api/stories/{story_id}').get_json()['views']
+
+    assert second == first + 1
+    # 读接口本身不写库
+    assert persisted_views(story_id) == 0
+
+    story_view_buffer.flush()
+    assert persisted_views(story_id) == second
+
+
+def test_concurrent_readers_lose_no_views(create_story):
+    story_id = create_story('并发浏览量测试')
+    readers, reads_per_reader = 8, 40
+    errors = []
+    done = threading.Event()
+
+    def reader():
+        try:
+            with app.test_client() as client:
+                for _ in range(reads_per_reader):
+                    assert client.get(f'/api/stories/{story_id}').status_code == 200
+        except Exception as e:  # 断言失败也要让主线程看到
+            errors.append(e)
+
+    def flusher():
+        # 与读请求并发地反复写回，模拟后台定时 flush
+        while not done.is_set():
+            story_view_buffer.flush()
+
+    flush_thread = threading.Thread(target=flusher)
+    flush_thread.start()
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    done.set()
+    flush_thread.join()
+    story_view_buffer.flush()
+
+    assert not errors
+    assert persisted_views(story_id) == readers * reads_per_reader
+    assert story_view_buffer.pending(story_id) == 0
+
+
+def test_committed_deltas_are_not_counted_twice():
+    stored = {'views': 0}
+    seen = []
+    buffer = CounterBuffer(lambda deltas, commit: (
+        commit(lambda: stored.update(views=stored['views'] + deltas['story'])),
+        # 提交之后、flush 返回之前读取：已落库的部分不能再算进 pending
+        seen.append(stored['views'] + buffer.pending('story')),
+    ), interval=60, name='test_views')
+    for _ in range(3):
+        buffer.add('story')
+    buffer.flush()
+    buffer.stop()
+    assert stored['views'] == 3
+    assert seen == [3]
+
+
+def test_commit_does_not_block_readers():
+    committing = threading.Event()
+    release = threading.Event()
+
+    def slow_commit():
+        committing.set()
+        release.wait(5)
+
+    buffer = CounterBuffer(lambda deltas, commit: commit(slow_commit), interval=60, name='test_slow_commit')
+    buffer.add('story')
+    flusher = threading.Thread(target=buffer.flush)
+    flusher.start()
+    try:
+        assert committing.wait(5)
+        # 提交进行中：add/pending 不等待提交完成，in-flight 增量仍然计入
+        assert buffer.add('story') == 2
+        assert buffer.pending('story') == 2
+    finally:
+        release.set()
+        flusher.join(5)
+    assert buffer.pending('story') == 1
+    buffer.stop()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""测试内置繁简转换：词组最长匹配、单字替换、简体原样保留；故事后处理不再调用模型"""
+
+import ai_engine
+import llm_client
+import zh_convert
+
+
+def test_phrases_take_precedence_over_characters():
+    assert zh_convert.to_simplified('我們在電腦裡發現了一根頭髮') == '我们在电脑里发现了一根头发'
+    # 单字表把「乾」换成「干」，词组表保留「乾坤」
+    assert zh_convert.to_simplified('乾淨的袖裏乾坤') == '干净的袖里乾坤'
+    assert zh_convert.to_simplified('一目瞭然，瞭解') == '一目了然，了解'
+    # 最长匹配：「藉助於」优先于「藉助」
+    assert zh_convert.to_simplified('藉助於鐘錶') == '借助于钟表'
+
+
+def test_simplified_and_non_chinese_text_unchanged():
+    text = '这是简体中文 with ASCII 123，没有变化。'
+    assert zh_convert.to_simplified(text) == text
+    assert zh_convert.to_simplified('') == ''
+    assert zh_convert.to_simplified(None) is None
+
+
+def test_post_process_does_not_call_model(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('不应调用模型')
+
+    monkeypatch.setattr(llm_client, 'chat', fail)
+    monkeypatch.setenv('LM_STUDIO_URL', 'http://127.0.0.1:9/v1')
+    assert ai_engine.convert_to_simplified('樓下的電梯') == '楼下的电梯'
+    assert '电梯' in ai_engine.post_process_story_text('我發現樓下的電梯每天晚上都會停在四樓。')
+
+
+def test_long_text_converts_in_full():
+    # 吞吐量见 bench_zh_convert.py；这里只检查长文本逐段替换后的结果
+    text = '我們公司樓下那個舊電梯，每天晚上總會自己停在四樓，我藉口加班留下來。' * 5000
+    expected = '我们公司楼下那个旧电梯，每天晚上总会自己停在四楼，我借口加班留下来。' * 5000
+    assert zh_convert.to_simplified(text) == expected
@@ -0,0 +1,455 @@
+"""
+翻译缓存
+
+/api/translate 翻译的大多是同一批故事正文，每次都调用模型（约 800 token）既慢又占用模型并发。
+译文按 (原文 sha256, 目标语言, 模型) 缓存两层：
+- 进程内 LRU（ResponseCache）：重复翻译直接从内存返回，过期后从数据库读回
+- SQLite 表 translation_cache：进程重启后仍然有效；总字节数超过 TRANSLATION_CACHE_MAX_BYTES 时
+  按 last_used_at 淘汰最久未使用的条目，一次删到 TRANSLATION_CACHE_EVICT_TO_RATIO 倍上限以下，
+  不会每写入一条就淘汰一次；总字节数在进程内累计（启动后首次用到时、每次淘汰时与数据库对齐），
+  写入时不扫描全表。被淘汰的键只从内存层单独移除，其余热门条目不受影响
+读路径不写库：两层的命中都只记进写后缓冲 touches（write_behind.CounterBuffer），
+每 TRANSLATION_CACHE_TOUCH_FLUSH_SECONDS 秒批量回写 hits 和 last_used_at，淘汰前也会先写回一次。
+
+模型 id 来自 ai_engine.translation_models()。LM Studio 翻译请求显式带上 LM_STUDIO_MODEL（未设置时不用 LM Studio
+翻译），缓存键里的模型就是实际生成译文的模型，修改 LM_STUDIO_MODEL 后旧译文不会被误用。
+定时任务调用 warmup_recent_stories() 预先翻译最新故事的标题和正文，读者第一次点「翻译」就能命中。
+
+translate_many() 供 /api/translate/batch 使用：一个故事连同几十条评论，先去重、一次查完缓存，
+未命中的按 TRANSLATION_BATCH_MAX_CHARS / TRANSLATION_BATCH_MAX_ITEMS 打包，每包一次模型调用
+（ai_engine.translate_batch_with_model）；译文拆不回原来的段数时对半拆包重试，单段时退回逐条翻译。
+每包字数上限由模型上下文窗口（ai_engine.TRANSLATION_CONTEXT_TOKENS）推出，TRANSLATION_BATCH_MAX_CHARS
+只能调小；超过上限的单条原文按段落、句子切成若干片段分别翻译（和缓存）后再拼接。
+"""
+import hashlib
+import os
+import re
+import threading
+from datetime import datetime
+
+from response_cache import ResponseCache
+from write_behind import CounterBuffer
+
+MEMORY_ENTRIES = int(os.getenv('TRANSLATION_CACHE_MEMORY_ENTRIES', 1000))
+MEMORY_TTL_SECONDS = float(os.getenv('TRANSLATION_CACHE_MEMORY_TTL_SECONDS', 24 * 3600))
+MAX_BYTES = int(os.getenv('TRANSLATION_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+EVICT_TO_RATIO = float(os.getenv('TRANSLATION_CACHE_EVICT_TO_RATIO', 0.9))
+TOUCH_FLUSH_SECONDS = float(os.getenv('TRANSLATION_CACHE_TOUCH_FLUSH_SECONDS', 30))
+WARMUP_STORIES = int(os.getenv('TRANSLATION_WARMUP_STORIES', 20))
+# 0 表示直接用上下文窗口推出的上限（ai_engine.translation_max_chars()）
+BATCH_MAX_CHARS = int(os.getenv('TRANSLATION_BATCH_MAX_CHARS', 0))
+BATCH_MAX_ITEMS = int(os.getenv('TRANSLATION_BATCH_MAX_ITEMS', 20))
+# 每段 <<<编号>>> 标记行及换行占用的字数
+BATCH_MARKER_CHARS = 10
+WARMUP_TARGETS = [t.strip() for t in os.getenv('TRANSLATION_WARMUP_TARGETS', 'en').split(',') if t.strip()]
+
+memory = ResponseCache(maxsize=MEMORY_ENTRIES, ttl=MEMORY_TTL_SECONDS, name='translation')
+
+_counters = {'db_hits': 0, 'model_calls': 0, 'batch_calls': 0, 'batch_split_failures': 0, 'model_failures': 0, 'stored': 0, 'evicted': 0}
+_counters_lock = threading.Lock()
+
+# translation_cache 表的 size_bytes 之和；None 表示尚未从数据库读取
+_total_bytes = None
+_total_lock = threading.Lock()
+
+
+def _count(name, n=1):
+    with _counters_lock:
+        _counters[name] += n
+
+
+def is_supported_target(target):
+    """目标语言是否在 ai_engine.TRANSLATION_TARGETS 中；接口在查缓存之前先校验，不为任意字符串建缓存行"""
+    from ai_engine import TRANSLATION_TARGETS
+
+    return isinstance(target, str) and target in TRANSLATION_TARGETS
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def batch_max_chars():
+    """每包原文字数上限（含编号标记）：上下文窗口推出的上限，TRANSLATION_BATCH_MAX_CHARS 只能把它调小"""
+    from ai_engine import translation_max_chars
+
+    limit = translation_max_chars()
+    return min(BATCH_MAX_CHARS, limit) if BATCH_MAX_CHARS > 0 else limit
+
+
+# 在段落、句子结束处切分（切点留在前一片段末尾）
+_SENTENCE_END_RE = re.compile(r'(?<=[\n。！？!?；;])')
+
+
+def split_long_text(text, max_chars):
+    """把超过 max_chars 的原文按段落、句子切成不超过 max_chars 的片段；单句仍超长时按长度硬切"""
+    if len(text) <= max_chars:
+        return [text]
+    pieces, current = [], ''
+    for sentence in _SENTENCE_END_RE.split(text):
+        if current and len(current) + len(sentence) > max_chars:
+            pieces.append(current)
+            current = ''
+        while len(sentence) > max_chars:
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        current += sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def join_translations(pieces, translations):
+    """拼接各片段的译文：原片段以换行结束的保留换行，否则用空格连接"""
+    parts = []
+    for i, (piece, translated) in enumerate(zip(pieces, translations)):
+        if i:
+            parts.append('\n' if pieces[i - 1].endswith('\n') else ' ')
+        parts.append(translated.strip())
+    return ''.join(parts)
+
+
+def flush_touches(deltas, commit):
+    """把缓冲的 {(hash, target, model): 命中次数} 写回：hits 累加，last_used_at 记为写回时间"""
+    from app import app, db, TranslationCache
+
+    table = TranslationCache.__table__
+    stmt = table.update().where(
+        table.c.text_hash == db.bindparam('b_hash'),
+        table.c.target == db.bindparam('b_target'),
+        table.c.model == db.bindparam('b_model'),
+    ).values(hits=db.func.coalesce(table.c.hits, 0) + db.bindparam('b_hits'), last_used_at=db.bindparam('b_now'))
+    now = datetime.utcnow()
+    rows = [{'b_hash': digest, 'b_target': target, 'b_model': model, 'b_hits': hits, 'b_now': now}
+            for (digest, target, model), hits in deltas.items()]
+    with app.app_context():
+        db.session.execute(stmt, rows)
+        commit(db.session.commit)
+
+
+touches = CounterBuffer(flush_touches, interval=TOUCH_FLUSH_SECONDS, name='translation_touches')
+
+
+def lookup(text, target, models=None):
+    """依次按各模型查内存和数据库，返回 (译文, 'memory' | 'db')；未命中返回 (None, None)"""
+    from app import db, TranslationCache
+    from ai_engine import translation_models
+
+    digest = text_hash(text)
+    models = translation_models() if models is None else models
+    for model in models:
+        translated = memory.get((digest, target, model))
+        if translated is not None:
+            touches.add((digest, target, model))
+            return translated, 'memory'
+
+    for model in models:
+        translated = db.session.execute(db.select(TranslationCache.translated).where(
+            TranslationCache.text_hash == digest, TranslationCache.target == target, TranslationCache.model == model
+        )).scalar()
+        if translated is None:
+            continue
+        memory.set((digest, target, model), translated)
+        touches.add((digest, target, model))
+        _count('db_hits')
+        return translated, 'db'
+    return None, None
+
+
+def _table_bytes():
+    from app import db, TranslationCache
+
+    return db.session.query(db.func.coalesce(db.func.sum(TranslationCache.size_bytes), 0)).scalar()
+
+
+def total_bytes():
+    """表内译文总字节数（进程内累计，首次调用时从数据库读取）"""
+    global _total_bytes
+    with _total_lock:
+        if _total_bytes is None:
+            _total_bytes = _table_bytes()
+        return _total_bytes
+
+
+def _add_bytes(delta):
+    global _total_bytes
+    with _total_lock:
+        if _total_bytes is not None:
+            _total_bytes += delta
+
+
+def store(text, target, model, translated):
+    """写入两层缓存（同键覆盖），超过总字节上限时淘汰"""
+    store_many(target, model, [(text, translated)])
+
+
+def store_many(target, model, pairs):
+    """把同一目标语言、同一模型的多条 (原文, 译文) 用一条多行 INSERT ... ON CONFLICT 写入，
+    一次提交、一次淘汰检查"""
+    from app import db, TranslationCache, sqlite_insert
+
+    now = datetime.utcnow()
+    rows = {}
+    for text, translated in pairs:
+        digest = text_hash(text)
+        rows[digest] = {
+            'text_hash': digest, 'target': target, 'model': model, 'translated': translated,
+            'size_bytes': len(text.encode('utf-8')) + len(translated.encode('utf-8')),
+            'hits': 0, 'created_at': now, 'last_used_at': now,
+        }
+    if not rows:
+        return
+    previous = dict(db.session.execute(db.select(TranslationCache.text_hash, TranslationCache.size_bytes).where(
+        TranslationCache.text_hash.in_(list(rows)), TranslationCache.target == target,
+        TranslationCache.model == model
+    )).all())
+    insert = sqlite_insert(TranslationCache).values(list(rows.values()))
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=['text_hash', 'target', 'model'],
+        set_={name: insert.excluded[name] for name in ('translated', 'size_bytes', 'last_used_at')}
+    ))
+    db.session.commit()
+    _add_bytes(sum(row['size_bytes'] - (previous.get(digest) or 0) for digest, row in rows.items()))
+    for digest, row in rows.items():
+        memory.set((digest, target, model), row['translated'])
+    _count('stored', len(rows))
+    if total_bytes() > MAX_BYTES:
+        evict()
+
+
+def evict(max_bytes=None):
+    """总字节数超过 max_bytes 时，按 last_used_at 从旧到新删除条目，直到不超过 max_bytes * EVICT_TO_RATIO
+
+    一条 DELETE 完成（窗口函数累计字节数选出要删的行），返回删除条数。
+    """
+    global _total_bytes
+    from app import db, TranslationCache
+
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    # 先写回缓冲的命中，淘汰顺序才反映最近的使用
+    touches.flush()
+    # 淘汰很少发生，这里顺便与数据库对齐（其他进程的写入也会计入）
+    total = _table_bytes()
+    if total <= max_bytes:
+        with _total_lock:
+            _total_bytes = total
+        return 0
+
+    table = TranslationCache.__table__
+    key = (table.c.text_hash, table.c.target, table.c.model)
+    ranked = db.select(*key, table.c.size_bytes, db.func.sum(table.c.size_bytes).over(
+        order_by=(table.c.last_used_at, *key)
+    ).label('running')).subquery()
+    excess = total - int(max_bytes * EVICT_TO_RATIO)
+    doomed = db.select(ranked.c.text_hash, ranked.c.target, ranked.c.model)\
+        .where(ranked.c.running - ranked.c.size_bytes < excess)
+    deleted = db.session.execute(
+        table.delete().where(db.tuple_(*key).in_(doomed)).returning(*key, table.c.size_bytes)
+    ).all()
+    db.session.commit()
+
+    with _total_lock:
+        _total_bytes = total - sum(row.size_bytes or 0 for row in deleted)
+    memory.discard([(row.text_hash, row.target, row.model) for row in deleted])
+    _count('evicted', len(deleted))
+    return len(deleted)
+
+
+def translate(text, target='en'):
+    """返回 (译文, 来源)；来源为 'memory' / 'db' / 'model'
+
+    模型调用失败时返回 (None, 'failed')；没有配置任何翻译服务时返回 (None, None)，不调用模型。
+    超过上下文窗口的原文切成片段逐段翻译后拼接，来源取各片段中最慢的一层。
+    """
+    from ai_engine import translate_text_with_model, translation_max_chars, translation_models
+
+    pieces = split_long_text(text, translation_max_chars())
+    if len(pieces) > 1:
+        return _translate_pieces(pieces, target)
+
+    models = translation_models()
+    translated, source = lookup(text, target, models)
+    if translated is not None:
+        return translated, source
+    if not models:
+        return None, None
+
+    _count('model_calls')
+    translated, model = translate_text_with_model(text, target=target)
+    if translated is None:
+        _count('model_failures')
+        return None, 'failed'
+    store(text, target, model, translated)
+    return translated, 'model'
+
+
+def _translate_pieces(pieces, target):
+    """逐段翻译超长原文的片段；任一片段失败时整体失败"""
+    translations, sources = [], set()
+    for piece in pieces:
+        translated, source = translate(piece, target)
+        if translated is None:
+            return None, source
+        translations.append(translated)
+        sources.add(source)
+    source = next(name for name in ('model', 'db', 'memory') if name in sources)
+    return join_translations(pieces, translations), source
+
+
+def lookup_many(texts, target, models=None):
+    """批量版 lookup：先查内存，其余一次查数据库（按模型优先级取），返回 {原文: 译文}"""
+    from app import db, TranslationCache
+    from ai_engine import translation_models
+
+    models = translation_models() if models is None else models
+    found = {}
+    missing = {}
+    for text in texts:
+        digest = text_hash(text)
+        for model in models:
+            translated = memory.get((digest, target, model))
+            if translated is not None:
+                found[text] = translated
+                touches.add((digest, target, model))
+                break
+        else:
+            missing[digest] = text
+    if not missing or not models:
+        return found
+
+    entries = db.session.execute(db.select(
+        TranslationCache.text_hash, TranslationCache.model, TranslationCache.translated
+    ).where(
+        TranslationCache.text_hash.in_(list(missing)),
+        TranslationCache.target == target,
+        TranslationCache.model.in_(models),
+    )).all()
+    rank = {model: i for i, model in enumerate(models)}
+    best = {}
+    for entry in entries:
+        if entry.text_hash not in best or rank[entry.model] < rank[best[entry.text_hash].model]:
+            best[entry.text_hash] = entry
+    for digest, entry in best.items():
+        found[missing[digest]] = entry.translated
+        memory.set((digest, target, entry.model), entry.translated)
+        touches.add((digest, target, entry.model))
+    _count('db_hits', len(best))
+    return found
+
+
+def _pack(texts, max_chars, max_items):
+    """按原顺序贪心打包：每包总字数（含编号标记）不超过 max_chars、条数不超过 max_items（超长的单条独占一包）"""
+    batches = []
+    batch, size = [], 0
+    for text in texts:
+        length = len(text) + BATCH_MARKER_CHARS
+        if batch and (size + length > max_chars or len(batch) >= max_items):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(text)
+        size += length
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _translate_batch(texts, target, results):
+    """翻译一包未命中的原文并写入缓存；返回模型调用次数。拆分失败时对半重试，翻译服务不可用时该包结果为 None"""
+    from ai_engine import translate_batch_with_model
+
+    if len(texts) == 1:
+        translated, source = translate(texts[0], target)
+        results[texts[0]] = translated
+        return 1 if source in ('model', 'failed') else 0
+
+    _count('model_calls')
+    _count('batch_calls')
+    translations, model = translate_batch_with_model(texts, target=target)
+    if model is None:
+        _count('model_failures')
+        return 1
+    if translations is None:
+        _count('batch_split_failures')
+        half = len(texts) // 2
+        return 1 + _translate_batch(texts[:half], target, results) + _translate_batch(texts[half:], target, results)
+    store_many(target, model, zip(texts, translations))
+    results.update(zip(texts, translations))
+    return 1
+
+
+def translate_many(texts, target='en', max_chars=None, max_items=None):
+    """批量翻译，返回 (译文列表, 是否来自缓存列表, 模型调用次数)，顺序与 texts 一致
+
+    空字符串原样返回；没有可用翻译服务时对应位置为 None。
+    超过上下文窗口的原文先切成片段，片段作为独立条目查缓存、打包，最后按原文拼回；
+    全部片段都来自缓存时该条才算来自缓存。
+    """
+    from ai_engine import translation_max_chars, translation_models
+
+    models = translation_models()
+    max_piece = translation_max_chars()
+    pieces = {text: split_long_text(text, max_piece) for text in dict.fromkeys(text for text in texts if text)}
+    unique = list(dict.fromkeys(piece for split in pieces.values() for piece in split))
+    cached = lookup_many(unique, target, models)
+    results = dict(cached)
+    calls = 0
+    # 没有配置翻译服务时不打包、不计调用
+    batches = _pack([text for text in unique if text not in cached],
+                    batch_max_chars() if max_chars is None else max_chars,
+                    BATCH_MAX_ITEMS if max_items is None else max_items) if models else []
+    for batch in batches:
+        calls += _translate_batch(batch, target, results)
+
+    joined = {}
+    for text, split in pieces.items():
+        translations = [results.get(piece) for piece in split]
+        joined[text] = None if None in translations else join_translations(split, translations)
+    translated = [joined[text] if text else '' for text in texts]
+    from_cache = [bool(text) and all(piece in cached for piece in pieces[text]) for text in texts]
+    return translated, from_cache, calls
+
+
+def warmup_recent_stories(limit=WARMUP_STORIES, targets=WARMUP_TARGETS):
+    """预先翻译最新 limit 个故事的标题和正文（需在 app_context 中调用），返回新翻译的条数
+
+    翻译服务不可用（或模型排队已满）时立即停止，留给下一轮。
+    """
+    from app import db, Story
+    from ai_engine import translation_models
+
+    models = translation_models()
+    targets = [target for target in targets if is_supported_target(target)]
+    if not models or limit <= 0:
+        return 0
+    rows = db.session.execute(
+        db.select(Story.title, Story.content).order_by(Story.id.desc()).limit(limit)
+    ).all()
+    translated = 0
+    for title, content in rows:
+        for text in (title, content):
+            for target in targets:
+                if not text or lookup(text, target, models)[0] is not None:
+                    continue
+                if translate(text, target)[0] is None:
+                    return translated
+                translated += 1
+    return translated
+
+
+def stats():
+    from app import db, TranslationCache
+
+    rows, size = db.session.query(
+        db.func.count(), db.func.coalesce(db.func.sum(TranslationCache.size_bytes), 0)
+    ).select_from(TranslationCache).one()
+    with _counters_lock:
+        counters = dict(_counters)
+    return {
+        'memory': memory.stats(),
+        'db_rows': rows,
+        'db_bytes': size,
+        'tracked_bytes': _total_bytes,
+        'max_bytes': MAX_BYTES,
+        'batch_max_chars': batch_max_chars(),
+        **counters,
+    }
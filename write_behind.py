@@ -0,0 +1,103 @@
+"""
+写后缓冲（write-behind）计数器
+
+热点读接口里的计数（如浏览量）先在内存中按 key 累加，由后台线程按固定间隔
+批量写回数据库，避免每个读请求都变成一次 SQLite 写事务。进程退出时会再写回一次。
+"""
+import atexit
+import threading
+from collections import Counter
+
+
+class CounterBuffer:
+    """按 key 聚合增量的内存缓冲区
+
+    flush_fn(deltas, commit) 接收 {key: delta}，负责在一个事务里写回，并通过 commit(db.session.commit)
+    提交：提交时不持有缓冲区的锁（add/pending 不会等待 SQLite 的 fsync 和 checkpoint），提交完成后
+    立刻在短暂持锁内清空 in-flight 增量；只有提交返回到清空之间的极短窗口里，读取方可能把刚落库的
+    增量多算一次。写回失败时增量会放回缓冲区，下次重试，不会丢失计数。max_pending 限制缓冲的 key 数，超过后立即唤醒后台线程
+    提前写回（不阻塞调用方），None 表示不限制。
+    """
+
+    def __init__(self, flush_fn, interval=5.0, name='counter', max_pending=None):
+        self._flush_fn = flush_fn
+        self._interval = interval
+        self._name = name
+        self._max_pending = max_pending
+        self._pending = Counter()
+        self._inflight = Counter()  # 正在写回、尚未提交的增量，读取时仍需计入
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, key, delta=1):
+        """累加增量，返回该 key 尚未落库的增量（含正在写回的部分）"""
+        self._ensure_started()
+        with self._lock:
+            self._pending[key] += delta
+            if self._max_pending is not None and len(self._pending) >= self._max_pending:
+                self._wake.set()
+            return self._pending[key] + self._inflight[key]
+
+    def pending(self, key):
+        """该 key 尚未落库的增量"""
+        with self._lock:
+            return self._pending.get(key, 0) + self._inflight.get(key, 0)
+
+    def flush(self):
+        """把当前缓冲的增量写回，返回写回的总增量"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._pending = Counter()
+                self._inflight = batch
+
+            try:
+                self._flush_fn(dict(batch), self._commit)
+            except Exception as e:
+                print(f"[{self._name}] 写回失败，{sum(batch.values())} 个增量将在下次重试: {e}")
+                with self._lock:
+                    self._pending.update(batch)
+                    self._inflight = Counter()
+                return 0
+
+            with self._lock:
+                # flush_fn 没有调用 commit 时在这里清空
+                self._inflight = Counter()
+            return sum(batch.values())
+
+    def _commit(self, commit_fn):
+        """不持锁提交，提交成功后再持锁清空 in-flight 增量"""
+        commit_fn()
+        with self._lock:
+            self._inflight = Counter()
+
+    def stop(self):
+        """停止后台线程并做最后一次写回（进程退出时自动调用）"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=self._interval + 1)
+        self.flush()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=f'{self._name}-flush', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            self.flush()
@@ -0,0 +1,129 @@
+"""
+繁体 → 简体转换（内置，不依赖 OpenCC，也不调用模型）
+
+post_process_story_text 对每个生成的故事和标题都要做一次繁简转换。没装 OpenCC 时，原来的做法是
+调用一次 LM Studio（最多 1200 token，单次可达 30 秒以上）。现在改用随项目发布的预编译对照表
+zh_t2s_table.py（由 OpenCC 的 TSCharacters / TSPhrases 词典生成），转换是纯字符串操作：
+- 词组：所有词组按首字组织成一个前缀树形式的正则，正则交替按先后匹配，长词组排在前面，
+  在每个位置取最长匹配
+- 其余文本：str.translate 按单字对照表一次替换
+整段文本只扫描一遍，词组之间的片段逐段做单字替换。
+
+重新生成对照表（dictionary 目录取自 OpenCC 或 opencc-python-reimplemented）：
+    python zh_convert.py --build path/to/opencc/dictionary
+"""
+import argparse
+import os
+import re
+
+from zh_t2s_table import CHARACTERS, PHRASES
+
+_char_table = str.maketrans(CHARACTERS)
+
+
+def _trie_pattern(words):
+    """把词组列表编译成前缀树形式的正则：同一前缀只比较一次，分支内长的在前"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def render(node):
+        branches = []
+        # 先尝试更长的分支；'' 表示到此为止也是一个完整词组，放在最后
+        for char in sorted((c for c in node if c), key=lambda c: -_depth(node[c])):
+            branches.append(re.escape(char) + render(node[char]))
+        if not branches:
+            return ''
+        if '' in node:
+            return '(?:' + '|'.join(branches) + ')?'
+        if len(branches) == 1:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + ')'
+
+    return render(trie)
+
+
+def _depth(node):
+    return max((_depth(child) + 1 for key, child in node.items() if key), default=0)
+
+
+_phrases = {word: simplified for word, simplified in PHRASES.items() if len(word) > 1}
+_phrase_re = re.compile(_trie_pattern(_phrases)) if _phrases else None
+
+
+def to_simplified(text):
+    """繁体 → 简体；词组优先（最长匹配），其余按单字替换"""
+    if not text:
+        return text
+    if _phrase_re is None:
+        return text.translate(_char_table)
+    parts = []
+    pos = 0
+    for match in _phrase_re.finditer(text):
+        start, end = match.span()
+        if start > pos:
+            parts.append(text[pos:start].translate(_char_table))
+        parts.append(_phrases[match.group()])
+        pos = end
+    if pos == 0:
+        return text.translate(_char_table)
+    parts.append(text[pos:].translate(_char_table))
+    return ''.join(parts)
+
+
+def _read_dictionary(path, keep_identity=False):
+    """OpenCC 词典格式：原文\\t候选1 候选2 ...，取第一个候选
+
+    keep_identity 保留原文与译文相同的条目：词组表里的「乾坤」→「乾坤」用来阻止单字表把「乾」换成「干」。
+    """
+    mapping = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line or line.startswith('#') or '\t' not in line:
+                continue
+            source, targets = line.split('\t', 1)
+            target = targets.split(' ')[0]
+            if source and target and (keep_identity or source != target):
+                mapping[source] = target
+    return mapping
+
+
+def build_table(dictionary_dir, output=None):
+    """由 OpenCC 词典生成 zh_t2s_table.py，返回 (单字数, 词组数)"""
+    characters = _read_dictionary(os.path.join(dictionary_dir, 'TSCharacters.txt'))
+    phrases = _read_dictionary(os.path.join(dictionary_dir, 'TSPhrases.txt'), keep_identity=True)
+    output = output or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'zh_t2s_table.py')
+
+    def literal(mapping):
+        lines = [f'    {source!r}: {target!r},' for source, target in sorted(mapping.items())]
+        return '{\n' + '\n'.join(lines) + '\n}'
+
+    with open(output, 'w', encoding='utf-8') as f:
+        f.write('"""\n繁体 → 简体对照表（由 zh_convert.py --build 生成，请勿手工编辑）\n\n'
+                '数据来自 OpenCC 的 TSCharacters.txt / TSPhrases.txt（Apache License 2.0），\n'
+                '每个条目只保留第一个候选。\n"""\n\n')
+        f.write(f'CHARACTERS = {literal(characters)}\n\n')
+        f.write(f'PHRASES = {literal(phrases)}\n')
+    return len(characters), len(phrases)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='繁体 → 简体转换')
+    parser.add_argument('--build', metavar='DICTIONARY_DIR', help='由 OpenCC 词典目录重新生成 zh_t2s_table.py')
+    parser.add_argument('text', nargs='*', help='要转换的文本')
+    args = parser.parse_args(argv)
+
+    if args.build:
+        characters, phrases = build_table(args.build)
+        print(f"✅ zh_t2s_table.py: {characters} 个单字，{phrases} 个词组")
+        return
+    for text in args.text:
+        print(to_simplified(text))
+
+
+if __name__ == '__main__':
+    main()